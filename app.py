@@ -1,5 +1,19 @@
 from db_handler import DBHandler
-from flask import Flask, jsonify, request, send_from_directory, g, url_for
+from click_counter import click_counter
+from category_cache import category_cache
+from response_cache import response_cache
+from log_writer import log_writer
+from upload_store import (UPLOAD_FOLDER, StreamingUploadRequest, resolve_file_type, ensure_folders,
+                          store_uploaded_file, save_uploads, discard_records, link_existing_blob,
+                          delete_file, resumable_uploads)
+from static_files import static_files
+from image_renditions import rendition_queue
+from auth import token_required, permission_required, issue_access_token
+from refresh_tokens import generate_refresh_token, REFRESH_TOKENS_PER_USER
+from passwords import HasherBusy
+from rate_limit import login_limiter
+from bulk_io import to_ndjson, to_csv_lines, chunked
+from flask import Flask, jsonify, request, send_from_directory, g, url_for, Response
 from flask_cors import CORS
 from datetime import datetime, timedelta, timezone
 import os
@@ -12,17 +26,22 @@ import re
 import binascii
 from functools import wraps
 import json
+import itertools
 import jwt
 from dotenv import load_dotenv
 
 
 app = Flask(__name__)
+# multipart 上傳的檔案直接串流寫入 uploads/<file_type>/ (見 upload_store.py)
+app.request_class = StreamingUploadRequest
 CORS(app)
 load_dotenv()
 
 app.config['APPLICATION_ROOT'] = 'sh-department-api'
 app.config['DOCUMENT_FOLDER'] = './static/'
 app.config['JSON_AS_ASCII'] = False
+# FILE_SERVE_MODE=x-sendfile 時，send_file 只送出 X-Sendfile 標頭，由前端伺服器讀檔
+app.config['USE_X_SENDFILE'] = static_files.mode == 'x-sendfile'
 
 # --- 【關鍵】JWT 設定 ---
 # 這個密鑰在正式環境中，絕對不能寫死在程式碼裡，應該從環境變數讀取
@@ -31,13 +50,10 @@ app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(minutes=15)
 app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=7)
 
 # --- File Upload Configuration ---
-UPLOAD_FOLDER = './uploads/'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'zip'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-# 建立上傳資料夾 (如果不存在)
-os.makedirs(os.path.join(UPLOAD_FOLDER, 'images'), exist_ok=True)
-os.makedirs(os.path.join(UPLOAD_FOLDER, 'attachments'), exist_ok=True)
-os.makedirs(os.path.join(UPLOAD_FOLDER, 'files'), exist_ok=True)
+# 建立上傳資料夾 (如果不存在)，含可續傳上傳用的 .partial 子資料夾
+ensure_folders()
 
 # def allowed_file(filename):
 #     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -127,43 +143,6 @@ os.makedirs(os.path.join(UPLOAD_FOLDER, 'files'), exist_ok=True)
 #     return decorated
 
 
-def token_required(required_permissions=None):
-    if required_permissions is None:
-        required_permissions = []
-    elif isinstance(required_permissions, str):
-        required_permissions = [required_permissions]
-
-    def decorator(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
-            token = None
-            if 'Authorization' in request.headers:
-                auth_header = request.headers['Authorization']
-                try:
-                    token = auth_header.split(" ")[1]
-                except IndexError:
-                    return jsonify({'status': 401, 'message': '無效的 Token 格式 (應為 Bearer <token>)', 'success': False}), 401
-            
-            if not token:
-                return jsonify({'status': 401, 'message': '未提供 Token', 'success': False}), 401
-
-            try:
-                payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-                g.user = {'id': payload['sub'], 'permission': payload['permission']}
-
-                # 【新】在這裡直接進行權限等級檢查
-                if required_permissions and g.user['permission'] not in required_permissions:
-                    return jsonify({'status': 403, 'message': f"權限不足，此操作需要 {required_permissions} 等級。", 'success': False}), 403
-
-            except jwt.ExpiredSignatureError:
-                return jsonify({'status': 401, 'message': 'Token 已過期', 'success': False}), 401
-            except jwt.InvalidTokenError:
-                return jsonify({'status': 401, 'message': '無效的 Token', 'success': False}), 401
-            
-            return f(*args, **kwargs)
-        return decorated_function
-    return decorator
-
 @app.route('/api/test')
 def index():
     return jsonify({
@@ -175,27 +154,28 @@ def index():
 
 # --- 【新功能】Login Route ---
 @app.route('/api/login', methods=['POST'])
+@login_limiter.limit()    # 每個 IP / 帳號的 token bucket，超過時在查詢資料庫前回傳 429
 def login_route():
     data = request.get_json()
     if not data or not data.get('account') or not data.get('password'):
         return jsonify({'status': 400, 'message': '缺少帳號或密碼', 'success': False}), 400
 
     with DBHandler() as db:
-        user = db.check_password(data['account'], data['password'])
+        try:
+            user = db.check_password(data['account'], data['password'])
+        except HasherBusy:
+            # 密碼雜湊的排隊數已滿 (登入暴增)，直接拒絕，不讓其他 API 跟著變慢
+            return jsonify({'status': 503, 'message': '登入請求過多，請稍後再試', 'success': False}), 503, {'Retry-After': '1'}
         if user:
-            access_token_payload = {
-                'sub': user['id'],
-                'permission': user['permission'],
-                'iat': datetime.now(timezone.utc),                                              # create
-                'exp': datetime.now(timezone.utc) + app.config['JWT_ACCESS_TOKEN_EXPIRES']      # access expire
-            }
-            access_token = jwt.encode(access_token_payload, app.config['SECRET_KEY'], algorithm="HS256")
-
-            refresh_token = str(uuid.uuid4())
+            # 以目前的簽章金鑰 (JWT_ACTIVE_KID) 簽發，見 auth.py
+            access_token = issue_access_token(user['id'], user['permission'], app.config['JWT_ACCESS_TOKEN_EXPIRES'])
+
+            refresh_token = generate_refresh_token()
             refresh_token_exp = datetime.now(timezone.utc) + app.config['JWT_REFRESH_TOKEN_EXPIRES']    # refresh expire
-            db.store_refresh_token(user['id'], refresh_token, refresh_token_exp)
+            db.store_refresh_token(user['id'], refresh_token, refresh_token_exp, max_per_user=REFRESH_TOKENS_PER_USER)
             
-            db.create_log(user['id'], 'login', ip_address=request.remote_addr)
+            # 日誌交給背景批次寫入，不佔用登入的回應時間
+            log_writer.log(user['id'], 'login', ip_address=request.remote_addr)
 
             return jsonify({
                 'status': 200,
@@ -207,6 +187,13 @@ def login_route():
         else:
             return jsonify({'status': 401, 'message': '帳號或密碼錯誤', 'success': False}), 401
 
+@app.route('/api/login/rate-limits', methods=['GET'])
+@permission_required('manager')
+def login_rate_limits_route():
+    """登入限流的計數 (總計與被拒絕/失敗最多的 IP、帳號)，供監控使用"""
+    top = request.args.get('top', 20, type=int)
+    return jsonify({'status': 200, 'result': login_limiter.stats(top=top), 'success': True})
+
 @app.route('/api/refresh', methods=['POST'])
 def refresh_route():
     data = request.get_json()
@@ -214,21 +201,15 @@ def refresh_route():
     if not refresh_token:
         return jsonify({'status': 400, 'message': '未提供 Refresh Token', 'success': False}), 400
         
+    # 輪替：舊的 refresh token 立即失效，回傳新的一組 (同一個交易內完成驗證、撤銷與新增)
+    new_refresh_token = generate_refresh_token()
+    new_refresh_token_exp = datetime.now(timezone.utc) + app.config['JWT_REFRESH_TOKEN_EXPIRES']
     with DBHandler() as db:
-        user_id = db.validate_refresh_token(refresh_token)
-        if user_id:
-            user = db.find_user(user_id=user_id)
-            access_token_payload = {
-                'sub': user['id'],
-                'permission': user['permission'],
-                'iat': datetime.now(timezone.utc),
-                'exp': datetime.now(timezone.utc) + app.config['JWT_ACCESS_TOKEN_EXPIRES']
-            }
-            access_token = jwt.encode(access_token_payload, app.config['SECRET_KEY'], algorithm="HS256")
-            
-            return jsonify({'status': 200, 'access_token': access_token, 'success': True})
-        else:
-            return jsonify({'status': 401, 'message': '無效或已過期的 Refresh Token', 'success': False}), 401
+        user = db.rotate_refresh_token(refresh_token, new_refresh_token, new_refresh_token_exp)
+    if user:
+        access_token = issue_access_token(user['id'], user['permission'], app.config['JWT_ACCESS_TOKEN_EXPIRES'])
+        return jsonify({'status': 200, 'access_token': access_token, 'refresh_token': new_refresh_token, 'success': True})
+    return jsonify({'status': 401, 'message': '無效或已過期的 Refresh Token', 'success': False}), 401
 
 @app.route('/api/logout', methods=['POST'])
 def logout_route():
@@ -238,7 +219,7 @@ def logout_route():
     if refresh_token:
         with DBHandler() as db:
             db.delete_refresh_token(refresh_token)
-            db.create_log(user_id, 'logout', ip_address=request.remote_addr)
+            log_writer.log(user_id, 'logout', ip_address=request.remote_addr)
     return jsonify({'status': 200, 'message': '登出成功', 'success': True})
 
 @app.route('/api/signup', method=['POST'])
@@ -254,13 +235,15 @@ def signup_route():
 
 # 新增父分類: 要手動新增enum type
 @app.route('/api/categories', methods=['GET', 'POST'])
+@response_cache.cached('categories')
 def handle_categories():
     if request.method == 'GET':
         category_type = request.args.get('category_type')
-        with DBHandler() as db:
-            categories = db.get_categories_by_type(category_type)
-            
-            return jsonify({'status': 200, 'message': "success", 'result': categories, 'success': True})
+        try:
+            categories = category_cache.get_categories(category_type)
+        except Exception as e:
+            return jsonify({'status': 500, 'message': str(e), 'success': False}), 500
+        return jsonify({'status': 200, 'message': "success", 'result': categories, 'success': True})
 
     if request.method == 'POST':
         @permission_required('manager')
@@ -271,6 +254,8 @@ def handle_categories():
             with DBHandler() as db:
                 cat_id = db.insert_category(data['name'], data['category_type'])
                 if cat_id:
+                    category_cache.invalidate()
+                    response_cache.invalidate('categories', 'posts')
                     return jsonify({'status': 200, 'message': '分類建立成功', 'id': cat_id, 'success': True}), 200
                 else:
                     return jsonify({'status': 400, 'message': '無法建立分類', 'success': False}), 400
@@ -282,6 +267,8 @@ def handle_delete_category(category_name):
     with DBHandler() as db:
         success = db.delete_category(category_name)
         if success:
+            category_cache.invalidate()
+            response_cache.invalidate('categories', 'posts')
             return jsonify({'status': 200, 'message': '分類刪除成功', 'success': True})
         else:
             return jsonify({'status': 404, 'message': '找不到要刪除的分類', 'success': False}), 404
@@ -295,6 +282,11 @@ def upload_file():
     專門用來處理檔案上傳的 API。
     接收一個 multipart/form-data 請求，其中包含一個名為 'file' 的檔案。
     """
+    try:
+        subfolder = resolve_file_type(request.args.get("file_type"))
+    except ValueError as e:
+        return jsonify({'status': 400, 'message': str(e), 'success': False}), 400
+
     if 'files' not in request.files:
         return jsonify({'status': 400, 'message': '請求中未包含檔案', 'success': False}), 400
     
@@ -302,32 +294,124 @@ def upload_file():
     if not uploaded_files:
         return jsonify({'status': 400, 'message': '未選擇檔案', 'success': False}), 400
 
-    file_records = []
+    # 檔案在解析請求時已串流寫入暫存檔 (同時算好大小與 SHA-256)
+    records = []
     try:
-        with DBHandler() as db:
-            for file in uploaded_files:
-                original_filename = secure_filename(file.filename)
-                subfolder = request.args.get("file_type")
-                
-                unique_filename = f"{uuid.uuid4().hex}_{original_filename}"
-                relative_path = os.path.join(subfolder, unique_filename).replace("\\", "/")
-                save_path = os.path.join(app.config['UPLOAD_FOLDER'], relative_path)
-                file.save(save_path)
-
-                # 存入資料庫並取得 file_id
-                file_id = db.upload_file(save_path, original_filename, subfolder)
-                file_records = []
-                if file_id:
-                    file_records.append({
-                        'id': file_id,
-                        'path': save_path,
-                        'original_filename': original_filename
-                    })
+        for file in uploaded_files:
+            records.append(store_uploaded_file(file, subfolder))
+        # 相同內容只保留一份實體檔案；同一個請求的所有檔案以單一 INSERT、單一交易寫入
+        file_ids = save_uploads(records)
     except Exception as e:
+        discard_records(records)
         return jsonify({'status': 500, 'message': f"檔案處理時發生錯誤: {e}", 'success': False}), 500
-    
+    # 縮圖在背景程序產生，不等待
+    rendition_queue.submit(records)
+
+    file_records = [_file_record_response(file_id, record) for file_id, record in zip(file_ids, records)]
     return jsonify({'status': 200, 'message': 'upload success', 'files': file_records, 'success': True}), 200
 
+def _file_record_response(file_id, record):
+    return {
+        'id': file_id,
+        'path': os.path.join(app.config['UPLOAD_FOLDER'], record['file_path']),
+        'original_filename': record['original_filename'],
+        'file_size': record['file_size'],
+        'sha256': record['sha256'],
+        'deduplicated': record['deduplicated'],
+    }
+
+# --- 可續傳 (分段) 上傳：大型 zip / PDF ---
+def _upload_session_response(meta, status=200):
+    return jsonify({
+        'status': status,
+        'upload_id': meta['upload_id'],
+        'file_type': meta['file_type'],
+        'offset': meta['offset'],
+        'size': meta['size'],
+        'success': True,
+    }), status
+
+def _check_upload_owner(meta):
+    if meta['user_id'] is not None and g.user['permission'] != 'manager' and g.user['id'] != meta['user_id']:
+        return jsonify({'status': 403, 'message': '權限不足，只能存取自己的上傳工作', 'success': False}), 403
+    return None
+
+@app.route('/api/upload/sessions', methods=['POST'])
+@permission_required(['manager', 'editor'])
+def create_upload_session():
+    """
+    建立可續傳上傳工作。JSON: {"filename": ..., "size": <bytes>, "sha256": 選填}，query: file_type
+    之後以 PUT /api/upload/sessions/<upload_id>?file_type=... 搭配 Content-Range 逐段上傳。
+    若提供 sha256 且伺服器上已有相同內容，直接建立檔案紀錄並回傳，不需上傳。
+    """
+    data = request.get_json(silent=True) or {}
+    if data.get('sha256'):
+        try:
+            linked = link_existing_blob(str(data['sha256']).lower(), resolve_file_type(request.args.get('file_type')),
+                                        data.get('filename'))
+        except ValueError as e:
+            return jsonify({'status': 400, 'message': str(e), 'success': False}), 400
+        except Exception as e:
+            return jsonify({'status': 500, 'message': f"檔案處理時發生錯誤: {e}", 'success': False}), 500
+        if linked:
+            file_id, record = linked
+            if not record.get('renditions'):
+                rendition_queue.submit([record])
+            return jsonify({'status': 200, 'message': 'upload success', 'files': [_file_record_response(file_id, record)], 'success': True}), 200
+    try:
+        meta = resumable_uploads.create(request.args.get('file_type'), data.get('filename'),
+                                        data.get('size'), user_id=g.user['id'])
+    except (TypeError, ValueError) as e:
+        return jsonify({'status': 400, 'message': str(e), 'success': False}), 400
+    return _upload_session_response(meta, 201)
+
+@app.route('/api/upload/sessions/<string:upload_id>', methods=['GET', 'PUT', 'DELETE'])
+@permission_required(['manager', 'editor'])
+def handle_upload_session(upload_id):
+    """GET: 查詢已收到的 offset；PUT: 上傳一段 (Content-Range)，收齊後寫入 files；DELETE: 取消"""
+    file_type = request.args.get('file_type')
+    try:
+        meta = resumable_uploads.status(file_type, upload_id)
+    except ValueError as e:
+        return jsonify({'status': 400, 'message': str(e), 'success': False}), 400
+    if meta is None:
+        return jsonify({'status': 404, 'message': '找不到上傳工作', 'success': False}), 404
+    denied = _check_upload_owner(meta)
+    if denied:
+        return denied
+
+    if request.method == 'GET':
+        return _upload_session_response(meta)
+
+    if request.method == 'DELETE':
+        resumable_uploads.abort(file_type, upload_id)
+        return jsonify({'status': 200, 'message': '已取消上傳', 'success': True})
+
+    try:
+        if meta['offset'] < meta['size']:
+            # 直接從 WSGI input 分段讀取並附加到 .part 檔，不經過表單解析
+            meta = resumable_uploads.write_chunk(file_type, upload_id, request.headers.get('Content-Range'), request.stream)
+        if meta['offset'] < meta['size']:
+            return _upload_session_response(meta, 202)
+        record = resumable_uploads.complete(file_type, upload_id)
+    except LookupError as e:
+        return jsonify({'status': 404, 'message': str(e), 'success': False}), 404
+    except ValueError as e:
+        current = resumable_uploads.status(file_type, upload_id)
+        return jsonify({'status': 409, 'message': str(e), 'offset': current['offset'] if current else None, 'success': False}), 409
+
+    try:
+        file_ids = save_uploads([record])
+    except Exception as e:
+        discard_records([record])
+        return jsonify({'status': 500, 'message': f"檔案處理時發生錯誤: {e}", 'success': False}), 500
+    rendition_queue.submit([record])
+    return jsonify({'status': 200, 'message': 'upload success', 'files': [_file_record_response(file_ids[0], record)], 'success': True}), 200
+
+def _with_total():
+    """列表 API 的 ?with_total=false：不需要總數 (例如無限捲動) 時跳過計數"""
+    return request.args.get('with_total', 'true').lower() not in ('0', 'false', 'no')
+
 @app.route('/api/files', methods=['GET'])
 def get_unattached_files_route():
     """【新功能】取得所有未關聯到文章的檔案 (媒體庫)"""
@@ -336,10 +420,14 @@ def get_unattached_files_route():
         page_size = request.args.get('page_size', 10, type=int)
         page = request.args.get('page', 1, type=int)
         offset = (page - 1) * page_size
+        cursor = request.args.get('cursor')
         with DBHandler() as db:
-            files = db.get_files(filters=filters, page_size=page_size, offset=offset)
+            files = db.get_files(filters=filters, page_size=page_size, offset=offset, cursor=cursor,
+                                 with_total=_with_total())
 
             return jsonify({'status': 200, 'message': 'success', 'files': files, 'success': True})
+    except ValueError as e:
+        return jsonify({'status': 400, 'message': str(e), 'success': False}), 400
     except Exception as e:
         return jsonify({'status': 500, 'message': str(e), 'success': False}), 500
 
@@ -354,15 +442,12 @@ def delete_file_route(file_id):
             # 如果 owner_id 是 None，表示檔案未關聯或不存在，只有 manager 能刪除
             if owner_id is not None and g.user['permission'] != 'manager' and g.user['id'] != owner_id:
                  return jsonify({'status': 403, 'message': '權限不足，只能刪除自己文章中的檔案', 'success': False}), 403
-            
-            # 刪除實體檔案 (此為可選步驟，但建議執行)
-            # ... 這裡應加入根據 file_id 查詢 file_path 並從硬碟刪除檔案的邏輯 ...
-            file = db.get_file(file_id)
-            full_path_to_file = os.path.join(app.config['UPLOAD_FOLDER'], file["file_path"])
-            os.remove(full_path_to_file)
-
-            # 從資料庫刪除紀錄
-            success = db.delete_file(file_id)
+
+        # 從資料庫刪除紀錄；實體檔案由多筆紀錄共用 (相同內容)，最後一筆引用被刪除時才會刪除
+        success = delete_file(file_id)
+        if success:
+            static_files.invalidate(file_id)
+            response_cache.invalidate('posts')
         
         if success:
             return jsonify({'status': 200, 'message': '檔案刪除成功', 'success': True})
@@ -375,51 +460,89 @@ def delete_file_route(file_id):
 # --- Static File Route ---
 # 當前端讀取到HTML的<img src=...>，就會自動向您的伺服器發送一個新的 GET 請求，請求的網址就是 /uploads/<path:filepath>
 @app.route('/uplo/<int:file_id>')
-def serve_uploaded_file(file_id):
-    """提供一個路由來讓外界可以存取 uploads 資料夾中的檔案"""
+@app.route('/uplo/<int:file_id>/<string:rendition>')
+def serve_uploaded_file(file_id, rendition=None):
+    """提供一個路由來讓外界可以存取 uploads 資料夾中的檔案或圖片衍生圖 (檔案資訊有快取，支援 Range 與 304)"""
     try:
-        with DBHandler() as db:
-            file = db.get_file(file_id)
-            folder = os.path.join(app.config['UPLOAD_FOLDER'], file['file_type'])
-            print(folder)
-            return send_from_directory(folder, os.path.split(file['file_path']))
+        resp = static_files.send(file_id, rendition)
     except Exception as e:
+        return jsonify({'status': 500, 'error': str(e), 'success': False}), 500
+    if resp is None:
         return jsonify({
                 'status': 404,
                 'error': "檔案不存在",
                 'success': False
             }), 404
+    return resp
  
 
+def _add_image_urls(post):
+    """圖片加上原圖與各尺寸衍生圖 (thumb / medium 及其 WebP) 的網址，供前端 srcset 使用"""
+    images = list(post.get('images') or [])
+    if post.get('cover_image'):
+        # 列表卡片 (post_cards) 只有第一張圖片
+        images.append(post['cover_image'])
+    for image in images:
+        image['url'] = url_for('serve_uploaded_file', file_id=image['id'])
+        image['renditions'] = {
+            name: {'url': url_for('serve_uploaded_file', file_id=image['id'], rendition=name),
+                   'width': item['width'], 'height': item['height']}
+            for name, item in (image.get('renditions') or {}).items()
+        }
+    return post
+
+def _on_renditions_ready(file_ids):
+    for file_id in file_ids:
+        static_files.invalidate(file_id)
+    response_cache.invalidate('posts')
+
+rendition_queue.on_complete(_on_renditions_ready)
+
+
 # --- posts CURD ---
+def _post_filters():
+    """由查詢參數組成 get_posts / export_posts 的 filters"""
+    filters = {}
+    if request.args.get('title_keyword'):
+        filters['title_keyword'] = request.args.get('title_keyword')
+    if request.args.get('q'):
+        filters['q'] = request.args.get('q')
+    if request.args.get('user_id'):
+        filters['user_id'] = request.args.get('user_id', type=int)
+    if request.args.get('status'):
+        filters['status'] = request.args.get('status')
+    category_type = request.args.get('category_type')
+    if category_type:
+        # 父類別 -> 子分類名稱由快取提供，不需查詢資料庫
+        filters['category_name'] = category_cache.names_for_type(category_type)
+    else:
+        category_names = request.args.get('category_name')
+        if category_names:
+            filters['category_name'] = category_names
+    return filters
+
+
 @app.route('/api/posts', methods=['GET', 'POST'])
+@response_cache.cached('posts')
 def handle_posts():
     if request.method == 'GET':
-        filters = {}
-        category_type = request.args.get('category_type')
-        if category_type:
-            with DBHandler() as db:
-                categories = db.get_categories_by_type(category_type)
-                filters['category_name'] = [c['name'] for c in categories]
-        else:
-            category_names = request.args.get('category_name')
-            if category_names:
-                filters['category_name'] = category_names
-
-        if request.args.get('title_keyword'):
-            filters['title_keyword'] = request.args.get('title_keyword')
-        if request.args.get('user_id'):
-            filters['user_id'] = request.args.get('user_id', type=int)
-        if request.args.get('status'):
-            filters['status'] = request.args.get('status')
-
-        order_by = request.args.get('order_by', 'announcement_date', type=str)
         page_size = request.args.get('page_size', 10, type=int)
         page = request.args.get('page', 1, type=int)
         offset = (page - 1) * page_size
+        cursor = request.args.get('cursor')
         try:
+            filters = _post_filters()
+            # 有全文搜尋時預設依相關度排序
+            order_by = request.args.get('order_by', 'relevance' if filters.get('q') else 'announcement_date', type=str)
+
             with DBHandler() as db:
-                posts = db.get_posts(filters=filters, order_by = order_by, page_size=page_size, offset=offset)
+                posts = db.get_posts(filters=filters, order_by = order_by, page_size=page_size, offset=offset, cursor=cursor,
+                                     with_total=_with_total())
+                if posts is None:
+                    # 資料庫錯誤：回傳 500，不讓空列表被 response_cache 快取
+                    return jsonify({'status': 500, 'message': "查詢文章失敗", 'success': False}), 500
+                for post in posts.get('rows', []):
+                    _add_image_urls(post)
                 
                 # for post in posts.get('rows', []):
                 #     if post.get('attchments'):
@@ -431,6 +554,8 @@ def handle_posts():
                 #             f['url'] = os.path.join(app.config['UPLOAD_FOLDER'], f['file_path'])
                 
                 return jsonify({'status': 200, 'result': posts, 'success': True})
+        except ValueError as e:
+            return jsonify({'status': 400, 'message': str(e), 'success': False}), 400
         except Exception as e:
             return jsonify({'status': 500, 'message': str(e), 'success': False}), 500
 
@@ -469,12 +594,15 @@ def handle_posts():
                     file_ids = file_id_list
                     )
             if post_id:
+                response_cache.invalidate('posts')
                 return jsonify({'status': 200, 'message': "文章建立成功", 'id': post_id, 'success': True}), 201
             else:
                 return jsonify({'status': 500, 'message': "無法建立文章", 'success': False}), 500
         return create()
 
 @app.route('/api/posts/<int:post_id>', methods=['GET', 'PUT', 'DELETE'])
+# 點擊數先記在記憶體，定期批次寫回；命中回應快取 (含 304) 時也要累計
+@response_cache.cached('posts', on_serve=lambda post_id: click_counter.record(post_id))
 def handle_post_by_id(post_id):
     if request.method == 'GET':
         try:
@@ -482,6 +610,9 @@ def handle_post_by_id(post_id):
                 post = db.get_post(post_id)
 
             if post:
+                # 回應中加上尚未寫回的點擊數
+                post['click_count'] += click_counter.pending(post_id) + 1
+                _add_image_urls(post)
                 # 將檔案路徑轉換為完整的 URL
                 # if post.get('attchments'):
                 #     for f in post['attchments']:
@@ -533,29 +664,56 @@ def handle_post_by_id(post_id):
                 update_data_for_db['hashtags'] = hashtags_list
 
                 success = db.update_post(post_id, update_data_for_db)
+                if success:
+                    response_cache.invalidate('posts')
                 return jsonify({'status': 200, 'message': '文章更新成功', 'success': True}) if success else jsonify({'status': 500, 'message': '更新失敗', 'success': False}), 500
 
             if request.method == 'DELETE':
                 success = db.delete_post(post_id)
+                if success:
+                    response_cache.invalidate('posts')
                 return jsonify({'status': 200, 'message': '文章刪除成功', 'success': True}) if success else jsonify({'status': 404, 'message': '刪除失敗', 'success': False}), 404
     return protected_operation()
 
 # --- bulletin CURD ---
+def _date_arg(name):
+    """讀取 YYYY-MM-DD 格式的查詢參數 (格式錯誤時拋出 ValueError)"""
+    value = request.args.get(name)
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+def _bulletin_range():
+    """start / end 皆包含當天；查詢時轉成半開區間 [start, end 隔天)"""
+    start, end = _date_arg('start'), _date_arg('end')
+    if end:
+        end += timedelta(days=1)
+    return start, end
 
 @app.route('/api/bulletin_messages', methods=['GET', 'POST'])
+@response_cache.cached('bulletin_messages')
 def handle_bulletin_messages():
     if request.method == 'GET':
         try:
-            target_date_str = request.args.get('date')
-            target_date = datetime.strptime(target_date_str, '%Y-%m-%d').date() if target_date_str else None
+            target_date = _date_arg('date')
+            start, end = _bulletin_range()
+            campus, department = request.args.get('campus'), request.args.get('department')
             page = request.args.get('page', 1, type=int)
             page_size = request.args.get('page_size', 10, type=int)
             offset = (page - 1) * page_size
             with DBHandler() as db:
                 bulletins = db.get_bulletin_messages(
-                    target_date=target_date, campus=request.args.get('campus'),
-                    department=request.args.get('department'), page_size=page_size, offset=offset
+                    target_date=target_date, campus=campus,
+                    department=department, page_size=page_size, offset=offset,
+                    cursor=request.args.get('cursor'), with_total=_with_total(), start=start, end=end
                 )
+                if bulletins is not None and request.args.get('facets', '').lower() in ('1', 'true', 'yes'):
+                    if target_date:
+                        start, end = target_date, target_date + timedelta(days=1)
+                    bulletins['facets'] = db.get_bulletin_facets(start=start, end=end, campus=campus, department=department)
+                    if bulletins['facets'] is None:
+                        bulletins = None
+            if bulletins is None:
+                # 資料庫錯誤：回傳 500，不讓空列表被 response_cache 快取
+                return jsonify({'status': 500, 'message': "查詢留言失敗", 'success': False}), 500
             return jsonify({'status': 200, "message": "success", 'result': bulletins, 'success': True})
         except Exception as e:
             return jsonify({'status': 400, 'message': str(e), 'success': False}), 400
@@ -570,6 +728,7 @@ def handle_bulletin_messages():
                 department=data.get('department'), campus=data.get('campus')
             )
         if message_id:
+            response_cache.invalidate('bulletin_messages')
             return jsonify({'status': 201, 'message': "留言新增成功", 'id': message_id, 'success': True}), 201
         else:
             return jsonify({'status': 500, 'message': "無法新增留言", 'success': False}), 500
@@ -581,11 +740,62 @@ def handle_delete_bulletin_message(message_id):
         with DBHandler() as db:
             success = db.delete_bulletin_message(message_id)
             if success:
+                response_cache.invalidate('bulletin_messages')
                 return jsonify({'status': 200, 'message': "留言刪除成功", 'success': True})
             else:
                 return jsonify({'status': 404, 'message': "找不到要刪除的留言或刪除失敗", 'success': False}), 404
     except Exception as e:
         return jsonify({'status': 500, 'message': '伺服器發生未預期的錯誤'}), 500
-    
+
+
+# --- 串流匯出 ---
+def _export_rows(method, **kwargs):
+    """在 generator 內借出連線並以 server-side cursor 逐批取出資料列，傳送結束 (或用戶端中斷) 時歸還連線"""
+    with DBHandler() as db:
+        yield from getattr(db, method)(**kwargs)
+
+def _export_response(rows, name):
+    """
+    以 generator 回應逐段輸出 NDJSON (預設) 或 CSV (?format=csv)，記憶體用量與資料筆數無關。
+    先取出第一列再回應，連線或查詢錯誤仍能回傳 500；之後的資料列邊查邊送出。
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'status': 400, 'message': "format 必須是 ndjson 或 csv", 'success': False}), 400
+    try:
+        first = next(rows, None)
+    except Exception as e:
+        return jsonify({'status': 500, 'message': str(e), 'success': False}), 500
+    rows = itertools.chain([first], rows) if first is not None else iter(())
+    lines = to_csv_lines(rows) if fmt == 'csv' else map(to_ndjson, rows)
+    resp = Response(chunked(lines), mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson')
+    resp.headers['Content-Disposition'] = f'attachment; filename={name}.{fmt}'
+    resp.headers['Cache-Control'] = 'no-store'
+    # 讓 nginx 不要先緩衝整個回應
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
+
+@app.route('/api/posts/export', methods=['GET'])
+@permission_required('manager')
+def export_posts_route():
+    try:
+        filters = _post_filters()
+    except ValueError as e:
+        return jsonify({'status': 400, 'message': str(e), 'success': False}), 400
+    except Exception as e:
+        return jsonify({'status': 500, 'message': str(e), 'success': False}), 500
+    return _export_response(_export_rows('export_posts', filters=filters), 'posts')
+
+@app.route('/api/bulletin_messages/export', methods=['GET'])
+@permission_required('manager')
+def export_bulletin_messages_route():
+    try:
+        start, end = _bulletin_range()
+    except ValueError as e:
+        return jsonify({'status': 400, 'message': str(e), 'success': False}), 400
+    rows = _export_rows('export_bulletin_messages', start=start, end=end,
+                        campus=request.args.get('campus'), department=request.args.get('department'))
+    return _export_response(rows, 'bulletin_messages')
+
 if __name__ == "__main__":
     app.run(debug=True, port=5004)
\ No newline at end of file
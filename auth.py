@@ -0,0 +1,141 @@
+import os
+import time
+from functools import wraps
+import jwt
+from flask import request, jsonify, g
+from dotenv import load_dotenv
+from cache import LRUCache
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+# 簽章金鑰，格式 "kid1:secret1,kid2:secret2"；未設定時使用 SECRET_KEY (kid = default)
+# 輪替方式：加入新的 kid 並設為 JWT_ACTIVE_KID，舊金鑰保留到它簽出的 access token 全部過期後再移除
+JWT_KEYS = os.getenv('JWT_KEYS', '')
+JWT_ACTIVE_KID = os.getenv('JWT_ACTIVE_KID')
+JWT_ALGORITHM = 'HS256'
+# 已驗證 token 的快取筆數；每筆最多保留到 token 的 exp 為止
+JWT_VERIFY_CACHE_SIZE = int(os.getenv('JWT_VERIFY_CACHE_SIZE', 10000))
+# 快取存活上限 (秒)，避免金鑰移除後舊 token 仍長時間有效
+JWT_VERIFY_CACHE_TTL = float(os.getenv('JWT_VERIFY_CACHE_TTL', 300))
+
+# 沒有 kid 標頭的舊 token 以此金鑰驗證
+LEGACY_KID = 'default'
+
+
+def load_keys(spec=JWT_KEYS, secret_key=None):
+    """解析 JWT_KEYS，回傳 {kid: secret}"""
+    keys = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        kid, sep, secret = item.partition(':')
+        if not sep or not kid or not secret:
+            raise ValueError("JWT_KEYS 格式應為 kid:secret,kid:secret")
+        keys[kid] = secret
+    secret_key = secret_key if secret_key is not None else os.getenv('SECRET_KEY')
+    if secret_key and LEGACY_KID not in keys:
+        keys[LEGACY_KID] = secret_key
+    return keys
+
+
+class TokenVerifier:
+    """
+    JWT 簽發與驗證。
+    驗證成功的 token 以原字串為 key 快取 payload，存活到 min(exp, cache ttl)，
+    同一個 token 在有效期內的後續請求不需重新計算 HMAC 與解析 JSON。
+    """
+
+    def __init__(self, keys=None, active_kid=JWT_ACTIVE_KID, maxsize=JWT_VERIFY_CACHE_SIZE, ttl=JWT_VERIFY_CACHE_TTL):
+        self.keys = keys if keys is not None else load_keys()
+        self.active_kid = active_kid or next(iter(self.keys), None)
+        if self.keys and self.active_kid not in self.keys:
+            raise ValueError(f"JWT_ACTIVE_KID '{self.active_kid}' 不在 JWT_KEYS 中")
+        self.ttl = ttl
+        self._cache = LRUCache(maxsize=maxsize)
+
+    def encode(self, payload):
+        if not self.keys:
+            raise RuntimeError("未設定 JWT 簽章金鑰 (JWT_KEYS 或 SECRET_KEY)")
+        return jwt.encode(payload, self.keys[self.active_kid], algorithm=JWT_ALGORITHM,
+                          headers={'kid': self.active_kid})
+
+    def verify(self, token):
+        """回傳 payload；無效或過期時拋出 jwt.InvalidTokenError (含 ExpiredSignatureError)"""
+        payload = self._cache.get(token)
+        if payload is not None:
+            return payload
+        kid = jwt.get_unverified_header(token).get('kid', LEGACY_KID)
+        key = self.keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"未知的金鑰 kid: {kid}")
+        payload = jwt.decode(token, key, algorithms=[JWT_ALGORITHM])
+        ttl = min(payload['exp'] - time.time(), self.ttl) if 'exp' in payload else self.ttl
+        if ttl > 0:
+            self._cache.set(token, payload, ttl=ttl)
+        return payload
+
+    def set_keys(self, keys, active_kid=None):
+        """更換金鑰 (輪替)；清空快取，讓被移除金鑰簽出的 token 立即失效"""
+        active_kid = active_kid or self.active_kid
+        if active_kid not in keys:
+            raise ValueError(f"active kid '{active_kid}' 不在金鑰中")
+        self.keys, self.active_kid = dict(keys), active_kid
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+token_verifier = TokenVerifier()
+
+
+def issue_access_token(user_id, permission, expires_in):
+    """簽發 access token；sub 依 JWT 規範存成字串"""
+    now = int(time.time())
+    return token_verifier.encode({
+        'sub': str(user_id),
+        'permission': permission,
+        'iat': now,
+        'exp': now + int(expires_in.total_seconds()),
+    })
+
+
+def token_required(required_permissions=None):
+    if required_permissions is None:
+        required_permissions = []
+    elif isinstance(required_permissions, str):
+        required_permissions = [required_permissions]
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            token = None
+            if 'Authorization' in request.headers:
+                auth_header = request.headers['Authorization']
+                try:
+                    token = auth_header.split(" ")[1]
+                except IndexError:
+                    return jsonify({'status': 401, 'message': '無效的 Token 格式 (應為 Bearer <token>)', 'success': False}), 401
+
+            if not token:
+                return jsonify({'status': 401, 'message': '未提供 Token', 'success': False}), 401
+
+            try:
+                payload = token_verifier.verify(token)
+                g.user = {'id': int(payload['sub']), 'permission': payload['permission']}
+
+                # 在這裡直接進行權限等級檢查
+                if required_permissions and g.user['permission'] not in required_permissions:
+                    return jsonify({'status': 403, 'message': f"權限不足，此操作需要 {required_permissions} 等級。", 'success': False}), 403
+
+            except jwt.ExpiredSignatureError:
+                return jsonify({'status': 401, 'message': 'Token 已過期', 'success': False}), 401
+            except (jwt.InvalidTokenError, KeyError, ValueError):
+                return jsonify({'status': 401, 'message': '無效的 Token', 'success': False}), 401
+
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+# 路由使用的名稱
+permission_required = token_required
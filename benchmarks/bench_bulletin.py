@@ -0,0 +1,119 @@
+"""
+布告欄查詢效能測試：比較舊的 created_at::date = ... 與半開區間 + (campus, department, created_at) 索引，
+以及篩選面板計數 (get_bulletin_facets)。
+
+用法 (於專案根目錄，請連到測試用資料庫並先執行 python migrate.py)：
+    python -m benchmarks.bench_bulletin --seed 1000000      # 產生 100 萬則測試留言 (分散在最近兩年)
+    python -m benchmarks.bench_bulletin --rounds 20         # 執行查詢比較
+    python -m benchmarks.bench_bulletin --cleanup           # 刪除測試留言
+
+測試留言的 author_name 為 [bench]。
+"""
+import argparse
+import statistics
+import time
+import os
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_handler import DBHandler
+
+BENCH_AUTHOR = '[bench]'
+CAMPUSES = ['義大醫院', '義大癌治療醫院', '義大大昌醫院', '義守大學']
+DEPARTMENTS = ['智慧醫療部', '資訊室', '護理部', '藥劑部', '檢驗科', '放射科', '營養室', '人資室',
+               '急診部', '門診部', '教學部', '品管中心']
+
+
+def seed(db, count, batch=100000):
+    with db.conn.cursor() as cur:
+        for start in range(0, count, batch):
+            size = min(batch, count - start)
+            # 院區 / 部門依 g 分配 (部分院區、部門較多留言)，時間隨機分散在最近 730 天
+            cur.execute("""
+                INSERT INTO bulletin_messages (author_name, content, campus, department, created_at)
+                SELECT %s, '測試留言 ' || g,
+                       (%s::text[])[1 + (g * 7 %% 10) %% %s],
+                       (%s::text[])[1 + (g * 13 %% 29) %% %s],
+                       NOW() - random() * INTERVAL '730 days'
+                FROM generate_series(%s, %s) AS g;
+            """, (BENCH_AUTHOR, CAMPUSES, len(CAMPUSES), DEPARTMENTS, len(DEPARTMENTS), start + 1, start + size))
+            db.conn.commit()
+            print(f"已新增 {start + size}/{count} 則測試留言")
+        cur.execute("ANALYZE bulletin_messages;")
+        db.conn.commit()
+
+
+def cleanup(db):
+    with db.conn.cursor() as cur:
+        cur.execute("DELETE FROM bulletin_messages WHERE author_name = %s;", (BENCH_AUTHOR,))
+        print(f"已刪除 {cur.rowcount} 則測試留言")
+    db.conn.commit()
+
+
+def timed(fn, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.mean(timings), statistics.median(timings)
+
+
+def old_query(db, target_date, page_size=20):
+    """原本的做法：COUNT(*) + created_at::date = ... (無法使用索引)"""
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM bulletin_messages WHERE created_at::date = %s;", (target_date,))
+        cur.fetchone()
+        cur.execute("SELECT * FROM bulletin_messages WHERE created_at::date = %s ORDER BY created_at DESC, id DESC LIMIT %s;",
+                    (target_date, page_size))
+        cur.fetchall()
+    db.conn.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bulletin board query benchmark")
+    parser.add_argument('--seed', type=int, default=0, help="產生幾則測試留言")
+    parser.add_argument('--cleanup', action='store_true', help="刪除測試留言")
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    with DBHandler() as db:
+        if args.cleanup:
+            cleanup(db)
+            return
+        if args.seed:
+            seed(db, args.seed)
+
+        with db.conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM bulletin_messages;")
+            print(f"bulletin_messages 總筆數: {cur.fetchone()[0]}")
+        db.conn.rollback()
+
+        day = date.today() - timedelta(days=100)
+        month_start, month_end = day.replace(day=1), (day.replace(day=1) + timedelta(days=32)).replace(day=1)
+        campus, department = CAMPUSES[0], DEPARTMENTS[0]
+
+        # 深頁：先用 OFFSET 找到第 5000 頁的位置，之後以游標取下一頁
+        deep = db.get_bulletin_messages(page_size=20, offset=100000, with_total=False)
+        deep_cursor = deep['next_cursor']
+
+        cases = [
+            ('date (舊 ::date + COUNT)', lambda: old_query(db, day)),
+            ('date (半開區間)', lambda: db.get_bulletin_messages(target_date=day, page_size=20)),
+            ('campus+dept+月份', lambda: db.get_bulletin_messages(campus=campus, department=department,
+                                                                start=month_start, end=month_end, page_size=20)),
+            ('department', lambda: db.get_bulletin_messages(department=department, page_size=20)),
+            ('深頁游標', lambda: db.get_bulletin_messages(cursor=deep_cursor, page_size=20, with_total=False)),
+            ('facets 月份', lambda: db.get_bulletin_facets(start=month_start, end=month_end, campus=campus)),
+            ('facets 全部', lambda: db.get_bulletin_facets(campus=campus)),
+        ]
+        print(f"{'查詢':<24}{'avg':>10}{'p50':>10}  (ms)")
+        for name, fn in cases:
+            avg, p50 = timed(fn, args.rounds)
+            db.conn.rollback()
+            print(f"{name:<24}{avg:>10.2f}{p50:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+比較 get_posts 三種查詢方式的耗時：
+- multi : COUNT + 分頁 + 附件 + 圖片 + 標籤，共 5 次來回
+- single: 單一 SQL (COUNT(*) OVER() + json_agg/ARRAY 子查詢)
+- cards : 只讀取 post_cards 讀取模型 (migrations/0011)
+
+用法 (於專案根目錄，需先設定 .env 連到測試資料庫)：
+    python -m benchmarks.bench_get_posts --rounds 200 --page-size 10 --pages 1 50
+"""
+import argparse
+import statistics
+import time
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_handler import DBHandler
+
+
+def run(db, single_query, read_model, rounds, page_size, page, filters):
+    timings = []
+    offset = (page - 1) * page_size
+    for _ in range(rounds):
+        start = time.perf_counter()
+        db.get_posts(filters=filters, page_size=page_size, offset=offset, single_query=single_query, read_model=read_model)
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'avg': statistics.mean(timings),
+        'p50': timings[len(timings) // 2],
+        'p99': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="get_posts multi vs single query vs read model benchmark")
+    parser.add_argument('--rounds', type=int, default=200)
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1])
+    parser.add_argument('--status', default=None, help="只查詢某狀態的文章")
+    args = parser.parse_args()
+
+    filters = {'status': args.status} if args.status else None
+    with DBHandler() as db:
+        # 暖機，排除第一次查詢的快取影響
+        modes = (('multi', False, False), ('single', True, False), ('cards', False, True))
+        for _, single, cards in modes:
+            db.get_posts(filters=filters, page_size=args.page_size, single_query=single, read_model=cards)
+        print(f"{'mode':<8}{'page':>6}{'avg ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+        for page in args.pages:
+            for mode, single, cards in modes:
+                r = run(db, single, cards, args.rounds, args.page_size, page, filters)
+                print(f"{mode:<8}{page:>6}{r['avg']:>10.2f}{r['p50']:>10.2f}{r['p99']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
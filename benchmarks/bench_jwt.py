@@ -0,0 +1,56 @@
+"""
+比較每個受保護請求驗證 access token 的成本 (不需資料庫)：
+- decode : 每次都以 jwt.decode 完整驗證 (HMAC-SHA256 + base64 + JSON)
+- cached : auth.TokenVerifier，同一個 token 第二次之後直接命中快取
+- mixed  : 多個使用者 (--users 個不同 token) 輪流請求，觀察快取命中後的平均成本
+
+用法 (於專案根目錄)：
+    python -m benchmarks.bench_jwt --rounds 100000 --users 1000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import jwt
+from auth import TokenVerifier, JWT_ALGORITHM
+
+
+def per_call_us(fn, tokens, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        fn(tokens[i % len(tokens)])
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JWT verify-per-request benchmark")
+    parser.add_argument('--rounds', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000, help="mixed 測試中不同 token 的數量")
+    args = parser.parse_args()
+
+    keys = {'k1': 'benchmark-secret-k1-' + 'x' * 32, 'k2': 'benchmark-secret-k2-' + 'y' * 32}
+    verifier = TokenVerifier(keys=keys, active_kid='k2')
+    now = int(time.time())
+    expires = int(timedelta(minutes=15).total_seconds())
+    tokens = [verifier.encode({'sub': str(i), 'permission': 'editor', 'iat': now, 'exp': now + expires})
+              for i in range(args.users)]
+
+    def full_decode(token):
+        kid = jwt.get_unverified_header(token)['kid']
+        return jwt.decode(token, keys[kid], algorithms=[JWT_ALGORITHM])
+
+    results = {
+        'decode': per_call_us(full_decode, tokens[:1], args.rounds),
+        'cached': per_call_us(verifier.verify, tokens[:1], args.rounds),
+        'mixed': per_call_us(verifier.verify, tokens, args.rounds),
+    }
+    for name, us in results.items():
+        print(f"{name:<7} {us:8.2f} us/次  ({1e6 / us:,.0f} 次/秒)")
+    print(f"cache: {verifier.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+比較各密碼雜湊演算法與成本參數下，登入 (驗證一次密碼) 的吞吐量與延遲 (不需資料庫)：
+- sha256 : 舊版無 salt 的 SHA-256 (僅作為對照)
+- pbkdf2 : PBKDF2-HMAC-SHA256，--pbkdf2 指定的各個迭代次數
+- scrypt : r=8, p=1，--scrypt 指定的各個 N
+- argon2 : 有安裝 argon2-cffi 時，--argon2 指定的各個 time_cost (memory_cost 64 MiB)
+
+以 --clients 個執行緒 (模擬 waitress 的執行緒數) 同時登入，雜湊交給 --workers 個執行緒的 PasswordHasher。
+
+用法 (於專案根目錄)：
+    python -m benchmarks.bench_password --seconds 3 --clients 2 --workers 2
+"""
+import argparse
+import hashlib
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import passwords
+from passwords import PasswordHasher
+
+PASSWORD = 'correct horse battery staple'
+
+
+def run(hasher, encoded, clients, seconds):
+    latencies = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client():
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            assert hasher.verify(PASSWORD, encoded)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, statistics.median(latencies) * 1000
+
+
+def settings(args):
+    yield 'sha256', 'scrypt', {}, hashlib.sha256(PASSWORD.encode()).hexdigest()
+    for iterations in args.pbkdf2:
+        yield f'pbkdf2 i={iterations}', 'pbkdf2_sha256', {'iterations': iterations}, None
+    for n in args.scrypt:
+        yield f'scrypt n=2^{n.bit_length() - 1}', 'scrypt', {'n': n}, None
+    if passwords.argon2 is None:
+        print("(未安裝 argon2-cffi，略過 argon2)")
+        return
+    for time_cost in args.argon2:
+        yield f'argon2id t={time_cost}', 'argon2id', {'time_cost': time_cost}, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="login password hashing benchmark")
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--clients', type=int, default=2, help="同時登入的執行緒數 (WSGI_THREADS)")
+    parser.add_argument('--workers', type=int, default=2, help="PASSWORD_HASH_WORKERS")
+    parser.add_argument('--pbkdf2', type=int, nargs='*', default=[100000, 300000, 600000])
+    parser.add_argument('--scrypt', type=int, nargs='*', default=[2 ** 14, 2 ** 15, 2 ** 16])
+    parser.add_argument('--argon2', type=int, nargs='*', default=[2, 3])
+    args = parser.parse_args()
+
+    print(f"{'設定':<18} {'登入/秒':>10} {'中位數延遲':>12}")
+    for label, algorithm, params, encoded in settings(args):
+        hasher = PasswordHasher(algorithm, workers=args.workers, queue_limit=args.clients + 1,
+                                server_threads=args.clients + 2, **params)
+        encoded = encoded or hasher.hasher.hash(PASSWORD)
+        rate, median_ms = run(hasher, encoded, args.clients, args.seconds)
+        hasher.stop()
+        print(f"{label:<18} {rate:>10,.1f} {median_ms:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
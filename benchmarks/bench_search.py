@@ -0,0 +1,112 @@
+"""
+文章搜尋效能測試：比較 q= 全文搜尋 (search_vector + GIN) 與原本的 ILIKE '%...%'。
+
+用法 (於專案根目錄，請連到測試用資料庫)：
+    python -m benchmarks.bench_search --seed 500000          # 產生 50 萬篇測試文章
+    python -m benchmarks.bench_search --rounds 50            # 執行查詢比較
+    python -m benchmarks.bench_search --cleanup              # 刪除測試文章
+
+測試文章的標題以 [bench] 開頭，需先有至少一位使用者。
+"""
+import argparse
+import statistics
+import time
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_handler import DBHandler
+
+BENCH_PREFIX = '[bench]'
+# 產生測試內容用的常見中文字
+CHARS = '醫院部門公告說明文件補助申請會議紀錄研討報名智慧醫療系統資料查詢評鑑營養人資助手病歷護理藥劑檢驗放射門診住院急診健康教育訓練計畫'
+KEYWORDS = ['補助', '研討會', '智慧醫療', '評鑑', 'report']
+
+
+def seed(db, count, batch=50000):
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT id FROM users ORDER BY id LIMIT 1;")
+        row = cur.fetchone()
+        if not row:
+            raise SystemExit("請先建立至少一位使用者")
+        user_id = row[0]
+        n = len(CHARS)
+        for start in range(0, count, batch):
+            size = min(batch, count - start)
+            # 以隨機字元組成標題與 HTML 內文，並在部分文章中插入關鍵字
+            cur.execute("""
+                INSERT INTO posts (title, content, user_id, status, announcement_date)
+                SELECT
+                    %s || ' ' || g || ' ' || (SELECT string_agg(substr(%s, (random() * (%s - 1))::int + 1, 1), '')
+                                              FROM generate_series(1, 12) WHERE g > 0),
+                    '<p>' || (SELECT string_agg(substr(%s, (random() * (%s - 1))::int + 1, 1), '')
+                              FROM generate_series(1, 300) WHERE g > 0)
+                          || CASE WHEN g %% 50 = 0 THEN (%s::text[])[(g / 50) %% %s + 1] ELSE '' END || '</p>',
+                    %s,
+                    'published',
+                    NOW() - (g || ' minutes')::interval
+                FROM generate_series(%s, %s) AS g;
+            """, (BENCH_PREFIX, CHARS, n, CHARS, n, KEYWORDS, len(KEYWORDS), user_id, start + 1, start + size))
+            db.conn.commit()
+            print(f"已新增 {start + size}/{count} 篇測試文章")
+        # 直接寫入 posts，需另外建立列表卡片 (post_cards)
+        cur.execute("SELECT refresh_post_cards(ARRAY(SELECT id FROM posts WHERE title LIKE %s));", (BENCH_PREFIX + '%',))
+        cur.execute("ANALYZE posts, post_cards;")
+        db.conn.commit()
+
+
+def cleanup(db):
+    with db.conn.cursor() as cur:
+        cur.execute("DELETE FROM posts WHERE title LIKE %s;", (BENCH_PREFIX + '%',))
+        print(f"已刪除 {cur.rowcount} 篇測試文章")
+    db.conn.commit()
+
+
+def timed(db, sql, params, rounds):
+    timings = []
+    with db.conn.cursor() as cur:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            cur.execute(sql, params)
+            cur.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+    db.conn.rollback()
+    timings.sort()
+    return statistics.mean(timings), timings[len(timings) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="posts search benchmark")
+    parser.add_argument('--seed', type=int, default=0, help="產生幾篇測試文章")
+    parser.add_argument('--cleanup', action='store_true', help="刪除測試文章")
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    with DBHandler() as db:
+        if args.cleanup:
+            cleanup(db)
+            return
+        if args.seed:
+            seed(db, args.seed)
+
+        with db.conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) FROM posts;")
+            print(f"posts 總筆數: {cur.fetchone()[0]}")
+
+        ilike_sql = """
+            SELECT id FROM posts WHERE title ILIKE %s OR content ILIKE %s
+            ORDER BY announcement_date DESC LIMIT 10;
+        """
+        search_sql = """
+            SELECT id FROM posts WHERE search_vector @@ plainto_tsquery('simple', search_tokens(%s))
+            ORDER BY ts_rank(search_vector, plainto_tsquery('simple', search_tokens(%s))) DESC, id DESC LIMIT 10;
+        """
+        print(f"{'keyword':<12}{'ILIKE avg':>12}{'ILIKE p50':>12}{'q avg':>12}{'q p50':>12}  (ms)")
+        for kw in KEYWORDS:
+            ilike = timed(db, ilike_sql, (f'%{kw}%', f'%{kw}%'), args.rounds)
+            search = timed(db, search_sql, (kw, kw), args.rounds)
+            print(f"{kw:<12}{ilike[0]:>12.2f}{ilike[1]:>12.2f}{search[0]:>12.2f}{search[1]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+簡易 HTTP 壓力測試，用來比較 wsgi.py / server.py 的執行緒數與程序數設定。
+
+用法 (於專案根目錄)：
+    # 對正在執行的伺服器送出請求 (64 個並行連線，持續 10 秒)
+    python -m benchmarks.load_test client http://127.0.0.1:5004/api/posts --concurrency 64 --duration 10
+
+    # 不連資料庫，以模擬 I/O 延遲 (預設 50ms) + 少量 CPU 的假應用程式測試伺服器設定本身
+    WSGI_THREADS=2 python -m benchmarks.load_test sleep-app --port 5099
+    WSGI_THREADS=8 WSGI_PROCESSES=4 python -m benchmarks.load_test sleep-app --port 5099
+"""
+import argparse
+import http.client
+import logging
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run_client(url, concurrency, duration):
+    parts = urlsplit(url)
+    path = parts.path + ('?' + parts.query if parts.query else '')
+    deadline = time.monotonic() + duration
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker():
+        conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        local, failed = [], 0
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                resp = conn.getresponse()
+                resp.read()
+                if resp.status >= 500:
+                    failed += 1
+                else:
+                    local.append(time.perf_counter() - start)
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    if not latencies:
+        print(f"沒有成功的請求 (errors={errors[0]})")
+        return
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(f"requests={len(latencies)} errors={errors[0]} rps={len(latencies) / duration:.1f} "
+          f"p50={pct(0.50):.1f}ms p99={pct(0.99):.1f}ms max={latencies[-1] * 1000:.1f}ms")
+
+
+def sleep_app(delay):
+    """模擬一個查詢資料庫約 delay 秒的 API"""
+    body = b'{"status": 200, "success": true}'
+
+    def app(environ, start_response):
+        time.sleep(delay)
+        sum(range(2000))  # 少量 CPU 工作 (序列化等)
+        start_response('200 OK', [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))])
+        return [body]
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test")
+    sub = parser.add_subparsers(dest='command', required=True)
+    client = sub.add_parser('client', help="送出請求並統計")
+    client.add_argument('url')
+    client.add_argument('--concurrency', type=int, default=64)
+    client.add_argument('--duration', type=float, default=10)
+    fake = sub.add_parser('sleep-app', help="以 server.py 執行模擬延遲的假應用程式")
+    fake.add_argument('--port', type=int, default=5099)
+    fake.add_argument('--delay', type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.command == 'client':
+        run_client(args.url, args.concurrency, args.duration)
+    else:
+        from server import serve, SERVER_CONFIG
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+        config = dict(SERVER_CONFIG, port=args.port)
+        serve(sleep_app(args.delay), config=config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from datetime import date, datetime
+from db_handler import DBHandler, EXPORT_QUERIES, EXPORT_ITERSIZE
+
+# 批次匯入 / 匯出 (NDJSON 或 CSV，依副檔名判斷，也可用 --format 指定；檔名為 - 時使用 stdin / stdout)
+#   python bulk_io.py import posts.ndjson --user-id 1     匯入文章 (COPY 到暫存資料表後整批合併)
+#   python bulk_io.py export posts -o posts.ndjson        匯出文章 (含標籤與檔案)，另可匯出 files、bulletin_messages
+# 匯入的欄位與匯出的 posts 相同 (見 DBHandler.import_posts)；CSV 的 hashtags / files 欄位為 JSON 陣列。
+# 處理筆數與每秒筆數輸出到 stderr。
+
+# 每隔幾筆輸出一次進度
+PROGRESS_EVERY = 100000
+# 串流回應每次送出的大約大小 (bytes)，避免每一列都寫一次 socket
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# CSV 中以 JSON 字串存放的欄位
+JSON_FIELDS = ('hashtags', 'files', 'renditions')
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def to_ndjson(row):
+    """一列資料轉成一行 NDJSON"""
+    return json.dumps(row, ensure_ascii=False, default=_json_default) + '\n'
+
+
+def to_csv_lines(rows):
+    """逐列產生 CSV 文字 (第一列為欄位名稱)，一次只保留一列"""
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.writer(buffer)
+            writer.writerow(row.keys())
+        writer.writerow([
+            json.dumps(v, ensure_ascii=False, default=_json_default) if k in JSON_FIELDS and v is not None
+            else v.isoformat() if isinstance(v, (datetime, date)) else v
+            for k, v in row.items()
+        ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def chunked(lines, size=STREAM_CHUNK_SIZE):
+    """將逐列的文字合併成約 size 大小的區塊"""
+    parts, length = [], 0
+    for line in lines:
+        parts.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(parts)
+            parts, length = [], 0
+    if parts:
+        yield ''.join(parts)
+
+
+def read_ndjson(f):
+    for number, line in enumerate(f, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"第 {number} 行不是有效的 JSON: {e}") from None
+
+
+def read_csv(f):
+    reader = csv.DictReader(f)
+    for row in reader:
+        record = {k: (v if v != '' else None) for k, v in row.items()}
+        for field in JSON_FIELDS:
+            if record.get(field):
+                try:
+                    record[field] = json.loads(record[field])
+                except ValueError as e:
+                    raise ValueError(f"第 {reader.line_num} 行的 {field} 欄位不是有效的 JSON: {e}") from None
+        yield record
+
+
+class Throughput:
+    """計算處理筆數與每秒筆數，每 PROGRESS_EVERY 筆輸出一次進度"""
+
+    def __init__(self, label):
+        self.label = label
+        self.rows = 0
+        self.start = time.perf_counter()
+
+    def count(self, items):
+        for item in items:
+            self.rows += 1
+            if self.rows % PROGRESS_EVERY == 0:
+                self.report(final=False)
+            yield item
+
+    def report(self, final=True):
+        elapsed = time.perf_counter() - self.start
+        rate = self.rows / elapsed if elapsed > 0 else 0
+        print(f"{self.label}{'完成' if final else '中'}: {self.rows} 筆，{elapsed:.1f} 秒，{rate:,.0f} 筆/秒", file=sys.stderr)
+
+
+def _open(path, mode):
+    if path == '-':
+        stream = sys.stdin if 'r' in mode else sys.stdout
+        return io.TextIOWrapper(stream.buffer, encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def _format(path, fmt):
+    return fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+
+
+def run_import(path, fmt=None, user_id=None):
+    meter = Throughput("匯入文章")
+    with _open(path, 'r') as f, DBHandler() as db:
+        reader = read_csv(f) if _format(path, fmt) == 'csv' else read_ndjson(f)
+        result = db.import_posts(meter.count(reader), default_user_id=user_id)
+    if result is None:
+        return 1
+    meter.report()
+    print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+    return 0
+
+
+def run_export(table, path, fmt=None, itersize=EXPORT_ITERSIZE):
+    meter = Throughput(f"匯出 {table}")
+    with _open(path, 'w') as f, DBHandler() as db:
+        rows = meter.count(db.iter_export(table, itersize=itersize))
+        lines = to_csv_lines(rows) if _format(path, fmt) == 'csv' else map(to_ndjson, rows)
+        f.writelines(lines)
+    meter.report()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批次匯入 / 匯出文章、檔案與布告欄留言")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_import = sub.add_parser('import', help="匯入文章")
+    p_import.add_argument('path', help="NDJSON / CSV 檔案 (- 為 stdin)")
+    p_import.add_argument('--format', choices=['ndjson', 'csv'])
+    p_import.add_argument('--user-id', type=int, help="資料沒有 user_id 時使用的發布者")
+    p_export = sub.add_parser('export', help="匯出資料表")
+    p_export.add_argument('table', choices=sorted(EXPORT_QUERIES))
+    p_export.add_argument('-o', '--output', default='-', help="輸出檔案 (預設 stdout)")
+    p_export.add_argument('--format', choices=['ndjson', 'csv'])
+    p_export.add_argument('--itersize', type=int, default=EXPORT_ITERSIZE, help="server-side cursor 每次取回的筆數")
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        return run_import(args.path, args.format, args.user_id)
+    return run_export(args.table, args.output, args.format, args.itersize)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import os
+import time
+import select
+import threading
+import psycopg2
+import psycopg2.extensions
+from dotenv import load_dotenv
+from db_handler import DBHandler, DB_CONFIG, CATEGORY_CHANNEL
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+# 分類快取存活秒數 (分類一年只會改幾次，主要靠寫入時的主動失效)
+CATEGORY_CACHE_TTL = float(os.getenv('CATEGORY_CACHE_TTL', 600))
+# 是否以 PostgreSQL LISTEN/NOTIFY 讓多個 worker 程序的快取同步失效 (1/true 開啟)
+CATEGORY_LISTEN = os.getenv('CATEGORY_LISTEN', '0').lower() in ('1', 'true', 'yes')
+
+
+class CategoryCache:
+    """
+    分類的行程內快取 (TTL + 主動失效)。
+    一次載入全部分類，並預先建立 category_type -> 子分類名稱列表，
+    供 GET /api/categories 與 GET /api/posts?category_type= 直接使用。
+    """
+
+    def __init__(self, ttl=CATEGORY_CACHE_TTL):
+        self.ttl = ttl
+        self._snapshot = None
+        self._last_good = None      # 最近一次成功載入的資料，重新載入失敗時暫時沿用
+        self._loaded_at = 0.0
+        self._version = 0
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def _load(self):
+        with DBHandler() as db:
+            rows = db.get_categories_by_type()
+        if rows is None:
+            # 不把查詢失敗當成「沒有分類」快取起來
+            raise RuntimeError("載入分類失敗")
+        rows = [dict(row) for row in rows]
+        by_type = {}
+        for row in rows:
+            by_type.setdefault(row['category_type'], []).append(row)
+        return {
+            'rows': rows,
+            'by_type': by_type,
+            'names_by_type': {t: [r['name'] for r in items] for t, items in by_type.items()},
+        }
+
+    def _get_snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._loaded_at < self.ttl:
+            return snapshot
+        with self._lock:
+            # 取得鎖後再檢查一次，避免多個執行緒同時重新載入
+            if self._snapshot is not None and time.monotonic() - self._loaded_at < self.ttl:
+                return self._snapshot
+            version = self._version
+            try:
+                snapshot = self._load()
+            except Exception as e:
+                # 資料庫暫時無法使用時沿用上一份資料 (不更新載入時間，下次讀取再重試)；從未載入成功則拋出
+                if self._last_good is None:
+                    raise
+                print(f"重新載入分類失敗，沿用先前的資料: {e}")
+                return self._last_good
+            self._last_good = snapshot
+            # 載入期間若有人呼叫 invalidate()，這份資料可能已過時，只回傳不保留
+            if version == self._version:
+                self._snapshot = snapshot
+                self._loaded_at = time.monotonic()
+            return snapshot
+
+    def get_categories(self, category_type=None):
+        """取得分類列表 (格式與 DBHandler.get_categories_by_type 相同)"""
+        snapshot = self._get_snapshot()
+        if category_type:
+            return list(snapshot['by_type'].get(category_type, []))
+        return list(snapshot['rows'])
+
+    def names_for_type(self, category_type):
+        """取得某父類別下所有子分類名稱，用於 category_name = ANY(...) 篩選"""
+        return list(self._get_snapshot()['names_by_type'].get(category_type, []))
+
+    def invalidate(self):
+        """讓快取失效，下次讀取時重新載入"""
+        with self._lock:
+            self._version += 1
+            self._snapshot = None
+
+    # --- 多程序同步 (LISTEN/NOTIFY) ---
+    def start_listener(self, config=None):
+        """
+        啟動背景執行緒 LISTEN 分類異動通知。
+        DBHandler.insert_category / delete_category 會在同一個交易中 NOTIFY，其他 worker 收到後讓快取失效。
+        """
+        if self._listener and self._listener.is_alive():
+            return
+        self._listener = threading.Thread(target=self._listen, args=(config or DB_CONFIG,), name='category-listener', daemon=True)
+        self._listener.start()
+
+    def _listen(self, config):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**config)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CATEGORY_CHANNEL};")
+                # 重新連線期間可能漏掉通知，保守起見直接失效
+                self.invalidate()
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    if conn.notifies:
+                        conn.notifies.clear()
+                        self.invalidate()
+            except psycopg2.Error as e:
+                print(f"分類異動監聽連線中斷，5 秒後重試: {e}")
+                time.sleep(5)
+            finally:
+                if conn is not None and not conn.closed:
+                    conn.close()
+
+
+category_cache = CategoryCache()
@@ -0,0 +1,81 @@
+import os
+import atexit
+import threading
+from collections import Counter
+from dotenv import load_dotenv
+from db_handler import DBHandler
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+# 點擊數寫回資料庫的間隔秒數
+CLICK_FLUSH_INTERVAL = float(os.getenv('CLICK_FLUSH_INTERVAL', 10))
+
+
+class ClickCounter:
+    """
+    文章點擊數的寫回快取 (write-behind)。
+    瀏覽文章時只在記憶體中累加，由背景執行緒定期以一條批次 UPDATE 寫回 posts.click_count，
+    避免每次瀏覽都對同一列加鎖寫入。
+    """
+
+    def __init__(self, interval=CLICK_FLUSH_INTERVAL):
+        self.interval = interval
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """啟動背景寫回執行緒 (重複呼叫不會建立多個)。"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='click-counter', daemon=True)
+            self._thread.start()
+
+    def record(self, post_id, count=1):
+        """記錄一次瀏覽。"""
+        with self._lock:
+            self._pending[post_id] += count
+        if self._thread is None:
+            self.start()
+
+    def pending(self, post_id):
+        """取得尚未寫回資料庫的點擊數，讓回應中的 click_count 保持即時。"""
+        with self._lock:
+            return self._pending.get(post_id, 0)
+
+    def flush(self):
+        """將累積的點擊數一次寫回資料庫；失敗時把計數放回，下次再寫。"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, Counter()
+        try:
+            with DBHandler() as db:
+                updated = db.add_click_counts(dict(batch))
+        except Exception as e:
+            print(f"寫回點擊數時發生錯誤: {e}")
+            updated = None
+        if updated is None:
+            with self._lock:
+                self._pending.update(batch)
+            return 0
+        return updated
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def stop(self):
+        """停止背景執行緒並做最後一次寫回 (關機時呼叫)。"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 5)
+        self.flush()
+
+
+click_counter = ClickCounter()
+atexit.register(click_counter.stop)
@@ -3,9 +3,16 @@ import psycopg2.extras
 import os
 import hashlib
 from dotenv import load_dotenv
-from datetime import date, datetime
+from datetime import date, timedelta
 import re
 import json
+import itertools
+import base64
+import binascii
+import tempfile
+from db_pool import get_pool
+from cache import LRUCache
+from passwords import password_hasher, HasherBusy
 
 # 載入 .env 檔案中的環境變數
 load_dotenv()
@@ -19,37 +26,248 @@ DB_CONFIG = {
     'port': os.getenv('DB_PORT'),
 }
 
+# 標籤名稱 -> id 的行程內快取 (標籤一旦建立就不會改 id，只快取已提交的標籤)
+TAG_CACHE = LRUCache(maxsize=int(os.getenv('TAG_CACHE_SIZE', 2048)))
+
+# 分類異動時 NOTIFY 的頻道，供 category_cache 在多個 worker 程序間同步失效
+CATEGORY_CHANNEL = 'category_changed'
+
+# migration SQL 檔所在資料夾 (檔名格式: 0001_說明.sql)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+# 套用 migration 時使用的 advisory lock 編號
+MIGRATION_LOCK_ID = 4201001
+
+# posts 對外回傳的欄位 (不含 search_vector 等內部欄位)
+POST_COLUMNS = "id, title, content, user_id, category_name, status, click_count, announcement_date"
+
+# 全文搜尋的 tsquery：以 search_tokens() 斷詞 (中文切成二字詞，單一中文字保留單字)；
+# search_vector 以 search_index_tokens() 建立，另外含每個中文字，因此單字查詢也能命中 (migrations/0013)
+SEARCH_TSQUERY = "plainto_tsquery('simple', search_tokens(%s))"
+
+# get_posts 是否預設使用單一 SQL 查詢 (1/true 開啟)
+POSTS_SINGLE_QUERY = os.getenv('POSTS_SINGLE_QUERY', '0').lower() in ('1', 'true', 'yes')
+# get_posts 是否預設讀取 post_cards 讀取模型 (migrations/0011)；0 時改回即時 JOIN posts / files / hashtags
+POSTS_READ_MODEL = os.getenv('POSTS_READ_MODEL', '1').lower() in ('1', 'true', 'yes')
+# post_cards 對外回傳的欄位 (不含 search_vector)
+POST_CARD_COLUMNS = ("id, title, user_id, category_name, category_type, status, click_count, announcement_date, "
+                     "cover_image, attachment_count, hashtags")
+
+# 列表總數：row_counts 計數表涵蓋的篩選組合 (欄位依字母排序，與 migrations/0008 的 *_count_keys 一致)
+COUNTED_DIMENSIONS = {
+    'posts': {'', 'status', 'category_name', 'user_id', 'category_name,status'},
+    'files': {'', 'file_type'},
+    'bulletin_messages': {'', 'campus', 'department', 'campus,department'},
+}
+# 其他篩選條件改用 planner 估計筆數；估計值不超過此數時以有上限的 COUNT 取得精確值 (成本很低)
+COUNT_EXACT_THRESHOLD = int(os.getenv('COUNT_EXACT_THRESHOLD', 1000))
+
+# 依月份分區的資料表 (migrations/0010)：分區欄位，以及移除分區時要從 row_counts 扣除的計數 key (沒有計數表則為 None)
+PARTITIONED_TABLES = {
+    'user_logs': {'column': 'action_time', 'count_keys': None},
+    'bulletin_messages': {'column': 'created_at', 'count_keys': 'bulletin_messages_count_keys(r.campus, r.department)'},
+}
+# 分區維護 (建立 / 移除分區) 使用的 advisory lock 編號，多個程序同時執行時依序進行
+PARTITION_LOCK_ID = 4201002
+
+# 批次匯入時暫存 COPY 資料的記憶體上限 (bytes)，超過後改寫入暫存檔
+IMPORT_SPOOL_BYTES = int(os.getenv('IMPORT_SPOOL_BYTES', 16 * 1024 * 1024))
+# 匯出時 server-side cursor 每次取回的筆數
+EXPORT_ITERSIZE = int(os.getenv('EXPORT_ITERSIZE', 5000))
+
+# 可匯出的資料表與查詢 (依主鍵 / 時間排序，可直接沿索引串流，不需排序整張表)
+# posts 的 hashtags / files 欄位格式與 import_posts 相同，匯出的檔案可直接再匯入
+EXPORT_QUERIES = {
+    'posts': f"""
+        SELECT {', '.join('p.' + c.strip() for c in POST_COLUMNS.split(','))},
+               ARRAY(SELECT h.tag_name FROM post_hashtags ph JOIN hashtags h ON h.id = ph.hashtag_id
+                     WHERE ph.post_id = p.id ORDER BY h.tag_name) AS hashtags,
+               COALESCE((SELECT json_agg(json_build_object(
+                             'id', f.id, 'file_type', f.file_type, 'file_path', f.file_path,
+                             'original_filename', f.original_filename, 'file_size', f.file_size, 'sha256', f.sha256
+                         ) ORDER BY f.id)
+                         FROM files f WHERE f.post_id = p.id), '[]') AS files
+        FROM posts p WHERE {{where}} ORDER BY p.id;
+    """,
+    'files': "SELECT id, post_id, file_type, file_path, original_filename, file_size, sha256, renditions FROM files WHERE {where} ORDER BY id;",
+    'bulletin_messages': "SELECT id, author_name, content, department, campus, created_at FROM bulletin_messages WHERE {where} ORDER BY created_at, id;",
+}
+
+def _copy_row(values):
+    """將一列資料轉成 COPY text 格式的一行 (None 為 \\N，跳脫反斜線、tab 與換行)"""
+    fields = []
+    for value in values:
+        if value is None:
+            fields.append('\\N')
+        else:
+            fields.append(str(value).replace('\\', '\\\\').replace('\t', '\\t')
+                          .replace('\n', '\\n').replace('\r', '\\r'))
+    return '\t'.join(fields) + '\n'
+
+def encode_cursor(key, values):
+    """
+    產生不透明的分頁游標 (keyset pagination)。
+    key 為排序欄位名稱，values 為最後一筆資料的 [排序欄位值, id]。
+    """
+    raw = json.dumps([key, values], default=str, ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, key):
+    """解析分頁游標，排序欄位不符或格式錯誤時拋出 ValueError。"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        cursor_key, values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, binascii.Error, UnicodeError):
+        raise ValueError("無效的分頁游標")
+    if cursor_key != key or not isinstance(values, list) or len(values) != 2:
+        raise ValueError("分頁游標與目前的排序方式不符")
+    return values
+
+
+# check_query_plans 檢查的常用查詢 (名稱: (SQL, 範例參數))，對應 DBHandler 中實際的 WHERE / ORDER BY
+HOT_QUERIES = {
+    'get_post.files': ("SELECT id FROM files WHERE post_id = %s AND file_type = 'attachments'", (1,)),
+    'get_posts.files': ("SELECT * FROM files WHERE post_id = ANY(%s) AND file_type = 'images' ORDER BY id", ([1, 2, 3],)),
+    'get_files.file_type': ("SELECT id FROM files WHERE file_type = %s ORDER BY id LIMIT 10", ('images',)),
+    'get_posts.category_status': (
+        "SELECT id FROM posts WHERE category_name = ANY(%s) AND status = %s ORDER BY announcement_date DESC, id DESC LIMIT 10",
+        (['補助文件'], 'published')),
+    'get_posts.status': ("SELECT id FROM posts WHERE status = %s ORDER BY announcement_date DESC, id DESC LIMIT 10", ('published',)),
+    'get_posts.user_id': ("SELECT id FROM posts WHERE user_id = %s", (1,)),
+    'get_posts.q': (f"SELECT id FROM posts WHERE search_vector @@ {SEARCH_TSQUERY}", ('補助',)),
+    'post_cards': ("SELECT id FROM post_cards ORDER BY announcement_date DESC, id DESC LIMIT 10", ()),
+    'post_cards.category_status': (
+        "SELECT id FROM post_cards WHERE category_name = ANY(%s) AND status = %s ORDER BY announcement_date DESC, id DESC LIMIT 10",
+        (['補助文件'], 'published')),
+    'post_cards.q': (f"SELECT id FROM post_cards WHERE search_vector @@ {SEARCH_TSQUERY}", ('補助',)),
+    'post_hashtags.hashtag_id': ("SELECT post_id FROM post_hashtags WHERE hashtag_id = %s", (1,)),
+    'get_bulletin_messages': ("SELECT id FROM bulletin_messages ORDER BY created_at DESC, id DESC LIMIT 10", ()),
+    'get_bulletin_messages.range': (
+        "SELECT id FROM bulletin_messages WHERE created_at >= %s AND created_at < %s ORDER BY created_at DESC, id DESC LIMIT 10",
+        ('2025-01-01', '2025-01-02')),
+    'get_bulletin_messages.campus_department': (
+        "SELECT id FROM bulletin_messages WHERE campus = %s AND department = %s AND created_at >= %s AND created_at < %s "
+        "ORDER BY created_at DESC, id DESC LIMIT 10",
+        ('義大醫院', '智慧醫療部', '2025-01-01', '2025-02-01')),
+    'get_bulletin_messages.department': (
+        "SELECT id FROM bulletin_messages WHERE department = %s ORDER BY created_at DESC, id DESC LIMIT 10", ('智慧醫療部',)),
+    'refresh_tokens.expires_at': ("SELECT id FROM refresh_tokens WHERE expires_at < NOW()", ()),
+    'user_logs.user_id': ("SELECT id FROM user_logs WHERE user_id = %s", (1,)),
+}
+
+
 class DBHandler:
     def __init__(self, config=None):
         self.config = config or DB_CONFIG
         self.conn = None
+        self.pool = None
 
     def __enter__(self):
-        """進入 'with' 區塊時自動建立連線。"""
+        """進入 'with' 區塊時從連線池借出連線。"""
         try:
-            self.conn = psycopg2.connect(**self.config)
+            self.pool = get_pool(self.config)
+            self.conn = self.pool.getconn()
             return self
         except psycopg2.OperationalError as e:
             print(f"錯誤：無法連接到資料庫 '{self.config.get('dbname')}'.\n{e}")
             raise
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        """離開 'with' 區塊時自動關閉連線。"""
+        """離開 'with' 區塊時將連線歸還連線池 (未提交的交易會被 rollback)。"""
         if self.conn:
-            self.conn.close()
+            # 區塊內發生資料庫連線層級的錯誤時，直接丟棄這條連線
+            discard = exc_type is not None and issubclass(exc_type, psycopg2.OperationalError)
+            self.pool.putconn(self.conn, discard=discard)
+            self.conn = None
+
+    # --- 資料庫版本管理 (migrations) ---
+    def _migration_files(self):
+        """列出 migrations 資料夾中的 SQL 檔，回傳 [(版本號, 檔名)]，依版本排序"""
+        migrations = []
+        for name in os.listdir(MIGRATIONS_DIR):
+            match = re.match(r'^(\d+)_.+\.sql$', name)
+            if match:
+                migrations.append((int(match.group(1)), name))
+        return sorted(migrations)
+
+    def applied_migrations(self):
+        """取得已套用的 migration 版本"""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    name VARCHAR(255) NOT NULL,
+                    applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+                );
+            """)
+            cur.execute("SELECT version FROM schema_migrations;")
+            versions = {row[0] for row in cur.fetchall()}
+        self.conn.commit()
+        return versions
 
     def setup_database(self):
-        """從 schema.sql 檔案讀取並執行 SQL 腳本"""
+        """
+        依序套用 migrations 資料夾中尚未執行的 SQL 檔 (不會刪除既有資料)。
+        每個 migration 在自己的交易中執行並記錄到 schema_migrations；
+        以 advisory lock 避免多個程序同時升級。回傳本次套用的檔名列表，失敗回傳 None。
+        """
+        applied = []
         try:
-            with open('schema.sql', 'r', encoding='utf-8') as f:
-                sql_script = f.read()
-            with self.conn.cursor() as cur:
-                cur.execute(sql_script)
-            self.conn.commit()
-            print("資料庫資料表已成功從 schema.sql 建立！")
+            done = self.applied_migrations()
+            for version, name in self._migration_files():
+                if version in done:
+                    continue
+                with open(os.path.join(MIGRATIONS_DIR, name), 'r', encoding='utf-8') as f:
+                    sql_script = f.read()
+                with self.conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_xact_lock(%s);", (MIGRATION_LOCK_ID,))
+                    # 取得鎖後再確認一次，其他程序可能已經套用過
+                    cur.execute("SELECT 1 FROM schema_migrations WHERE version = %s;", (version,))
+                    if cur.fetchone():
+                        self.conn.rollback()
+                        continue
+                    cur.execute(sql_script)
+                    cur.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);", (version, name))
+                self.conn.commit()
+                applied.append(name)
+                print(f"已套用 migration: {name}")
+            if not applied:
+                print("資料庫已是最新版本。")
+            return applied
         except Exception as e:
-            print(f"執行 schema.sql 時發生錯誤: {e}")
+            print(f"執行 migration 時發生錯誤: {e}")
+            self.conn.rollback()
+            return None
+
+    def check_query_plans(self):
+        """
+        以 EXPLAIN 檢查 HOT_QUERIES 中的常用查詢是否會對大資料表做循序掃描 (Seq Scan)。
+        檢查時關閉 enable_seqscan，若仍出現 Seq Scan 表示沒有可用的索引 (小資料表上 planner 本來就可能選擇循序掃描)。
+        回傳 [{'query': 名稱, 'table': 資料表}]，空列表代表全部可走索引。
+        """
+        findings = []
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("SET LOCAL enable_seqscan = off;")
+                for name, (sql, params) in HOT_QUERIES.items():
+                    cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                    plan = cur.fetchone()[0]
+                    if isinstance(plan, str):
+                        plan = json.loads(plan)
+                    nodes = [plan[0]['Plan']]
+                    while nodes:
+                        node = nodes.pop()
+                        if node.get('Node Type') == 'Seq Scan':
+                            findings.append({'query': name, 'table': node.get('Relation Name')})
+                        nodes.extend(node.get('Plans', []))
+            self.conn.rollback()
+        except psycopg2.Error as e:
             self.conn.rollback()
+            print(f"檢查查詢計畫時發生錯誤: {e}")
+            return None
+        for f in findings:
+            print(f"警告：查詢 '{f['query']}' 對資料表 {f['table']} 使用循序掃描")
+        return findings
 
     # --- Users Management ---
     def find_user(self, user_id=None, account=None):
@@ -83,21 +301,39 @@ class DBHandler:
             return None
         
     def check_password(self, account, password):
-        """【新功能】檢查帳號密碼是否正確"""
+        """【新功能】檢查帳號密碼是否正確；舊版或成本參數過時的雜湊在登入成功時自動升級"""
         user = self.find_user(account=account)
-        if not user:
+        # 帳號不存在時仍進行一次驗證，回應時間與密碼錯誤相同
+        if not password_hasher.verify(password, user['password_hash'] if user else None):
             return None
-        
-        password_hash = self._hash_password(password)
-        if password_hash == user['password_hash']:
-            # 不回傳密碼雜湊
-            user.pop('password_hash', None)
-            return user
-        return None
+        if password_hasher.needs_rehash(user['password_hash']):
+            try:
+                self._update_password_hash(user['id'], password_hasher.hash(password), user['password_hash'])
+            except HasherBusy:
+                # 密碼已驗證成功，雜湊忙碌時略過升級，下次登入再升級
+                pass
+        # 不回傳密碼雜湊
+        user.pop('password_hash', None)
+        return user
+
+    def _update_password_hash(self, user_id, password_hash, old_hash):
+        """寫入升級後的雜湊；只在雜湊未被其他請求改過時更新"""
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s;",
+                    (password_hash, user_id, old_hash)
+                )
+            self.conn.commit()
+            return True
+        except psycopg2.Error as e:
+            print(f"更新密碼雜湊時發生錯誤: {e}")
+            self.conn.rollback()
+            return False
 
     def _hash_password(self, password):
-        """使用 SHA-256 對密碼進行雜湊"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """以 PASSWORD_HASHER 設定的演算法 (預設 scrypt) 雜湊密碼，見 passwords.py"""
+        return password_hasher.hash(password)
 
     def create_user(self, name, account, password, permission='viewer', campus=None, department=None):
 
@@ -125,12 +361,30 @@ class DBHandler:
             return None
     
     # --- 【新功能】Refresh Token Management ---
-    def store_refresh_token(self, user_id, token, expires_at):
-        """儲存 Refresh Token 到資料庫"""
+    # 資料庫只保存 token 的 SHA-256，資料外洩時無法拿來換發 access token
+    @staticmethod
+    def _hash_token(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def store_refresh_token(self, user_id, token, expires_at, max_per_user=None):
+        """
+        儲存 Refresh Token (新的登入 = 新的 family)。
+        max_per_user: 每位使用者最多保留幾個有效 token，超過時撤銷最舊的。
+        """
         try:
             with self.conn.cursor() as cur:
-                sql = "INSERT INTO refresh_tokens (user_id, token, expires_at) VALUES (%s, %s, %s);"
-                cur.execute(sql, (user_id, token, expires_at))
+                sql = "INSERT INTO refresh_tokens (user_id, token_hash, expires_at) VALUES (%s, %s, %s);"
+                cur.execute(sql, (user_id, self._hash_token(token), expires_at))
+                if max_per_user:
+                    cur.execute("""
+                        UPDATE refresh_tokens SET revoked_at = NOW()
+                        WHERE id IN (
+                            SELECT id FROM refresh_tokens
+                            WHERE user_id = %s AND revoked_at IS NULL
+                            ORDER BY created_at DESC, id DESC
+                            OFFSET %s
+                        );
+                    """, (user_id, max_per_user))
             self.conn.commit()
             return True
         except psycopg2.Error as e:
@@ -138,29 +392,193 @@ class DBHandler:
             print(f"儲存 Refresh Token 時發生錯誤: {e}")
             return False
 
+    def rotate_refresh_token(self, token, new_token, expires_at):
+        """
+        以舊 token 換發新 token (同一個交易)：舊 token 標記為已撤銷，新 token 沿用同一個 family。
+        回傳使用者 {'id', 'permission'}；token 無效、過期或已被輪替過時回傳 None。
+        已被輪替過的 token 再次出現代表可能遭竊，撤銷整個 family (該次登入的所有 token)。
+        """
+        try:
+            with self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute("""
+                    SELECT rt.id, rt.user_id, rt.family_id, rt.revoked_at, rt.expires_at > NOW() AS active, u.permission
+                    FROM refresh_tokens rt JOIN users u ON u.id = rt.user_id
+                    WHERE rt.token_hash = %s
+                    FOR UPDATE OF rt;
+                """, (self._hash_token(token),))
+                row = cur.fetchone()
+                if row is None or not row['active']:
+                    self.conn.rollback()
+                    return None
+                if row['revoked_at'] is not None:
+                    cur.execute("UPDATE refresh_tokens SET revoked_at = NOW() WHERE family_id = %s AND revoked_at IS NULL;",
+                                (row['family_id'],))
+                    self.conn.commit()
+                    print(f"警告：使用者 {row['user_id']} 的 Refresh Token 被重複使用，已撤銷該次登入的所有 token")
+                    return None
+                cur.execute("UPDATE refresh_tokens SET revoked_at = NOW() WHERE id = %s;", (row['id'],))
+                cur.execute(
+                    "INSERT INTO refresh_tokens (user_id, token_hash, expires_at, family_id) VALUES (%s, %s, %s, %s);",
+                    (row['user_id'], self._hash_token(new_token), expires_at, row['family_id'])
+                )
+            self.conn.commit()
+            return {'id': row['user_id'], 'permission': row['permission']}
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            print(f"換發 Refresh Token 時發生錯誤: {e}")
+            return None
+
     def validate_refresh_token(self, token):
         """驗證 Refresh Token 是否有效且未過期"""
+        user = self.get_refresh_token_user(token)
+        return user['id'] if user else None
+
+    def get_refresh_token_user(self, token):
+        """
+        驗證 Refresh Token 並取得簽發 access token 所需的使用者欄位 (id, permission)，
+        以 refresh_tokens.token_hash 的唯一索引一次查詢完成。無效、過期或已撤銷時回傳 None。
+        """
         try:
             with self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                sql = "SELECT user_id FROM refresh_tokens WHERE token = %s AND expires_at > %s;"
-                cur.execute(sql, (token, datetime.now(datetime.timezone.utc)))
+                cur.execute("""
+                    SELECT u.id, u.permission FROM refresh_tokens rt
+                    JOIN users u ON u.id = rt.user_id
+                    WHERE rt.token_hash = %s AND rt.expires_at > NOW() AND rt.revoked_at IS NULL;
+                """, (self._hash_token(token),))
                 result = cur.fetchone()
-                return result['user_id'] if result else None
+            self.conn.commit()
+            return dict(result) if result else None
         except psycopg2.Error as e:
+            self.conn.rollback()
             print(f"驗證 Refresh Token 時發生錯誤: {e}")
             return None
 
     def delete_refresh_token(self, token):
-        """從資料庫中刪除 Refresh Token (用於登出)"""
+        """從資料庫中刪除 Refresh Token 及同一次登入輪替出的所有 token (用於登出)"""
         try:
             with self.conn.cursor() as cur:
-                cur.execute("DELETE FROM refresh_tokens WHERE token = %s;", (token,))
+                cur.execute("""
+                    DELETE FROM refresh_tokens
+                    WHERE family_id = (SELECT family_id FROM refresh_tokens WHERE token_hash = %s);
+                """, (self._hash_token(token),))
             self.conn.commit()
             return True
         except psycopg2.Error as e:
             self.conn.rollback()
             print(f"刪除 Refresh Token 時發生錯誤: {e}")
-            return False    
+            return False
+
+    def reap_refresh_tokens(self, batch_size=1000, revoked_retention_seconds=86400):
+        """
+        刪除一批過期或已撤銷超過保留期限的 token，回傳刪除筆數。
+        每批獨立提交並以 SKIP LOCKED 略過其他程序正在處理的資料列，不會長時間鎖表。
+        """
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    DELETE FROM refresh_tokens WHERE id IN (
+                        SELECT id FROM refresh_tokens
+                        WHERE expires_at < NOW()
+                           OR revoked_at < NOW() - make_interval(secs => %s)
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    );
+                """, (revoked_retention_seconds, batch_size))
+                deleted = cur.rowcount
+            self.conn.commit()
+            return deleted
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            print(f"清除過期 Refresh Token 時發生錯誤: {e}")
+            return None
+
+    # --- 分區維護 ---
+    def list_partitions(self, table):
+        """回傳 [(分區名稱, 月份 date)]，依月份排序 (預設分區不列入)"""
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = %s::regclass;
+                """, (table,))
+                names = [row[0] for row in cur.fetchall()]
+            self.conn.rollback()
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            print(f"列出分區時發生錯誤: {e}")
+            return None
+        partitions = []
+        for name in names:
+            match = re.fullmatch(re.escape(table) + r'_p(\d{4})(\d{2})', name)
+            if match:
+                partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+        return sorted(partitions, key=lambda item: item[1])
+
+    def ensure_partitions(self, table, months_ahead=3):
+        """建立本月與之後 months_ahead 個月的分區 (已存在則略過)，回傳新建立的分區名稱列表，失敗回傳 None"""
+        column = PARTITIONED_TABLES[table]['column']
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(%s);", (PARTITION_LOCK_ID,))
+                # ATTACH 需要短暫鎖住預設分區，拿不到鎖時放棄，下次再建立
+                cur.execute("SET LOCAL lock_timeout = '5s';")
+                cur.execute("""
+                    SELECT create_monthly_partition(%s, %s, m::date)
+                    FROM generate_series(date_trunc('month', NOW()),
+                                         date_trunc('month', NOW()) + make_interval(months => %s),
+                                         INTERVAL '1 month') AS m;
+                """, (table, column, months_ahead))
+                created = [row[0] for row in cur.fetchall() if row[0]]
+            self.conn.commit()
+            return created
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            print(f"建立 {table} 分區時發生錯誤: {e}")
+            return None
+
+    def expire_partitions(self, table, retention_months, drop=False):
+        """
+        移除超過保留期限的分區：分區月份早於 (本月 - retention_months 個月) 即視為過期，
+        至少保留最近 retention_months 個月的資料。以 DETACH PARTITION 移出 (drop=True 時再 DROP TABLE)，
+        不需逐筆 DELETE。移出的資料有計數表時，同一個交易中從 row_counts 扣除。
+        每個分區各自一個交易，回傳移除的分區名稱列表，失敗回傳 None。
+        """
+        spec = PARTITIONED_TABLES[table]
+        partitions = self.list_partitions(table)
+        if partitions is None:
+            return None
+        expired = []
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT date_trunc('month', NOW() - make_interval(months => %s))::date;", (retention_months,))
+                cutoff = cur.fetchone()[0]
+            self.conn.rollback()
+            for name, month in partitions:
+                if month >= cutoff:
+                    break
+                with self.conn.cursor() as cur:
+                    cur.execute("SELECT pg_advisory_xact_lock(%s);", (PARTITION_LOCK_ID,))
+                    # DETACH 需要短暫的 ACCESS EXCLUSIVE 鎖，等太久時放棄，避免擋住線上查詢
+                    cur.execute("SET LOCAL lock_timeout = '5s';")
+                    if spec['count_keys']:
+                        cur.execute(f"""
+                            INSERT INTO row_counts (table_name, dimension, value, total)
+                            SELECT %s, k.dimension, k.value, -COUNT(*)
+                            FROM {name} r, {spec['count_keys']} k
+                            GROUP BY k.dimension, k.value ORDER BY k.dimension, k.value
+                            ON CONFLICT (table_name, dimension, value) DO UPDATE SET total = row_counts.total + EXCLUDED.total;
+                        """, (table,))
+                    cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name};")
+                    if drop:
+                        cur.execute(f"DROP TABLE {name};")
+                self.conn.commit()
+                expired.append(name)
+                print(f"已{'刪除' if drop else '移出'} {table} 分區: {name}")
+            return expired
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            print(f"移除 {table} 分區時發生錯誤: {e}")
+            return expired or None
 
     # --- User Logging ---
     def create_log(self, user_id, action, details=None, ip_address=None):
@@ -177,6 +595,28 @@ class DBHandler:
             print(f"新增日誌時發生錯誤: {e}")
             return False
         
+    def create_logs(self, entries):
+        """
+        批次新增使用者活動日誌 (供 log_writer 使用)。
+        entries 為 [(user_id, action, action_time, details, ip_address)]，以單一 INSERT 寫入。
+        """
+        if not entries:
+            return True
+        try:
+            with self.conn.cursor() as cur:
+                rows = [
+                    (user_id, action, action_time, json.dumps(details) if details is not None else None, ip_address)
+                    for user_id, action, action_time, details, ip_address in entries
+                ]
+                sql = "INSERT INTO user_logs (user_id, action, action_time, details, ip_address) VALUES %s;"
+                psycopg2.extras.execute_values(cur, sql, rows, page_size=1000)
+            self.conn.commit()
+            return True
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            print(f"批次新增日誌時發生錯誤: {e}")
+            return False
+
     def delete_user(self, user_id):
         """刪除使用者"""
         try:
@@ -234,6 +674,8 @@ class DBHandler:
                 # sql 最後沒加上 RETURNING 就不會回傳
                 sql = "INSERT INTO categories (name, category_type) VALUES (%s, %s);"
                 cur.execute(sql, (name, category_type))
+                # 通知會在交易提交後才送出
+                cur.execute("SELECT pg_notify(%s, %s);", (CATEGORY_CHANNEL, name))
                 self.conn.commit()
                 return True
         except psycopg2.Error as e:
@@ -250,6 +692,10 @@ class DBHandler:
             with self.conn.cursor() as cur:
                 cur.execute("DELETE FROM categories WHERE name = %s;", (category_name,))
                 if cur.rowcount > 0:
+                    # posts.category_name 由外鍵設為 NULL，卡片同步更新
+                    cur.execute("UPDATE post_cards SET category_name = NULL, category_type = NULL WHERE category_name = %s;",
+                                (category_name,))
+                    cur.execute("SELECT pg_notify(%s, %s);", (CATEGORY_CHANNEL, category_name))
                     self.conn.commit()
                     return True
             print(f"找不到叫做 {category_name} 的子類型")
@@ -283,7 +729,7 @@ class DBHandler:
                 
         except psycopg2.Error as e:
             print(f"尋找分類時發生錯誤: {e}")
-            return []
+            return None
     
     # --- 上傳文件 ---
     def upload_file(self, file_path, original_filename, file_type="files"):
@@ -306,7 +752,97 @@ class DBHandler:
             self.conn.rollback()
             return None
         
-    def get_files(self, filters=None, page_size=10, offset=0):
+    def upload_files(self, records):
+        """
+        在同一個交易中以單一 INSERT 新增多筆檔案紀錄 (post_id 為 NULL)。
+        records: [{'file_path', 'original_filename', 'file_type', 'file_size', 'sha256', 'renditions' (選填)}]
+        回傳與 records 順序相同的 file_id 列表，失敗時回傳 None。
+        """
+        if not records:
+            return []
+        try:
+            with self.conn.cursor() as cur:
+                sql = """
+                    INSERT INTO files (file_path, original_filename, file_type, file_size, sha256, renditions)
+                    VALUES %s RETURNING id, file_path, original_filename, file_type;
+                """
+                rows = [
+                    (r['file_path'], r['original_filename'], r['file_type'], r.get('file_size'), r.get('sha256'),
+                     json.dumps(r['renditions']) if r.get('renditions') else None)
+                    for r in records
+                ]
+                result = psycopg2.extras.execute_values(cur, sql, rows, page_size=len(rows), fetch=True)
+            # RETURNING 的順序不保證與 VALUES 相同，依欄位對回各筆紀錄 (欄位相同的紀錄可互換)
+            ids_by_key = {}
+            for file_id, file_path, original_filename, file_type in result:
+                ids_by_key.setdefault((file_path, original_filename, file_type), []).append(file_id)
+            file_ids = [ids_by_key[(r['file_path'], r['original_filename'], r['file_type'])].pop(0) for r in records]
+            self.conn.commit()
+            return file_ids
+        except psycopg2.Error as e:
+            print(f"批次新增檔案紀錄時發生錯誤: {e}")
+            self.conn.rollback()
+            return None
+
+    def set_file_renditions(self, sha256, renditions):
+        """記錄圖片的衍生圖 (同內容的所有檔案紀錄共用)，回傳更新的 file_id 列表，失敗回傳 None"""
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("UPDATE files SET renditions = %s WHERE sha256 = %s RETURNING id, post_id;",
+                            (json.dumps(renditions), sha256))
+                rows = cur.fetchall()
+                file_ids = [row[0] for row in rows]
+                # 文章卡片的第一張圖片含有衍生圖資訊
+                self._refresh_post_cards(cur, [row[1] for row in rows])
+            self.conn.commit()
+            return file_ids
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            print(f"記錄衍生圖時發生錯誤: {e}")
+            return None
+
+    def count_rows(self, cur, table, where_sql, params, equals=None):
+        """
+        列表的總筆數，回傳 (total, 是否為精確值)；cur 需為 RealDictCursor。
+        equals: 只有等值條件時為 {欄位: 值 或 值的列表 (= ANY)}；有關鍵字、日期等其他條件時為 None。
+          1. 篩選組合有計數表 (COUNTED_DIMENSIONS)：直接讀取 row_counts，不掃描資料表
+          2. 否則以 EXPLAIN 取得 planner 估計筆數；估計值不超過 COUNT_EXACT_THRESHOLD 時改以有上限的 COUNT 取得精確值
+        """
+        if equals is not None:
+            dimension = ','.join(sorted(equals))
+            if dimension in COUNTED_DIMENSIONS[table]:
+                choices = [v if isinstance(v, (list, tuple)) else [v] for _, v in sorted(equals.items())]
+                values = sorted({'\x1f'.join(str(x) for x in combo) for combo in itertools.product(*choices)})
+                cur.execute(
+                    "SELECT COALESCE(SUM(total), 0) AS total FROM row_counts WHERE table_name = %s AND dimension = %s AND value = ANY(%s);",
+                    (table, dimension, values)
+                )
+                return int(cur.fetchone()['total']), True
+
+        cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {table} WHERE {where_sql};", tuple(params))
+        plan = cur.fetchone()['QUERY PLAN']
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate <= COUNT_EXACT_THRESHOLD:
+            cur.execute(
+                f"SELECT COUNT(*) AS total FROM (SELECT 1 FROM {table} WHERE {where_sql} LIMIT %s) AS t;",
+                tuple(params) + (COUNT_EXACT_THRESHOLD + 1,)
+            )
+            total = cur.fetchone()['total']
+            if total <= COUNT_EXACT_THRESHOLD:
+                return total, True
+            # planner 低估：至少有 COUNT_EXACT_THRESHOLD + 1 筆
+            estimate = max(estimate, total)
+        return estimate, False
+
+    def get_files(self, filters=None, page_size=10, offset=0, cursor=None, with_total=True):
+        """
+        分頁取得檔案，依 id 排序。
+        cursor: 上一頁回傳的 next_cursor，提供時改用 keyset 分頁 (忽略 offset)。
+        with_total: False 時不計算總數 (total 為 None)，見 count_rows。
+        """
+        keyset = decode_cursor(cursor, 'id') if cursor else None
         try:
             with self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                 where_clauses = []
@@ -315,7 +851,7 @@ class DBHandler:
                 if filters:
                     if 'post_id' in filters:
                         where_clauses.append("post_id = %s")
-                        params.append(f"%{filters['post_id']}%")
+                        params.append(filters['post_id'])
                     if 'file_type' in filters:
                         where_clauses.append("file_type = %s")
                         params.append(filters['file_type'])
@@ -324,30 +860,38 @@ class DBHandler:
                         params.append(filters['original_filename'])
                 
                 where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
-            
-                count_sql = f"SELECT COUNT(*) as total FROM files WHERE {where_sql} ;"
-                cur.execute(count_sql)
-                total = cur.fetchone()['total']
+
+                total, total_exact = None, None
+                if with_total:
+                    equals = {k: filters[k] for k in ('post_id', 'file_type', 'original_filename') if k in (filters or {})}
+                    total, total_exact = self.count_rows(cur, 'files', where_sql, params, equals)
+
+                if keyset:
+                    where_sql += " AND id > %s"
+                    params.append(keyset[1])
+                    offset = 0
                 
                 sql = f"""
                     SELECT id, post_id, file_type, file_path, original_filename
                     FROM files
                     WHERE {where_sql}
+                    ORDER BY id
                     LIMIT %s OFFSET %s;
                 """
                 params.extend([page_size, offset])
                 
                 cur.execute(sql, tuple(params))
                 messages = [dict(row) for row in cur.fetchall()]
-                return {'total': total, 'rows': messages}
+                next_cursor = encode_cursor('id', [messages[-1]['id'], messages[-1]['id']]) if len(messages) == page_size else None
+                return {'total': total, 'total_exact': total_exact, 'rows': messages, 'next_cursor': next_cursor}
         except psycopg2.Error as e:
             print(f"取得檔案時發生錯誤: {e}")
             return []
     
     def get_file(self, file_id):
         try:
-            with self.conn.cursor() as cur:
-                sql = "SELECT id, post_id, file_type, file_path, original_filename FROM files WHERE id = %s"
+            with self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                sql = "SELECT id, post_id, file_type, file_path, original_filename, file_size, sha256, renditions FROM files WHERE id = %s"
                 cur.execute(sql, (file_id,))
                 result = cur.fetchone()
                 return dict(result) if result else None
@@ -373,20 +917,119 @@ class DBHandler:
             print(f"查找檔案擁有者時發生錯誤: {e}")
             return None
 
-    def delete_file(self, file_id):
-        """【新功能】從 files 資料表中刪除一筆檔案紀錄。"""
+    def lock_blobs(self, sha256_list):
+        """
+        在目前交易中對每個 sha256 取得 advisory lock (交易結束時釋放)。
+        上傳 (upload_files) 與刪除 (delete_file) 同內容的檔案時會互相等待，不會刪掉剛被引用的實體檔案。
+        呼叫端應傳入排序過的列表以避免死結。
+        """
+        try:
+            with self.conn.cursor() as cur:
+                for sha256 in sha256_list:
+                    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (sha256,))
+            return True
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            print(f"取得檔案鎖時發生錯誤: {e}")
+            return False
+
+    def find_blobs(self, sha256_list):
+        """
+        依內容雜湊找出已存在的檔案，回傳 {sha256: {'file_path', 'file_size', 'renditions'}} (不提交交易，以保留鎖)。
+        優先取已有衍生圖的資料列，新的引用可直接沿用。
+        """
+        try:
+            with self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute("""
+                    SELECT DISTINCT ON (sha256) sha256, file_path, file_size, renditions
+                    FROM files WHERE sha256 = ANY(%s)
+                    ORDER BY sha256, renditions IS NULL, id;
+                """, (sha256_list,))
+                return {row['sha256']: {'file_path': row['file_path'], 'file_size': row['file_size'],
+                                        'renditions': row['renditions']} for row in cur.fetchall()}
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            print(f"查詢既有檔案時發生錯誤: {e}")
+            return None
+
+    def delete_file(self, file_id, release_blob=None):
+        """
+        【新功能】從 files 資料表中刪除一筆檔案紀錄。
+        相同內容 (sha256) 的檔案共用同一個實體檔案 (引用數 = 同 sha256 的資料列數)，
+        刪除最後一筆引用時，在提交前 (仍持有鎖) 呼叫 release_blob(file_path) 刪除實體檔案。
+        """
         try:
             with self.conn.cursor() as cur:
+                cur.execute("SELECT sha256, file_path, post_id FROM files WHERE id = %s;", (file_id,))
+                row = cur.fetchone()
+                if row is None:
+                    self.conn.rollback()
+                    return False # 找不到要刪除的檔案
+                sha256, file_path, post_id = row
+                # 舊資料沒有 sha256，以 file_path 判斷是否仍被引用
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (sha256 or file_path,))
                 cur.execute("DELETE FROM files WHERE id = %s;", (file_id,))
                 if cur.rowcount == 0:
-                    return False # 找不到要刪除的檔案
+                    self.conn.rollback()
+                    return False
+                self._refresh_post_cards(cur, [post_id])
+                if sha256:
+                    cur.execute("SELECT EXISTS (SELECT 1 FROM files WHERE sha256 = %s);", (sha256,))
+                else:
+                    cur.execute("SELECT EXISTS (SELECT 1 FROM files WHERE file_path = %s);", (file_path,))
+                still_referenced = cur.fetchone()[0]
+                if not still_referenced and release_blob:
+                    release_blob(file_path)
             self.conn.commit()
             return True
-        except psycopg2.Error as e:
+        except (psycopg2.Error, OSError) as e:
             self.conn.rollback()
             print(f"刪除檔案紀錄 (ID: {file_id}) 時發生錯誤: {e}")
             return False
 
+    def release_orphan_file(self, lock_key, file_paths, release_blob, sha256=None):
+        """
+        (對帳工作使用) 取得與上傳 / 刪除相同的 advisory lock 後，再確認沒有資料列引用
+        file_paths 中任一路徑 (或 sha256 相同的內容) 才呼叫 release_blob() 刪除實體檔案。
+        回傳是否已刪除；失敗回傳 None。
+        """
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (lock_key,))
+                cur.execute("SELECT EXISTS (SELECT 1 FROM files WHERE file_path = ANY(%s) OR sha256 = %s);",
+                            (list(file_paths), sha256))
+                released = not cur.fetchone()[0] and release_blob()
+            self.conn.commit()
+            return bool(released)
+        except (psycopg2.Error, OSError) as e:
+            self.conn.rollback()
+            print(f"清除孤兒檔案 ({lock_key}) 時發生錯誤: {e}")
+            return None
+
+    def delete_files(self, file_ids):
+        """批次刪除檔案紀錄 (不處理實體檔案，供對帳工作清除指向不存在檔案的資料列)"""
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("DELETE FROM files WHERE id = ANY(%s) RETURNING post_id;", (list(file_ids),))
+                post_ids = [row[0] for row in cur.fetchall()]
+                deleted = len(post_ids)
+                self._refresh_post_cards(cur, post_ids)
+            self.conn.commit()
+            return deleted
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            print(f"批次刪除檔案紀錄時發生錯誤: {e}")
+            return 0
+
+    def iter_file_paths(self, itersize=10000):
+        """以 server-side cursor 逐批取出所有 (id, file_path)，記憶體用量與資料量無關"""
+        with self.conn.cursor(name='iter_file_paths') as cur:
+            cur.itersize = itersize
+            cur.execute("SELECT id, file_path FROM files;")
+            for row in cur:
+                yield row
+        self.conn.commit()
+
     # --- 文章 CRUD ---
     def insert_post(self, title, content, user_id, category_name, status="draft", hashtags=None, file_ids=None):
         try:
@@ -404,29 +1047,28 @@ class DBHandler:
                 post_id = result[0]
 
                 # 關聯檔案 (透過更新 post_id)
+                affected = [post_id]
                 if file_ids and isinstance(file_ids, list):
-                    # 使用 ANY 語法可以高效地更新多筆紀錄
-                    update_files_sql = "UPDATE files SET post_id = %s WHERE id = ANY(%s);"
-                    cur.execute(update_files_sql, (post_id, file_ids))
+                    affected += self._link_files(cur, post_id, file_ids)
 
-                # 處理標籤
+                # 處理標籤 (一次解析所有標籤 id，一次寫入關聯)
+                tag_map = {}
                 if hashtags and isinstance(hashtags, list):
-                    tag_sql = "INSERT INTO hashtags (tag_name) VALUES (%s) ON CONFLICT (tag_name) DO UPDATE SET tag_name=EXCLUDED.tag_name RETURNING id;"
-                    tag_ids = []
-                    for name in hashtags:
-                        cur.execute(tag_sql, (name,))
-                        tag_ids.append(cur.fetchone()[0])
-                    
-                    post_tag_sql = "INSERT INTO post_hashtags (post_id, hashtag_id) VALUES %s;"
-                    post_tag_data = [(post_id, tag_id) for tag_id in tag_ids]
-                    psycopg2.extras.execute_values(cur, post_tag_sql, post_tag_data)
+                    tag_map = self._resolve_tag_ids(cur, hashtags)
+                    cur.execute(
+                        "INSERT INTO post_hashtags (post_id, hashtag_id) SELECT %s, unnest(%s::int[]) ON CONFLICT DO NOTHING;",
+                        (post_id, list(tag_map.values()))
+                    )
+                self._refresh_post_cards(cur, affected)
             
             self.conn.commit()
+            TAG_CACHE.set_many(tag_map)
             print(f"已成功建立文章 '{title}' (ID: {post_id})")
             return post_id
         except psycopg2.Error as e:
             print(f"新增文章時發生錯誤: {e}")
             self.conn.rollback()
+            TAG_CACHE.clear()
             return None
         
     def delete_post(self, post_id):
@@ -461,48 +1103,121 @@ class DBHandler:
                     sql = f"UPDATE posts SET {', '.join(set_parts)}, announcement_date = NOW() WHERE id = %s;"
                     cur.execute(sql, tuple(params))
 
+                affected = [post_id]
                 if 'file_ids' in new_data:
                     # 解除所有舊檔案的關聯 (將 post_id 設為 NULL)
                     cur.execute("UPDATE files SET post_id = NULL WHERE post_id = %s;", (post_id,))
                     # 關聯新檔案
                     new_file_ids = new_data['file_ids']
                     if new_file_ids and isinstance(new_file_ids, list):
-                        cur.execute("UPDATE files SET post_id = %s WHERE id = ANY(%s);", (post_id, new_file_ids))
+                        affected += self._link_files(cur, post_id, new_file_ids)
 
-                # 步驟 3: 如果提供了 hashtags，則完全取代舊的
+                # 步驟 3: 如果提供了 hashtags，則以新列表為準，只增刪有差異的關聯
+                tag_map = {}
                 if 'hashtags' in new_data:
-                    # 先刪除所有舊的標籤關聯
-                    cur.execute("DELETE FROM post_hashtags WHERE post_id = %s;", (post_id,))
-                    # 如果新標籤列表不為空，則新增它們
                     new_hashtags = new_data['hashtags']
                     if new_hashtags and isinstance(new_hashtags, list):
-                        tag_ids = []
-                        for tag_name in new_hashtags:
-                            # 查找或新增標籤，並取得 ID
-                            cur.execute("INSERT INTO hashtags (tag_name) VALUES (%s) ON CONFLICT (tag_name) DO UPDATE SET tag_name=EXCLUDED.tag_name RETURNING id;", (tag_name,))
-                            tag_id = cur.fetchone()[0]
-                            tag_ids.append(tag_id)
-                        
-                        # 建立新的關聯
-                        post_tag_sql = "INSERT INTO post_hashtags (post_id, hashtag_id) VALUES %s;"
-                        post_tag_data = [(post_id, tag_id) for tag_id in tag_ids]
-                        psycopg2.extras.execute_values(cur, post_tag_sql, post_tag_data)
+                        tag_map = self._resolve_tag_ids(cur, new_hashtags)
+                    tag_ids = list(tag_map.values())
+                    cur.execute(
+                        "DELETE FROM post_hashtags WHERE post_id = %s AND NOT (hashtag_id = ANY(%s::int[]));",
+                        (post_id, tag_ids)
+                    )
+                    if tag_ids:
+                        cur.execute(
+                            "INSERT INTO post_hashtags (post_id, hashtag_id) SELECT %s, unnest(%s::int[]) ON CONFLICT DO NOTHING;",
+                            (post_id, tag_ids)
+                        )
+                self._refresh_post_cards(cur, affected)
 
             # 如果所有操作都成功，提交交易
             self.conn.commit()
+            TAG_CACHE.set_many(tag_map)
             return True
         except psycopg2.Error as e:
             # 如果任何步驟出錯，回滾所有操作
             print(f"更新文章 (ID: {post_id}) 時發生錯誤: {e}")
             self.conn.rollback()
+            TAG_CACHE.clear()
             return False
+
+    def _resolve_tag_ids(self, cur, tag_names):
+        """
+        將標籤名稱轉成 id，不存在的標籤會一併建立，回傳 {tag_name: id}。
+        先查行程內快取，其餘以單一 SQL (unnest + ON CONFLICT DO NOTHING + 重新查詢) 解析；
+        DO NOTHING 不會像 DO UPDATE 一樣改寫既有的列，也就不會產生無用的 dead tuple。
+        回傳值需等交易提交後再寫入 TAG_CACHE，避免快取到被 rollback 的 id。
+        """
+        names = list(dict.fromkeys(n.strip() for n in tag_names if isinstance(n, str) and n.strip()))
+        tag_map = TAG_CACHE.get_many(names)
+        missing = [n for n in names if n not in tag_map]
+        if missing:
+            # 同一條語句中，下半部的 SELECT 看不到 ins 剛新增的列，因此以 UNION ALL 合併兩邊結果
+            cur.execute("""
+                WITH input AS (
+                    SELECT DISTINCT unnest(%s::varchar[]) AS tag_name
+                ), ins AS (
+                    INSERT INTO hashtags (tag_name)
+                    SELECT tag_name FROM input
+                    ON CONFLICT (tag_name) DO NOTHING
+                    RETURNING id, tag_name
+                )
+                SELECT id, tag_name FROM ins
+                UNION ALL
+                SELECT h.id, h.tag_name FROM hashtags h JOIN input i ON h.tag_name = i.tag_name;
+            """, (missing,))
+            tag_map.update({name: tag_id for tag_id, name in cur.fetchall()})
+            # 極少數情況下標籤由並行的交易同時建立，語句快照看不到，再查一次
+            still_missing = [n for n in missing if n not in tag_map]
+            if still_missing:
+                cur.execute("SELECT id, tag_name FROM hashtags WHERE tag_name = ANY(%s::varchar[]);", (still_missing,))
+                tag_map.update({name: tag_id for tag_id, name in cur.fetchall()})
+        return {n: tag_map[n] for n in names if n in tag_map}
+
+    def _link_files(self, cur, post_id, file_ids):
+        """將檔案關聯到文章，回傳這些檔案原本所屬的其他文章 id (它們的卡片也需要更新)"""
+        # 自我 JOIN 的 old 為更新前的資料列，可取得原本的 post_id
+        cur.execute("""
+            UPDATE files f SET post_id = %s FROM files old
+            WHERE old.id = f.id AND f.id = ANY(%s)
+            RETURNING old.post_id;
+        """, (post_id, file_ids))
+        return [row[0] for row in cur.fetchall() if row[0] is not None and row[0] != post_id]
+
+    def _refresh_post_cards(self, cur, post_ids):
+        """在目前的交易中更新指定文章的列表卡片 (post_cards)"""
+        post_ids = sorted({pid for pid in post_ids if pid is not None})
+        if post_ids:
+            cur.execute("SELECT refresh_post_cards(%s::int[]);", (post_ids,))
+
+    def rebuild_post_cards(self, batch_size=10000):
+        """依 id 分批重新計算所有文章卡片 (手動修改資料庫後使用)，回傳處理的文章數，失敗回傳 None"""
+        done, last_id = 0, 0
+        try:
+            while True:
+                with self.conn.cursor() as cur:
+                    cur.execute("SELECT id FROM posts WHERE id > %s ORDER BY id LIMIT %s;", (last_id, batch_size))
+                    ids = [row[0] for row in cur.fetchall()]
+                    if not ids:
+                        break
+                    self._refresh_post_cards(cur, ids)
+                self.conn.commit()
+                done += len(ids)
+                last_id = ids[-1]
+            self.conn.rollback()
+            return done
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            print(f"重建文章卡片時發生錯誤: {e}")
+            return None
         
         
       
     def get_post(self, post_id):
+        """取得單篇文章 (純查詢，點擊數由 click_counter 另行累計寫回)"""
         try:
             with self.conn.cursor(psycopg2.extras.RealDictCursor) as cur:
-                cur.execute("UPDATE posts SET click_count = click_count + 1 WHERE id = %s RETURNING *;", (post_id,))
+                cur.execute(f"SELECT {POST_COLUMNS} FROM posts WHERE id = %s;", (post_id,))
                 result = cur.fetchone()
                 if not result:
                     self.conn.rollback()
@@ -511,7 +1226,7 @@ class DBHandler:
                 cur.execute("SELECT id, file_path, original_filename FROM files WHERE post_id = %s AND file_type = 'attachments'", (post_id,))
                 result['attachments'] = cur.fetchall()
 
-                cur.execute("SELECT id, file_path, original_filename FROM files WHERE post_id = %s AND file_type = 'images'", (post_id,))
+                cur.execute("SELECT id, file_path, original_filename, renditions FROM files WHERE post_id = %s AND file_type = 'images'", (post_id,))
                 result['images'] = cur.fetchall()
 
                 cur.execute("SELECT t.tag_name FROM hashtags t JOIN post_hashtags pt ON t.id = pt.hashtag_id WHERE pt.post_id = %s;", (post_id,))
@@ -526,48 +1241,129 @@ class DBHandler:
             
         
 
-    def get_posts(self, filters=None, order_by='announcement_date', page_size=10, offset=0):
+    def add_click_counts(self, counts):
+        """
+        批次累加文章點擊數，counts 為 {post_id: 增加的次數}。
+        以單一 UPDATE ... FROM (VALUES ...) 完成，回傳更新的文章數，失敗回傳 None。
+        """
+        if not counts:
+            return 0
+        try:
+            with self.conn.cursor() as cur:
+                sql = """
+                    UPDATE posts AS p SET click_count = p.click_count + v.delta
+                    FROM (VALUES %s) AS v(id, delta)
+                    WHERE p.id = v.id;
+                """
+                # 依 id 排序，讓並行的寫回以相同順序加鎖，避免死結
+                psycopg2.extras.execute_values(cur, sql, sorted(counts.items()), template="(%s::int, %s::int)")
+                updated = cur.rowcount
+                # 已持有 posts 的列鎖 (與 refresh_post_cards 相同的加鎖順序)，卡片直接複製 posts 的值而不是另外累加
+                cur.execute("""
+                    UPDATE post_cards AS c SET click_count = p.click_count
+                    FROM posts p
+                    WHERE p.id = c.id AND c.id = ANY(%s) AND c.click_count <> p.click_count;
+                """, (sorted(counts),))
+            self.conn.commit()
+            return updated
+        except psycopg2.Error as e:
+            self.conn.rollback()
+            print(f"批次更新點擊數時發生錯誤: {e}")
+            return None
+
+    def _post_filters_sql(self, filters):
+        """將 get_posts 的 filters 轉成 WHERE 子句與參數"""
+        where_clauses = []
+        params = []
+        if filters:
+            if 'title_keyword' in filters:
+                where_clauses.append("title ILIKE %s")
+                params.append(f"%{filters['title_keyword']}%")
+            if filters.get('q'):
+                # 標題 + 去除 HTML 的內文全文搜尋，可使用 search_vector 的 GIN 索引
+                where_clauses.append(f"search_vector @@ {SEARCH_TSQUERY}")
+                params.append(filters['q'])
+            if 'category_name' in filters:
+                where_clauses.append("category_name = ANY(%s)")
+                params.append(filters['category_name'])
+            if 'user_id' in filters:
+                where_clauses.append("user_id = %s")
+                params.append(filters['user_id'])
+            if 'status' in filters:
+                where_clauses.append("status = %s")
+                params.append(filters['status'])
+        where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+        return where_sql, params
+
+    def _post_count_equals(self, filters):
+        """get_posts 的 filters 中只有等值條件時回傳 {欄位: 值}，供 count_rows 使用計數表"""
+        filters = filters or {}
+        if 'title_keyword' in filters or filters.get('q'):
+            return None
+        return {k: filters[k] for k in ('status', 'category_name', 'user_id') if k in filters}
+
+    def get_posts(self, filters=None, order_by='announcement_date', page_size=10, offset=0, single_query=None, cursor=None,
+                  with_total=True, read_model=None):
         """
         【新功能】根據多種條件動態查詢文章。
         filters 是一個字典，例如: {'title_keyword': '競賽'}, {'category_name': 補助文件}, {'user_id': 1}
+        single_query: True 時以單一 SQL 取回分頁、附件、圖片、標籤與總數；
+                      None 時依環境變數 POSTS_SINGLE_QUERY 決定 (方便兩種做法互相比較)。
+        cursor: 上一頁回傳的 next_cursor，提供時改用 keyset 分頁 (忽略 offset)，深頁與第一頁成本相同。
+        order_by 為 'relevance' 時依全文搜尋 (filters['q']) 的相關度排序。
+        with_total: False 時不計算總數 (total 為 None)；總數來源見 count_rows，total_exact 表示是否為精確值。
+        read_model: True 時只讀取 post_cards (列表卡片：不含內文，圖片只有 cover_image，附件只有 attachment_count)；
+                    None 時依環境變數 POSTS_READ_MODEL 決定。
         """
-        if order_by not in ['announcement_date', 'click_count']:
+        search_q = filters.get('q') if filters else None
+        if order_by not in ['announcement_date', 'click_count', 'relevance'] or (order_by == 'relevance' and not search_q):
             order_by = 'announcement_date'
+        if single_query is None:
+            single_query = POSTS_SINGLE_QUERY
+        if read_model is None:
+            read_model = POSTS_READ_MODEL
+        where_sql, params = self._post_filters_sql(filters)
+        if order_by == 'relevance':
+            order_expr = f"ts_rank(search_vector, {SEARCH_TSQUERY})"
+            order_params = [search_q]
+        else:
+            order_expr, order_params = order_by, []
+        keyset_sql, keyset_params = "", []
+        if cursor:
+            if order_by == 'relevance':
+                raise ValueError("相關度排序不支援游標分頁，請改用 page")
+            keyset_sql = f" AND ({order_by}, id) < (%s, %s)"
+            keyset_params = decode_cursor(cursor, order_by)
+            offset = 0
         try:
             with self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                where_clauses = []
-                params = []
-
-                if filters:
-                    if 'title_keyword' in filters:
-                        where_clauses.append("title ILIKE %s")
-                        params.append(f"%{filters['title_keyword']}%")
-                    if 'category_name' in filters:
-                        where_clauses.append("category_name = ANY(%s)")
-                        params.append(filters['category_name'])
-                    if 'user_id' in filters:
-                        where_clauses.append("user_id = %s")
-                        params.append(filters['user_id'])
-                    if 'status' in filters:
-                        where_clauses.append("status = %s")
-                        params.append(filters['status'])
-                
-                where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
-            
-                count_sql = f"SELECT COUNT(*) as total FROM categories WHERE {where_sql} ;"
-                cur.execute(count_sql, tuple(params))
-                total = cur.fetchone()['total']
-
-                if total == 0:
-                    return {'total': 0, "rows": []}
+                total, total_exact = None, None
+                if with_total:
+                    total, total_exact = self.count_rows(cur, 'posts', where_sql, params, self._post_count_equals(filters))
+                    if total == 0 and total_exact:
+                        return {'total': 0, 'total_exact': True, 'rows': [], 'next_cursor': None}
+
+                if read_model:
+                    posts = self._get_post_cards(cur, where_sql, params, keyset_sql, keyset_params,
+                                                 order_expr, order_params, page_size, offset)
+                    return {'total': total, 'total_exact': total_exact, 'rows': posts,
+                            'next_cursor': self._posts_next_cursor(posts, order_by, page_size)}
+
+                if single_query:
+                    posts = self._get_posts_single(cur, where_sql, params, keyset_sql, keyset_params,
+                                                   order_expr, order_params, page_size, offset)
+                    return {'total': total, 'total_exact': total_exact, 'rows': posts,
+                            'next_cursor': self._posts_next_cursor(posts, order_by, page_size)}
                 
                 sql = f"""
-                    SELECT *
+                    SELECT {POST_COLUMNS}
                     FROM posts
-                    WHERE {where_sql}
-                    ORDER BY {order_by} DESC
+                    WHERE {where_sql}{keyset_sql}
+                    ORDER BY {order_expr} DESC, id DESC
                     LIMIT %s OFFSET %s;
                 """
+                params.extend(keyset_params)
+                params.extend(order_params)
                 params.extend([page_size, offset])
                 
                 cur.execute(sql, tuple(params))
@@ -575,16 +1371,16 @@ class DBHandler:
                 post_ids = [p['id'] for p in posts]
 
                 if not post_ids:
-                    return {'total': total, 'rows': []}
+                    return {'total': total, 'total_exact': total_exact, 'rows': [], 'next_cursor': None}
 
                 # 步驟 2: 一次性查詢所有相關的檔案
-                cur.execute("SELECT * FROM files WHERE post_id = ANY(%s) AND file_type = 'attachments';", (post_ids,))
+                cur.execute("SELECT * FROM files WHERE post_id = ANY(%s) AND file_type = 'attachments' ORDER BY id;", (post_ids,))
                 attachments = cur.fetchall()
                 attachments_map = {pid: [] for pid in post_ids}
                 for f in attachments:
                     attachments_map[f['post_id']].append(f)
 
-                cur.execute("SELECT * FROM files WHERE post_id = ANY(%s) AND file_type = 'images';", (post_ids,))
+                cur.execute("SELECT * FROM files WHERE post_id = ANY(%s) AND file_type = 'images' ORDER BY id;", (post_ids,))
                 images = cur.fetchall()
                 images_map = {pid: [] for pid in post_ids}
                 for f in images:
@@ -592,9 +1388,10 @@ class DBHandler:
 
                 # 步驟 3: 一次性查詢所有相關的標籤
                 cur.execute("""
-                    SELECT t.* FROM hashtags t
+                    SELECT pt.post_id, t.tag_name FROM hashtags t
                     JOIN post_hashtags pt ON t.id = pt.hashtag_id
-                    WHERE pt.post_id = ANY(%s);
+                    WHERE pt.post_id = ANY(%s)
+                    ORDER BY t.tag_name;
                 """, (post_ids,))
                 hashtags = cur.fetchall()
                 hashtags_map = {pid: [] for pid in post_ids}
@@ -607,10 +1404,58 @@ class DBHandler:
                     p['images'] = images_map.get(p['id'], [])
                     p['hashtags'] = hashtags_map.get(p['id'], [])
                 
-                return {'total': total, 'rows': posts}
+                return {'total': total, 'total_exact': total_exact, 'rows': posts,
+                        'next_cursor': self._posts_next_cursor(posts, order_by, page_size)}
         except psycopg2.Error as e:
             print(f"查詢文章時發生錯誤: {e}")
-            return []
+            return None
+
+    def _posts_next_cursor(self, posts, order_by, page_size):
+        """整頁取滿時，以最後一筆產生下一頁的游標 (相關度排序不提供游標)"""
+        if len(posts) < page_size or not posts or order_by == 'relevance':
+            return None
+        last = posts[-1]
+        return encode_cursor(order_by, [last[order_by], last['id']])
+
+    def _get_post_cards(self, cur, where_sql, params, keyset_sql, keyset_params, order_expr, order_params, page_size, offset):
+        """從 post_cards 讀取一頁文章卡片：單一資料表、依索引排序，不需 JOIN"""
+        sql = f"""
+            SELECT {POST_CARD_COLUMNS}
+            FROM post_cards
+            WHERE {where_sql}{keyset_sql}
+            ORDER BY {order_expr} DESC, id DESC
+            LIMIT %s OFFSET %s;
+        """
+        cur.execute(sql, tuple(params) + tuple(keyset_params) + tuple(order_params) + (page_size, offset))
+        return cur.fetchall()
+
+    def _get_posts_single(self, cur, where_sql, params, keyset_sql, keyset_params, order_expr, order_params, page_size, offset):
+        """
+        單一來回的文章列表查詢：
+        內層分頁，外層只對該頁文章以子查詢聚合附件、圖片與標籤。總數由 count_rows 另外提供。
+        """
+        sql = f"""
+            SELECT page.*,
+                COALESCE((SELECT json_agg(f ORDER BY f.id) FROM files f
+                          WHERE f.post_id = page.id AND f.file_type = 'attachments'), '[]'::json) AS attachments,
+                COALESCE((SELECT json_agg(f ORDER BY f.id) FROM files f
+                          WHERE f.post_id = page.id AND f.file_type = 'images'), '[]'::json) AS images,
+                ARRAY(SELECT t.tag_name FROM post_hashtags pt JOIN hashtags t ON t.id = pt.hashtag_id
+                      WHERE pt.post_id = page.id ORDER BY t.tag_name) AS hashtags
+            FROM (
+                SELECT {POST_COLUMNS}, {order_expr} AS _sort
+                FROM posts
+                WHERE {where_sql}{keyset_sql}
+                ORDER BY _sort DESC, id DESC
+                LIMIT %s OFFSET %s
+            ) AS page
+            ORDER BY page._sort DESC, page.id DESC;
+        """
+        cur.execute(sql, tuple(order_params) + tuple(params) + tuple(keyset_params) + (page_size, offset))
+        posts = cur.fetchall()
+        for p in posts:
+            p.pop('_sort', None)
+        return posts
     
     # --- 留言板CURD ---
     def insert_bulletin_message(self, content, author_name=None, department=None, campus=None):
@@ -630,33 +1475,130 @@ class DBHandler:
             self.conn.rollback()
             return None
 
-    def get_bulletin_messages(self, target_date=None, campus=None, department=None, page_size=10, offset=0):
+    def _bulletin_filters_sql(self, start=None, end=None, campus=None, department=None):
+        """
+        布告欄的篩選條件。日期以半開區間 created_at >= start AND created_at < end 表示，
+        不對欄位做轉型，可使用 created_at 與 (campus, department, created_at) 索引。
+        """
+        where_clauses, params = [], []
+        if start:
+            where_clauses.append("created_at >= %s")
+            params.append(start)
+        if end:
+            where_clauses.append("created_at < %s")
+            params.append(end)
+        if campus:
+            where_clauses.append("campus = %s")
+            params.append(campus)
+        if department:
+            where_clauses.append("department = %s")
+            params.append(department)
+        where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+        return where_sql, params
+
+    def get_bulletin_messages(self, target_date=None, campus=None, department=None, page_size=10, offset=0, cursor=None,
+                              with_total=True, start=None, end=None):
+        """
+        分頁取得留言，依建立時間新到舊排序。
+        target_date: 只取這一天 (等同 start=target_date, end=隔天)。
+        start / end: 日期範圍 [start, end)，date 或 datetime，end 不含。
+        cursor: 上一頁回傳的 next_cursor，提供時改用 keyset 分頁 (忽略 offset)。
+        with_total: False 時不計算總數 (total 為 None)，見 count_rows。
+        """
+        if target_date:
+            start, end = target_date, target_date + timedelta(days=1)
+        if start and end and start >= end:
+            raise ValueError("日期範圍的起始必須早於結束")
+        keyset = decode_cursor(cursor, 'created_at') if cursor else None
         try:
             with self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-                where_clauses, params = [], []
-                if target_date:
-                    where_clauses.append("created_at::date = %s")
-                    params.append(target_date)
-                if campus:
-                    where_clauses.append("campus = %s")
-                    params.append(campus)
-                if department:
-                    where_clauses.append("department = %s")
-                    params.append(department)
-                where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
-                
-                count_sql = f"SELECT COUNT(*) as total FROM bulletin_messages WHERE {where_sql};"
-                cur.execute(count_sql, tuple(params))
-                total = cur.fetchone()['total']
+                where_sql, params = self._bulletin_filters_sql(start, end, campus, department)
+
+                total, total_exact = None, None
+                if with_total:
+                    equals = None if start or end else {k: v for k, v in (('campus', campus), ('department', department)) if v}
+                    total, total_exact = self.count_rows(cur, 'bulletin_messages', where_sql, params, equals)
                 
-                data_sql = f"SELECT * FROM bulletin_messages WHERE {where_sql} ORDER BY created_at DESC LIMIT %s OFFSET %s;"
+                if keyset:
+                    # 多加一個 created_at <= 的條件：列比較 (created_at, id) < (...) 本身無法用來排除分區
+                    where_sql += " AND created_at <= %s AND (created_at, id) < (%s, %s)"
+                    params.extend([keyset[0]] + list(keyset))
+                    offset = 0
+
+                data_sql = f"SELECT * FROM bulletin_messages WHERE {where_sql} ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s;"
                 params.extend([page_size, offset])
                 cur.execute(data_sql, tuple(params))
                 messages = [dict(row) for row in cur.fetchall()]
-                return {'total': total, 'rows': messages}
+                next_cursor = None
+                if messages and len(messages) == page_size:
+                    next_cursor = encode_cursor('created_at', [messages[-1]['created_at'], messages[-1]['id']])
+                return {'total': total, 'total_exact': total_exact, 'rows': messages, 'next_cursor': next_cursor}
         except psycopg2.Error as e:
             print(f"查詢留言時發生錯誤: {e}")
-            return {'total': 0, 'data': []}
+            return None
+
+    def get_bulletin_facets(self, start=None, end=None, campus=None, department=None):
+        """
+        布告欄篩選面板的各選項筆數，以單一查詢取得：
+          campus:     各院區的留言數 (套用日期範圍與部門條件)
+          department: 各部門的留言數 (套用日期範圍與院區條件)
+          date:       每天的留言數 (套用院區與部門條件)；未指定日期範圍時為 None
+        每個面向不套用自己的條件，已選擇院區時仍可看到其他院區的筆數。
+        有日期範圍時只掃描範圍內的資料一次 (MATERIALIZED CTE)；沒有時院區 / 部門直接讀取 row_counts 計數表。
+        回傳 {面向: [{'value', 'total'}]}，失敗回傳 None。
+        """
+        if start and end and start >= end:
+            raise ValueError("日期範圍的起始必須早於結束")
+        campus_sql, campus_params = ("campus = %s", [campus]) if campus else ("TRUE", [])
+        department_sql, department_params = ("department = %s", [department]) if department else ("TRUE", [])
+        if start or end:
+            range_sql, range_params = self._bulletin_filters_sql(start, end)
+            sql = f"""
+                WITH base AS MATERIALIZED (
+                    SELECT campus, department, created_at FROM bulletin_messages WHERE {range_sql}
+                )
+                SELECT 'campus' AS facet, campus AS value, COUNT(*) AS total
+                FROM base WHERE {department_sql} GROUP BY campus
+                UNION ALL
+                SELECT 'department', department, COUNT(*)
+                FROM base WHERE {campus_sql} GROUP BY department
+                UNION ALL
+                SELECT 'date', to_char(created_at, 'YYYY-MM-DD'), COUNT(*)
+                FROM base WHERE {campus_sql} AND {department_sql} GROUP BY 2;
+            """
+            params = range_params + department_params + campus_params + campus_params + department_params
+        else:
+            # row_counts 的 'campus,department' 值為 院區 \x1f 部門
+            campus_facet = ("SELECT 'campus' AS facet, split_part(value, E'\\x1f', 1) AS value, SUM(total) AS total FROM row_counts "
+                            "WHERE table_name = 'bulletin_messages' AND dimension = 'campus,department' "
+                            "AND split_part(value, E'\\x1f', 2) = %s GROUP BY 2"
+                            if department else
+                            "SELECT 'campus' AS facet, value, total FROM row_counts "
+                            "WHERE table_name = 'bulletin_messages' AND dimension = 'campus'")
+            department_facet = ("SELECT 'department', split_part(value, E'\\x1f', 2), SUM(total) FROM row_counts "
+                                "WHERE table_name = 'bulletin_messages' AND dimension = 'campus,department' "
+                                "AND split_part(value, E'\\x1f', 1) = %s GROUP BY 2"
+                                if campus else
+                                "SELECT 'department', value, total FROM row_counts "
+                                "WHERE table_name = 'bulletin_messages' AND dimension = 'department'")
+            sql = f"{campus_facet} UNION ALL {department_facet};"
+            params = department_params + campus_params
+        try:
+            with self.conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                cur.execute(sql, tuple(params))
+                rows = cur.fetchall()
+        except psycopg2.Error as e:
+            print(f"查詢留言篩選計數時發生錯誤: {e}")
+            return None
+        facets = {'campus': [], 'department': [], 'date': [] if start or end else None}
+        for row in rows:
+            if row['total']:
+                facets[row['facet']].append({'value': row['value'], 'total': int(row['total'])})
+        for name in ('campus', 'department'):
+            facets[name].sort(key=lambda item: (-item['total'], item['value'] or ''))
+        if facets['date'] is not None:
+            facets['date'].sort(key=lambda item: item['value'])
+        return facets
 
     def delete_bulletin_message(self, message_id):
         try:
@@ -673,12 +1615,198 @@ class DBHandler:
             print(f"查詢留言時發生錯誤: {e}")
             return False
 
+    # --- 批次匯入 / 匯出 (bulk_io.py) ---
+    def import_posts(self, records, default_user_id=None):
+        """
+        批次匯入文章：records 為可迭代的 dict (只會走訪一次，不會整批載入記憶體)，欄位同 EXPORT_QUERIES['posts']：
+            title (必填)、content、user_id、category_name、status、click_count、announcement_date、
+            hashtags (標籤名稱列表)、files (檔案列表：有 id 且存在時關聯既有檔案，否則依 file_path 等欄位新增 files 資料列)、
+            id (選填：已存在的文章會被更新，標籤與檔案關聯改為以匯入資料為準)
+        資料先以 COPY 寫入暫存資料表，再以少數幾個集合式 SQL 合併，整批在同一個交易中完成 (任一筆失敗則全部不匯入)。
+        回傳各項筆數 dict，失敗回傳 None。
+        """
+        stages = {name: tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES, mode='w+t', encoding='utf-8', newline='')
+                  for name in ('posts', 'tags', 'files')}
+        try:
+            count = 0
+            for line, record in enumerate(records, 1):
+                if not isinstance(record, dict):
+                    print(f"第 {line} 筆資料不是物件，取消匯入。")
+                    return None
+                title = record.get('title')
+                # CSV 的空白欄位讀入後為 None，同樣使用預設的發布者
+                user_id = record.get('user_id') or default_user_id
+                if not title or user_id is None:
+                    print(f"第 {line} 筆資料缺少 title 或 user_id，取消匯入。")
+                    return None
+                stages['posts'].write(_copy_row((
+                    line, record.get('id'), title, record.get('content'), user_id, record.get('category_name'),
+                    record.get('status') or 'draft', record.get('click_count'), record.get('announcement_date'))))
+                for tag in record.get('hashtags') or []:
+                    if isinstance(tag, str) and tag.strip():
+                        stages['tags'].write(_copy_row((line, tag.strip())))
+                for f in record.get('files') or []:
+                    if isinstance(f, int):
+                        f = {'id': f}
+                    elif not isinstance(f, dict):
+                        print(f"第 {line} 筆資料的 files 項目必須是檔案 id 或物件，取消匯入。")
+                        return None
+                    stages['files'].write(_copy_row((
+                        line, f.get('id'), f.get('file_type'), f.get('file_path'), f.get('original_filename'),
+                        f.get('file_size'), f.get('sha256'))))
+                count += 1
+            if not count:
+                return {'posts': 0}
+
+            with self.conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TEMP TABLE import_posts (
+                        line INT PRIMARY KEY, id INT, title TEXT, content TEXT, user_id INT, category_name TEXT,
+                        status TEXT, click_count INT, announcement_date TIMESTAMP
+                    ) ON COMMIT DROP;
+                    CREATE TEMP TABLE import_tags (line INT, tag_name TEXT) ON COMMIT DROP;
+                    CREATE TEMP TABLE import_files (
+                        line INT, file_id INT, file_type TEXT, file_path TEXT, original_filename TEXT,
+                        file_size BIGINT, sha256 TEXT
+                    ) ON COMMIT DROP;
+                """)
+                for name in ('posts', 'tags', 'files'):
+                    stages[name].seek(0)
+                    cur.copy_expert(f"COPY import_{name} FROM STDIN;", stages[name])
+                cur.execute("ANALYZE import_posts, import_tags, import_files;")
+
+                # 匯入前先檢查，給出比外鍵錯誤清楚的訊息
+                cur.execute("""
+                    SELECT
+                        (SELECT COUNT(*) FROM (SELECT id FROM import_posts WHERE id IS NOT NULL GROUP BY id HAVING COUNT(*) > 1) d),
+                        (SELECT COUNT(*) FROM import_posts s WHERE NOT EXISTS (SELECT 1 FROM users u WHERE u.id = s.user_id)),
+                        (SELECT COUNT(*) FROM import_posts s WHERE s.category_name IS NOT NULL
+                            AND NOT EXISTS (SELECT 1 FROM categories c WHERE c.name = s.category_name));
+                """)
+                duplicated, unknown_users, unknown_categories = cur.fetchone()
+                if duplicated or unknown_users or unknown_categories:
+                    print(f"匯入資料有誤：重複的 id {duplicated} 個、不存在的 user_id {unknown_users} 筆、"
+                          f"不存在的分類 {unknown_categories} 筆，取消匯入。")
+                    self.conn.rollback()
+                    return None
+
+                # 沒有 id 的文章先配發 id，之後標籤與檔案直接以 line 對應
+                cur.execute("UPDATE import_posts SET id = nextval('posts_id_seq') WHERE id IS NULL;")
+                cur.execute("""
+                    WITH upserted AS (
+                        INSERT INTO posts (id, title, content, user_id, category_name, status, click_count, announcement_date)
+                        SELECT id, title, content, user_id, category_name, status::post_status_enum,
+                               COALESCE(click_count, 0), COALESCE(announcement_date, NOW())
+                        FROM import_posts ORDER BY id
+                        ON CONFLICT (id) DO UPDATE SET
+                            title = EXCLUDED.title, content = EXCLUDED.content, user_id = EXCLUDED.user_id,
+                            category_name = EXCLUDED.category_name, status = EXCLUDED.status,
+                            -- EXCLUDED 已套用新文章的預設值，更新時改看匯入資料本身，沒有提供就保留原值
+                            click_count = COALESCE((SELECT s.click_count FROM import_posts s WHERE s.id = EXCLUDED.id),
+                                                   posts.click_count),
+                            announcement_date = COALESCE((SELECT s.announcement_date FROM import_posts s WHERE s.id = EXCLUDED.id),
+                                                         posts.announcement_date)
+                        RETURNING (xmax = 0) AS inserted
+                    )
+                    SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM upserted;
+                """)
+                inserted, updated = cur.fetchone()
+                # 匯入資料自帶的 id 可能超過 sequence 目前的值
+                cur.execute("""
+                    SELECT setval('posts_id_seq', m) FROM (SELECT MAX(id) AS m FROM import_posts) s
+                    WHERE m > (SELECT last_value FROM posts_id_seq);
+                """)
+
+                # 標籤：一次建立所有新標籤，再整批寫入關聯 (更新的文章先清除舊關聯)
+                cur.execute("""
+                    INSERT INTO hashtags (tag_name)
+                    SELECT DISTINCT tag_name FROM import_tags ORDER BY tag_name
+                    ON CONFLICT (tag_name) DO NOTHING;
+                """)
+                if updated:
+                    cur.execute("DELETE FROM post_hashtags ph USING import_posts s WHERE ph.post_id = s.id;")
+                cur.execute("""
+                    INSERT INTO post_hashtags (post_id, hashtag_id)
+                    SELECT DISTINCT s.id, h.id
+                    FROM import_tags t JOIN import_posts s USING (line) JOIN hashtags h ON h.tag_name = t.tag_name
+                    ON CONFLICT DO NOTHING;
+                """)
+                tags = cur.rowcount
+
+                # 檔案：更新的文章先解除不在匯入資料中的舊關聯，再關聯既有檔案、新增其餘檔案
+                if updated:
+                    cur.execute("""
+                        UPDATE files f SET post_id = NULL FROM import_posts s
+                        WHERE f.post_id = s.id
+                          AND NOT EXISTS (SELECT 1 FROM import_files i WHERE i.file_id = f.id);
+                    """)
+                # 被改關聯到匯入文章的檔案，原本所屬文章的卡片也要更新
+                cur.execute("""
+                    SELECT DISTINCT f.post_id FROM files f JOIN import_files i ON i.file_id = f.id
+                    WHERE f.post_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM import_posts s WHERE s.id = f.post_id);
+                """)
+                previous_owners = [row[0] for row in cur.fetchall()]
+                cur.execute("""
+                    UPDATE files f SET post_id = s.id
+                    FROM import_files i JOIN import_posts s USING (line)
+                    WHERE f.id = i.file_id;
+                """)
+                linked = cur.rowcount
+                cur.execute("""
+                    INSERT INTO files (post_id, file_type, file_path, original_filename, file_size, sha256)
+                    SELECT s.id, i.file_type::file_enum, i.file_path, i.original_filename, i.file_size, i.sha256
+                    FROM import_files i JOIN import_posts s USING (line)
+                    WHERE i.file_path IS NOT NULL
+                      AND (i.file_id IS NULL OR NOT EXISTS (SELECT 1 FROM files f WHERE f.id = i.file_id));
+                """)
+                created = cur.rowcount
+
+                cur.execute("SELECT refresh_post_cards(ARRAY(SELECT id FROM import_posts));")
+                self._refresh_post_cards(cur, previous_owners)
+            self.conn.commit()
+            return {'posts': count, 'inserted': inserted, 'updated': updated, 'post_hashtags': tags,
+                    'files_linked': linked, 'files_created': created}
+        except (psycopg2.Error, OSError) as e:
+            self.conn.rollback()
+            print(f"批次匯入文章時發生錯誤: {e}")
+            return None
+        except ValueError as e:
+            # 讀取來源檔案時的格式錯誤 (訊息含行號)，此時尚未寫入資料庫
+            self.conn.rollback()
+            print(f"匯入資料格式錯誤，取消匯入: {e}")
+            return None
+        finally:
+            for stage in stages.values():
+                stage.close()
+
+    def iter_export(self, table, itersize=EXPORT_ITERSIZE, where_sql="1=1", params=()):
+        """
+        以 server-side cursor 逐批取出 EXPORT_QUERIES 中資料表的資料列 (dict)，
+        記憶體用量只與 itersize 有關；整個匯出在同一個快照中完成。
+        """
+        with self.conn.cursor(name=f'export_{table}', cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.itersize = itersize
+            cur.execute(EXPORT_QUERIES[table].format(where=where_sql), params)
+            for row in cur:
+                yield row
+        self.conn.commit()
+
+    def export_posts(self, filters=None, itersize=EXPORT_ITERSIZE):
+        """依 get_posts 的 filters 串流匯出文章 (含標籤與檔案)"""
+        where_sql, params = self._post_filters_sql(filters)
+        return self.iter_export('posts', itersize, where_sql, params)
+
+    def export_bulletin_messages(self, start=None, end=None, campus=None, department=None, itersize=EXPORT_ITERSIZE):
+        """依日期區間 [start, end) 與院區 / 部門串流匯出布告欄留言"""
+        where_sql, params = self._bulletin_filters_sql(start, end, campus, department)
+        return self.iter_export('bulletin_messages', itersize, where_sql, params)
+
 
 
 # --- 主執行區塊 ---
 if __name__ == "__main__":
-    if not os.path.exists('schema.sql'):
-        print("錯誤: 'schema.sql' 檔案不存在。")
+    if not os.path.isdir(MIGRATIONS_DIR):
+        print("錯誤: 'migrations' 資料夾不存在。")
     else:
         try:
             # 使用 with 語句來管理 DBHandler 物件
@@ -0,0 +1,277 @@
+import psycopg2
+import psycopg2.extensions
+import os
+import time
+import atexit
+import threading
+from collections import deque
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+# 連線池設定 (皆可由環境變數調整)
+POOL_CONFIG = {
+    'minconn': int(os.getenv('DB_POOL_MIN', 1)),                # 池中至少保留的閒置連線數
+    'maxconn': int(os.getenv('DB_POOL_MAX', 10)),               # 同時存在的連線上限
+    'timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),         # 借不到連線時最多等待秒數
+    'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 300)),      # 閒置超過此秒數的連線會被回收
+    'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', 3600)),  # 連線存活超過此秒數會被汰換
+    'check_after': float(os.getenv('DB_POOL_CHECK_AFTER', 30)),  # 閒置超過此秒數，借出前先 SELECT 1 檢查
+}
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    """等待連線逾時。繼承 OperationalError，讓既有的連線錯誤處理可以直接捕獲。"""
+
+
+class _PooledConn:
+    """池中連線的包裝，記錄建立與最後使用時間。"""
+    __slots__ = ('conn', 'created_at', 'last_used')
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+class ConnectionPool:
+    """
+    執行緒安全、有上限的 PostgreSQL 連線池。
+    - 借出時做健康檢查 (閒置較久的連線會先 SELECT 1)
+    - 閒置過久或存活過久的連線會被回收
+    - 記錄借用等待時間等指標，可由 stats() 取得
+    """
+
+    def __init__(self, config, minconn=1, maxconn=10, timeout=30, max_idle=300, max_lifetime=3600, check_after=30):
+        if maxconn < 1 or minconn < 0 or minconn > maxconn:
+            raise ValueError("連線池大小設定錯誤：需 0 <= minconn <= maxconn 且 maxconn >= 1")
+        self.config = config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+
+        self._idle = deque()    # 閒置連線 (LIFO，最近用過的優先借出)
+        self._in_use = {}       # id(conn) -> _PooledConn
+        self._size = 0          # 目前存在 (閒置 + 借出 + 建立中) 的連線數
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+
+        self._stats = {
+            'checkouts': 0,         # 借出次數
+            'created': 0,           # 新建連線數
+            'recycled': 0,          # 因閒置/壽命/失效而關閉的連線數
+            'health_failures': 0,   # 健康檢查失敗次數
+            'timeouts': 0,          # 等待逾時次數
+            'waits': 0,             # 需要等待的借用次數
+            'wait_total': 0.0,      # 累計等待秒數
+            'wait_max': 0.0,        # 最長等待秒數
+        }
+
+        # 預先建立最少連線數；資料庫暫時連不上時不要讓啟動失敗
+        for _ in range(minconn):
+            try:
+                conn = self._connect()
+            except psycopg2.OperationalError as e:
+                print(f"預先建立資料庫連線失敗: {e}")
+                break
+            with self._cond:
+                self._size += 1
+                self._idle.append(_PooledConn(conn))
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.config)
+        self._stats['created'] += 1
+        return conn
+
+    def _close(self, entry):
+        """關閉一條連線 (呼叫端需自行調整 _size)。"""
+        self._stats['recycled'] += 1
+        try:
+            entry.conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _expired(self, entry, now):
+        return self.max_lifetime and now - entry.created_at > self.max_lifetime
+
+    def _reap_locked(self, now):
+        """回收閒置過久或壽命已到的連線，但保留 minconn 條。需持有鎖。"""
+        stale = []
+        for entry in list(self._idle):
+            if self._size - len(stale) <= self.minconn and not self._expired(entry, now):
+                continue
+            if (self.max_idle and now - entry.last_used > self.max_idle) or self._expired(entry, now):
+                stale.append(entry)
+        for entry in stale:
+            self._idle.remove(entry)
+            self._size -= 1
+        return stale
+
+    def _healthy(self, entry, now):
+        conn = entry.conn
+        if conn.closed:
+            return False
+        if now - entry.last_used < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """借出一條連線；池滿時最多等待 timeout 秒，逾時拋出 PoolTimeout。"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        while True:
+            entry = None
+            with self._cond:
+                if self._closed:
+                    raise psycopg2.OperationalError("連線池已關閉")
+                while True:
+                    now = time.monotonic()
+                    stale = self._reap_locked(now)
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"等待資料庫連線逾時 ({self.timeout}s)，連線池已滿 ({self.maxconn})")
+                    waited = True
+                    self._cond.wait(remaining)
+
+            for s in stale:
+                self._close(s)
+
+            if entry is None:
+                try:
+                    entry = _PooledConn(self._connect())
+                except psycopg2.Error:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._healthy(entry, time.monotonic()):
+                self._stats['health_failures'] += 1
+                self._close(entry)
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                continue
+
+            with self._cond:
+                self._in_use[id(entry.conn)] = entry
+                wait = time.monotonic() - start
+                self._stats['checkouts'] += 1
+                self._stats['wait_total'] += wait
+                self._stats['wait_max'] = max(self._stats['wait_max'], wait)
+                if waited:
+                    self._stats['waits'] += 1
+            return entry.conn
+
+    def putconn(self, conn, discard=False):
+        """歸還連線。未結束的交易會被 rollback；已損壞或壽命已到的連線會直接關閉。"""
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            return
+
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        now = time.monotonic()
+        if discard or conn.closed or self._closed or self._expired(entry, now):
+            self._close(entry)
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            return
+
+        entry.last_used = now
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    def closeall(self):
+        """關閉所有閒置連線，借出中的連線會在歸還時關閉。"""
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._close(entry)
+
+    def stats(self):
+        """回傳連線池目前狀態與等待時間指標。"""
+        with self._cond:
+            result = dict(self._stats)
+            result.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'maxconn': self.maxconn,
+            })
+        result['wait_avg'] = result['wait_total'] / result['checkouts'] if result['checkouts'] else 0.0
+        return result
+
+
+# --- 全域連線池 (每組連線設定共用一個) ---
+_pools = {}
+_pools_lock = threading.Lock()
+# fork 時子程序繼承的連線池：只保留參照、不關閉也不釋放，
+# 因為 psycopg2 關閉連線會送出 Terminate，把父程序與其他 worker 仍在使用的 session 一起關掉
+_inherited_pools = []
+
+
+def get_pool(config):
+    """取得 (或建立) 對應此連線設定的全域連線池。"""
+    key = tuple(sorted((k, str(v)) for k, v in config.items()))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(config, **POOL_CONFIG)
+                _pools[key] = pool
+    return pool
+
+
+def reset_pools_after_fork():
+    """(在 fork 出的子程序中、使用資料庫之前呼叫) 捨棄繼承自父程序的連線池，之後由子程序自行建立連線。"""
+    global _pools_lock
+    _inherited_pools.extend(_pools.values())
+    _pools.clear()
+    # 父程序 fork 時若正好持有鎖，子程序中的這把鎖永遠不會被釋放
+    _pools_lock = threading.Lock()
+
+
+def pool_stats():
+    """回傳所有連線池的指標 (以資料庫名稱區分)。"""
+    return {f"{dict(key).get('host')}/{dict(key).get('dbname')}": pool.stats() for key, pool in list(_pools.items())}
+
+
+@atexit.register
+def close_all_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.closeall()
@@ -0,0 +1,140 @@
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+from db_handler import DBHandler
+from upload_store import UPLOAD_FOLDER
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+# 產生縮圖的背景程序數 (0 = 停用，只保留原圖)
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_THUMB_SIZE = int(os.getenv('IMAGE_THUMB_SIZE', 320))      # 列表卡片用
+IMAGE_MEDIUM_SIZE = int(os.getenv('IMAGE_MEDIUM_SIZE', 1280))   # 內文 / 手機全寬用
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 82))
+
+RENDITION_DIR = 'renditions'
+# 名稱 -> (最長邊, 格式)；每個尺寸都另外產生 WebP
+RENDITIONS = {
+    'thumb': (IMAGE_THUMB_SIZE, 'JPEG'),
+    'thumb_webp': (IMAGE_THUMB_SIZE, 'WEBP'),
+    'medium': (IMAGE_MEDIUM_SIZE, 'JPEG'),
+    'medium_webp': (IMAGE_MEDIUM_SIZE, 'WEBP'),
+}
+_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+
+def rendition_path(sha256, name):
+    """衍生圖的儲存路徑 (相對於 UPLOAD_FOLDER)；由原圖內容決定，相同圖片只產生一次"""
+    fmt = RENDITIONS[name][1]
+    return f"{RENDITION_DIR}/{sha256[:2]}/{sha256}_{name}.{_EXTENSIONS[fmt]}"
+
+
+def generate_renditions(source_path, sha256):
+    """
+    (在背景程序中執行) 讀取原圖並產生各尺寸的 JPEG 與 WebP。
+    原圖小於目標尺寸時不放大；已存在的衍生圖直接沿用。
+    回傳 {名稱: {'path', 'width', 'height'}}。
+    """
+    result = {}
+    with Image.open(source_path) as original:
+        # 依 EXIF 方向轉正，並捨棄 EXIF (含拍攝地點等資訊)
+        image = ImageOps.exif_transpose(original)
+        image.load()
+    for name, (max_size, fmt) in RENDITIONS.items():
+        path = rendition_path(sha256, name)
+        target = os.path.join(UPLOAD_FOLDER, path)
+        if os.path.exists(target):
+            with Image.open(target) as existing:
+                width, height = existing.size
+        else:
+            resized = image.copy()
+            resized.thumbnail((max_size, max_size), Image.LANCZOS)
+            if fmt == 'JPEG' and resized.mode not in ('RGB', 'L'):
+                # JPEG 不支援透明，以白底合成
+                background = Image.new('RGB', resized.size, (255, 255, 255))
+                background.paste(resized, mask=resized.convert('RGBA').split()[-1])
+                resized = background
+            elif fmt == 'WEBP' and resized.mode not in ('RGB', 'RGBA'):
+                has_alpha = 'A' in resized.getbands() or 'transparency' in resized.info
+                resized = resized.convert('RGBA' if has_alpha else 'RGB')
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            temp = f"{target}.{os.getpid()}.tmp"
+            resized.save(temp, fmt, quality=IMAGE_QUALITY, optimize=fmt == 'JPEG', progressive=fmt == 'JPEG')
+            os.replace(temp, target)
+            width, height = resized.size
+        result[name] = {'path': path, 'width': width, 'height': height}
+    return result
+
+
+class RenditionQueue:
+    """
+    上傳圖片後在背景程序池產生縮圖，完成時把結果寫回 files.renditions (同 sha256 的所有紀錄)。
+    上傳的回應不等待處理結果；處理失敗只記錄錯誤，原圖仍可正常使用。
+    """
+
+    def __init__(self, workers=IMAGE_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0}
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # 以 spawn 建立子程序：伺服器是多執行緒程式，fork 可能複製到被鎖住的鎖
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def on_complete(self, callback):
+        """註冊完成時的回呼 callback(file_ids)，例如讓快取失效"""
+        self._listeners.append(callback)
+
+    def submit(self, records):
+        """把上傳紀錄中的圖片送進背景處理 (其他類型的檔案忽略)"""
+        if self.workers <= 0:
+            return
+        for sha256, source in {r['sha256']: r['file_path'] for r in records if is_image(r)}.items():
+            future = self._get_executor().submit(generate_renditions, os.path.join(UPLOAD_FOLDER, source), sha256)
+            future.add_done_callback(lambda f, sha256=sha256: self._done(sha256, f))
+            self._stats['submitted'] += 1
+
+    def _done(self, sha256, future):
+        try:
+            renditions = future.result()
+            with DBHandler() as db:
+                file_ids = db.set_file_renditions(sha256, renditions)
+            if file_ids is None:
+                raise RuntimeError("寫入 files.renditions 失敗")
+        except Exception as e:
+            self._stats['failed'] += 1
+            print(f"產生縮圖時發生錯誤 (sha256: {sha256}): {e}")
+            return
+        self._stats['completed'] += 1
+        for callback in self._listeners:
+            callback(file_ids)
+
+    def stop(self):
+        """等待進行中的工作完成後關閉程序池 (關機時呼叫)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=True)
+
+    def stats(self):
+        return dict(self._stats)
+
+
+def is_image(record):
+    name = (record.get('original_filename') or '').lower()
+    return record.get('file_type') == 'images' or name.endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp'))
+
+
+rendition_queue = RenditionQueue()
+atexit.register(rendition_queue.stop)
@@ -0,0 +1,124 @@
+import os
+import queue
+import atexit
+import threading
+import time
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from db_handler import DBHandler
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))          # 佇列上限，滿了就丟棄新的日誌
+LOG_BATCH_SIZE = int(os.getenv('LOG_BATCH_SIZE', 500))            # 累積幾筆就寫入
+LOG_FLUSH_INTERVAL = float(os.getenv('LOG_FLUSH_INTERVAL', 2))    # 最多間隔幾秒寫入一次
+
+
+class LogWriter:
+    """
+    使用者活動日誌的背景批次寫入器。
+    路由只把事件放進有上限的記憶體佇列 (不碰資料庫)，背景執行緒累積到 batch_size 筆
+    或每隔 flush_interval 秒，以 execute_values 一次寫入 user_logs。
+    佇列滿時丟棄新事件並計數，不讓日誌拖慢請求。
+    """
+
+    def __init__(self, maxsize=LOG_QUEUE_SIZE, batch_size=LOG_BATCH_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._stop = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats = {'enqueued': 0, 'dropped': 0, 'written': 0, 'failed': 0, 'batches': 0}
+
+    def start(self):
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+            self._thread.start()
+
+    def log(self, user_id, action, details=None, ip_address=None):
+        """放入一筆日誌 (非阻塞)，回傳是否成功放入佇列"""
+        if user_id is None:
+            # user_logs.user_id 不可為 NULL，避免整批寫入失敗
+            self._stats['dropped'] += 1
+            return False
+        if self._thread is None:
+            self.start()
+        entry = (user_id, action, datetime.now(timezone.utc), details, ip_address)
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._stats['dropped'] += 1
+            return False
+        self._stats['enqueued'] += 1
+        return True
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        """把佇列中的日誌全部寫入資料庫，回傳寫入筆數"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._drain(self.batch_size)
+                if not batch:
+                    return written
+                written += self._write(batch)
+
+    def _write(self, batch):
+        try:
+            with DBHandler() as db:
+                if db.create_logs(batch):
+                    self._stats['written'] += len(batch)
+                    self._stats['batches'] += 1
+                    return len(batch)
+                # 整批失敗時 (例如其中一位使用者已被刪除) 逐筆重試，只丟棄有問題的那幾筆
+                ok = 0
+                for user_id, action, action_time, details, ip_address in batch:
+                    if db.create_logs([(user_id, action, action_time, details, ip_address)]):
+                        ok += 1
+                self._stats['written'] += ok
+                self._stats['failed'] += len(batch) - ok
+                return ok
+        except Exception as e:
+            print(f"寫入使用者日誌時發生錯誤: {e}")
+            self._stats['failed'] += len(batch)
+            return 0
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while not self._stop.is_set():
+            # 等到佇列累積足夠筆數或時間到
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            self._stop.wait(min(timeout, 0.2))
+            if self._queue.qsize() >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
+
+    def stop(self):
+        """停止背景執行緒並寫入剩餘的日誌 (關機時呼叫)"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def stats(self):
+        result = dict(self._stats)
+        result['queued'] = self._queue.qsize()
+        return result
+
+
+log_writer = LogWriter()
+atexit.register(log_writer.stop)
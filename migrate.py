@@ -0,0 +1,54 @@
+import argparse
+import sys
+from db_handler import DBHandler
+
+# 資料庫版本管理
+#   python migrate.py            套用所有尚未執行的 migrations
+#   python migrate.py --status   列出各 migration 是否已套用
+#   python migrate.py --check    以 EXPLAIN 檢查常用查詢是否有循序掃描
+#   python migrate.py --partitions  執行一次分區維護 (建立之後月份的分區、移除過期分區)，可排入 cron
+#   python migrate.py --post-cards  重新計算所有文章的列表卡片 (直接以 SQL 修改文章資料後使用)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="資料庫 migration 工具")
+    parser.add_argument('--status', action='store_true', help="列出 migration 套用狀態")
+    parser.add_argument('--check', action='store_true', help="以 EXPLAIN 檢查常用查詢是否會循序掃描")
+    parser.add_argument('--partitions', action='store_true', help="執行一次分區維護")
+    parser.add_argument('--post-cards', action='store_true', help="重新計算所有文章的列表卡片 (post_cards)")
+    args = parser.parse_args()
+
+    if args.partitions:
+        from partitions import partition_maintainer
+        result = partition_maintainer.run()
+        for table, changes in result.items():
+            print(f"{table}: 新建 {len(changes['created'])} 個分區，移除 {len(changes['expired'])} 個分區")
+        return 0 if result else 1
+
+    with DBHandler() as db:
+        if args.status:
+            done = db.applied_migrations()
+            for version, name in db._migration_files():
+                print(f"[{'x' if version in done else ' '}] {name}")
+            return 0
+
+        if args.post_cards:
+            done = db.rebuild_post_cards()
+            if done is None:
+                return 1
+            print(f"已重新計算 {done} 篇文章的卡片。")
+            return 0
+
+        if args.check:
+            findings = db.check_query_plans()
+            if findings is None:
+                return 1
+            if not findings:
+                print("所有常用查詢皆可使用索引。")
+            return 1 if findings else 0
+
+        return 0 if db.setup_database() is not None else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
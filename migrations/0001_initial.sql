@@ -1,20 +1,24 @@
--- 刪除舊有的資料表 (如果存在)，CASCADE 會一併移除相關的相依性
-DROP TABLE IF EXISTS bulletin_messages,
-post_hashtags,
-attachments,
-posts,
-users,
-categories,
-hashtags CASCADE;
-DROP TYPE IF EXISTS user_permission, category_enum, post_status_enum, file_enum;
--- 如果 ENUM 型別已存在，先刪除
--- 建立一個自訂的 ENUM 型別來限制 permission 欄位的值
-CREATE TYPE user_permission AS ENUM ('manager', 'editor', 'viewer');
-CREATE TYPE category_enum AS ENUM ('latest_news', 'instructions');
-CREATE TYPE post_status_enum AS ENUM ('published', 'draft', 'archived');
-CREATE TYPE file_enum AS ENUM ('files', 'images', 'attachments');
+-- 0001: 初始資料表 (與原本 schema.sql 相同，但不再 DROP 既有資料)
+-- 使用 IF NOT EXISTS，讓以舊版 schema.sql 建立的資料庫也能直接套用並納入版本管理
+-- 建立自訂的 ENUM 型別 (已存在則略過)
+DO $$ BEGIN
+    CREATE TYPE user_permission AS ENUM ('manager', 'editor', 'viewer');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+DO $$ BEGIN
+    CREATE TYPE category_enum AS ENUM ('latest_news', 'instructions');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+DO $$ BEGIN
+    CREATE TYPE post_status_enum AS ENUM ('published', 'draft', 'archived');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
+DO $$ BEGIN
+    CREATE TYPE file_enum AS ENUM ('files', 'images', 'attachments');
+EXCEPTION WHEN duplicate_object THEN NULL;
+END $$;
 -- 使用者資料表 (增加帳號、密碼雜湊、權限)
-CREATE TABLE users (
+CREATE TABLE IF NOT EXISTS users (
     id SERIAL PRIMARY KEY,
     name VARCHAR(100) NOT NULL,
     account VARCHAR(100) NOT NULL UNIQUE,
@@ -31,7 +35,7 @@ CREATE TABLE users (
 );
 
 -- 【新功能】使用者活動日誌資料表
-CREATE TABLE user_logs (
+CREATE TABLE IF NOT EXISTS user_logs (
     id SERIAL PRIMARY KEY,
     user_id INT NOT NULL,
     action_time TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
@@ -41,7 +45,7 @@ CREATE TABLE user_logs (
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 -- 【新功能】Refresh Tokens 資料表
-CREATE TABLE refresh_tokens (
+CREATE TABLE IF NOT EXISTS refresh_tokens (
     id SERIAL PRIMARY KEY,
     user_id INT NOT NULL,
     token VARCHAR(255) NOT NULL UNIQUE,
@@ -50,17 +54,17 @@ CREATE TABLE refresh_tokens (
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 -- 【新】單一分類資料表
-CREATE TABLE categories (
+CREATE TABLE IF NOT EXISTS categories (
     name VARCHAR(50) NOT NULL PRIMARY KEY,
     category_type category_enum NOT NULL
 );
 -- 標籤資料表
-CREATE TABLE hashtags (
+CREATE TABLE IF NOT EXISTS hashtags (
     id SERIAL PRIMARY KEY,
     tag_name VARCHAR(50) NOT NULL UNIQUE
 );
 -- 公告主資料表 (增加點擊計數)
-CREATE TABLE posts (
+CREATE TABLE IF NOT EXISTS posts (
     id SERIAL PRIMARY KEY,
     title VARCHAR(255) NOT NULL,
     content TEXT,
@@ -75,7 +79,7 @@ CREATE TABLE posts (
     FOREIGN KEY (category_name) REFERENCES categories(name) ON UPDATE CASCADE ON DELETE SET NULL
 );
 -- 附件資料表
-CREATE TABLE files (
+CREATE TABLE IF NOT EXISTS files (
     id SERIAL PRIMARY KEY,
     post_id INT NULL, -- post id 初始為 NULL
     file_type file_enum NOT NULL,
@@ -85,7 +89,7 @@ CREATE TABLE files (
     FOREIGN KEY (post_id) REFERENCES posts(id) ON DELETE CASCADE
 );
 -- 公告與標籤的關聯表
-CREATE TABLE post_hashtags (
+CREATE TABLE IF NOT EXISTS post_hashtags (
     post_id INT NOT NULL,
     hashtag_id INT NOT NULL,
     PRIMARY KEY (post_id, hashtag_id),
@@ -93,7 +97,7 @@ CREATE TABLE post_hashtags (
     FOREIGN KEY (hashtag_id) REFERENCES hashtags(id) ON DELETE CASCADE
 );
 -- 【新增】留言板資料表
-CREATE TABLE bulletin_messages (
+CREATE TABLE IF NOT EXISTS bulletin_messages (
     id SERIAL PRIMARY KEY,
     author_name VARCHAR(100) NOT NULL DEFAULT '匿名訪客',
     -- 留言者名稱，提供預設值
@@ -102,4 +106,4 @@ CREATE TABLE bulletin_messages (
     department VARCHAR(100),
     campus VARCHAR(100),
     created_at TIMESTAMP NOT NULL DEFAULT NOW() -- 留言時間 (對應您的 date 需求)
-);
\ No newline at end of file
+);
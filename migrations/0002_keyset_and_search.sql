@@ -0,0 +1,49 @@
+-- 0002: keyset 分頁索引與文章全文搜尋
+
+-- keyset 分頁用的複合索引 (排序欄位 + id，讓任何一頁的成本都與第一頁相同)
+CREATE INDEX IF NOT EXISTS idx_posts_announcement_date_id ON posts (announcement_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_posts_click_count_id ON posts (click_count DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_bulletin_messages_created_at_id ON bulletin_messages (created_at DESC, id DESC);
+
+-- 全文搜尋用的斷詞函式
+-- 英數字詞轉小寫保留；中文 (CJK) 連續字串切成重疊的二字詞 (bigram)，例如「補助文件」=> 補助 助文 文件
+-- 查詢端使用同一個函式，因此搜尋「補助」可以直接命中 GIN 索引
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE OR REPLACE FUNCTION search_tokens(src TEXT) RETURNS TEXT
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+DECLARE
+    tokens TEXT[];
+    run TEXT;
+    i INT;
+BEGIN
+    IF src IS NULL THEN
+        RETURN '';
+    END IF;
+    tokens := ARRAY(SELECT m[1] FROM regexp_matches(lower(src), '([a-z0-9]+)', 'g') AS m);
+    FOR run IN SELECT m[1] FROM regexp_matches(src, '([㐀-䶿一-鿿豈-﫿]+)', 'g') AS m LOOP
+        IF char_length(run) = 1 THEN
+            tokens := tokens || run;
+        ELSE
+            FOR i IN 1 .. char_length(run) - 1 LOOP
+                tokens := tokens || substr(run, i, 2);
+            END LOOP;
+        END IF;
+    END LOOP;
+    RETURN array_to_string(tokens, ' ');
+END;
+$$;
+-- 去除 HTML 標籤，只留下文字
+CREATE OR REPLACE FUNCTION strip_html(src TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT regexp_replace(replace(coalesce(src, ''), '&nbsp;', ' '), '<[^>]*>', ' ', 'g');
+$$;
+
+-- 全文搜尋向量 (標題權重 A，內文權重 B)，隨 title/content 自動維護
+ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', search_tokens(title)), 'A') ||
+    setweight(to_tsvector('simple', search_tokens(strip_html(content))), 'B')
+) STORED;
+
+-- q= 全文搜尋使用 search_vector，title_keyword 的 ILIKE '%...%' 使用 trigram
+CREATE INDEX IF NOT EXISTS idx_posts_search_vector ON posts USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_posts_title_trgm ON posts USING GIN (title gin_trgm_ops);
@@ -0,0 +1,26 @@
+-- 0003: 依 db_handler.py 實際的 WHERE / ORDER BY 建立的次要索引
+
+-- get_post / get_posts: files WHERE post_id = ... AND file_type = ...；刪除文章時的 ON DELETE CASCADE
+CREATE INDEX IF NOT EXISTS idx_files_post_id_file_type ON files (post_id, file_type);
+-- get_files: WHERE file_type = ... ORDER BY id
+CREATE INDEX IF NOT EXISTS idx_files_file_type_id ON files (file_type, id);
+
+-- get_posts: WHERE category_name = ANY(...) AND status = ... ORDER BY announcement_date DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_posts_category_status_date ON posts (category_name, status, announcement_date DESC, id DESC);
+-- get_posts: WHERE status = ... ORDER BY announcement_date DESC (未指定分類的公開列表)
+CREATE INDEX IF NOT EXISTS idx_posts_status_date ON posts (status, announcement_date DESC, id DESC);
+-- get_posts: WHERE user_id = ...；刪除使用者時的外鍵檢查
+CREATE INDEX IF NOT EXISTS idx_posts_user_id ON posts (user_id);
+
+-- 依標籤反查文章；刪除標籤時的 ON DELETE CASCADE (主鍵 (post_id, hashtag_id) 無法用於 hashtag_id 查詢)
+CREATE INDEX IF NOT EXISTS idx_post_hashtags_hashtag_id ON post_hashtags (hashtag_id);
+
+-- bulletin_messages.created_at 已由 0002 的 (created_at DESC, id DESC) 涵蓋
+
+-- 清除過期 refresh token：WHERE expires_at < NOW()
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires_at ON refresh_tokens (expires_at);
+-- 依使用者查詢/刪除 refresh token
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_id ON refresh_tokens (user_id);
+
+-- 依使用者查詢活動日誌；刪除使用者時的 ON DELETE CASCADE
+CREATE INDEX IF NOT EXISTS idx_user_logs_user_id ON user_logs (user_id, action_time DESC);
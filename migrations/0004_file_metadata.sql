@@ -0,0 +1,3 @@
+-- 0004: 上傳時串流計算的檔案大小與 SHA-256 (舊資料為 NULL)
+ALTER TABLE files ADD COLUMN IF NOT EXISTS file_size BIGINT;
+ALTER TABLE files ADD COLUMN IF NOT EXISTS sha256 CHAR(64);
@@ -0,0 +1,7 @@
+-- 0005: 內容定址儲存 (upload_store.py)
+-- 相同內容的上傳共用 uploads/blobs/<sha256> 同一個實體檔案，file_path 不再唯一；
+-- 引用數即同 sha256 的資料列數，刪除最後一筆時才刪除實體檔案。
+ALTER TABLE files DROP CONSTRAINT IF EXISTS files_file_path_key;
+CREATE INDEX IF NOT EXISTS idx_files_sha256 ON files (sha256) WHERE sha256 IS NOT NULL;
+-- 舊資料 (沒有 sha256) 刪除時以 file_path 判斷是否仍被引用
+CREATE INDEX IF NOT EXISTS idx_files_file_path ON files (file_path);
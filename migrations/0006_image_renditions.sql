@@ -0,0 +1,3 @@
+-- 0006: 圖片衍生圖 (image_renditions.py)
+-- {"thumb": {"path": "renditions/ab/<sha256>_thumb.jpg", "width": 320, "height": 240}, ...}，尚未產生時為 NULL
+ALTER TABLE files ADD COLUMN IF NOT EXISTS renditions JSONB;
@@ -0,0 +1,17 @@
+-- 0007: refresh token 只存 SHA-256 雜湊，並支援輪替 (rotation) 與重複使用偵測
+-- 既有的明文 token 直接換成雜湊，已登入的使用者不受影響
+UPDATE refresh_tokens SET token = encode(sha256(convert_to(token, 'UTF8')), 'hex') WHERE length(token) <> 64;
+DO $$ BEGIN
+    ALTER TABLE refresh_tokens RENAME COLUMN token TO token_hash;
+EXCEPTION WHEN undefined_column THEN NULL;
+END $$;
+
+-- 同一次登入輪替出來的 token 屬於同一個 family；已輪替掉的 token 被再次使用時撤銷整個 family
+ALTER TABLE refresh_tokens ADD COLUMN IF NOT EXISTS family_id UUID NOT NULL DEFAULT gen_random_uuid();
+ALTER TABLE refresh_tokens ADD COLUMN IF NOT EXISTS revoked_at TIMESTAMP WITH TIME ZONE;
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family_id ON refresh_tokens (family_id);
+-- 每位使用者 token 數上限：依建立時間找出最舊的有效 token
+DROP INDEX IF EXISTS idx_refresh_tokens_user_id;
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_active ON refresh_tokens (user_id, created_at DESC) WHERE revoked_at IS NULL;
+-- 清除工作：已撤銷且超過保留期限的 token
+CREATE INDEX IF NOT EXISTS idx_refresh_tokens_revoked_at ON refresh_tokens (revoked_at) WHERE revoked_at IS NOT NULL;
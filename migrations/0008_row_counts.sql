@@ -0,0 +1,203 @@
+-- 0008: 列表總數改由計數表提供，不必每次分頁都對整張表 COUNT(*)
+-- row_counts 保存常用篩選組合的精確筆數，由觸發器在新增/刪除/修改篩選欄位時維護：
+--   dimension = 篩選欄位 (依字母排序，以逗號連接；'' 表示整張表)
+--   value     = 各欄位的值 (以 \x1f 連接)，欄位值為 NULL 的資料列不計入該 dimension
+CREATE TABLE IF NOT EXISTS row_counts (
+    table_name TEXT NOT NULL,
+    dimension TEXT NOT NULL,
+    value TEXT NOT NULL,
+    total BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (table_name, dimension, value)
+);
+
+-- 各資料表一筆資料列對應的計數 key
+CREATE OR REPLACE FUNCTION posts_count_keys(p_status TEXT, p_category_name TEXT, p_user_id TEXT)
+RETURNS TABLE (dimension TEXT, value TEXT) LANGUAGE sql IMMUTABLE AS $$
+    SELECT k.dimension, k.value FROM (VALUES
+        ('', ''),
+        ('status', p_status),
+        ('category_name', p_category_name),
+        ('user_id', p_user_id),
+        ('category_name,status', p_category_name || E'\x1f' || p_status)
+    ) AS k(dimension, value)
+    WHERE k.value IS NOT NULL;
+$$;
+
+CREATE OR REPLACE FUNCTION files_count_keys(p_file_type TEXT)
+RETURNS TABLE (dimension TEXT, value TEXT) LANGUAGE sql IMMUTABLE AS $$
+    SELECT k.dimension, k.value FROM (VALUES
+        ('', ''),
+        ('file_type', p_file_type)
+    ) AS k(dimension, value)
+    WHERE k.value IS NOT NULL;
+$$;
+
+CREATE OR REPLACE FUNCTION bulletin_messages_count_keys(p_campus TEXT, p_department TEXT)
+RETURNS TABLE (dimension TEXT, value TEXT) LANGUAGE sql IMMUTABLE AS $$
+    SELECT k.dimension, k.value FROM (VALUES
+        ('', ''),
+        ('campus', p_campus),
+        ('department', p_department),
+        ('campus,department', p_campus || E'\x1f' || p_department)
+    ) AS k(dimension, value)
+    WHERE k.value IS NOT NULL;
+$$;
+
+-- 新增 / 刪除：statement-level 觸發器，整批資料 (例如 ON DELETE CASCADE、批次匯入) 彙總後每個 key 只更新一次
+-- 修改：只有篩選欄位真的改變時才觸發 (點擊數寫回等一般 UPDATE 不會碰到計數表)
+-- 依 key 排序後寫入，並行的交易以相同順序加鎖，避免死結
+CREATE OR REPLACE FUNCTION posts_row_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM row_counts WHERE table_name = 'posts';
+    ELSIF TG_OP = 'INSERT' THEN
+        INSERT INTO row_counts (table_name, dimension, value, total)
+        SELECT 'posts', k.dimension, k.value, COUNT(*)
+        FROM new_rows r, posts_count_keys(r.status::text, r.category_name, r.user_id::text) k
+        GROUP BY k.dimension, k.value ORDER BY k.dimension, k.value
+        ON CONFLICT (table_name, dimension, value) DO UPDATE SET total = row_counts.total + EXCLUDED.total;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO row_counts (table_name, dimension, value, total)
+        SELECT 'posts', k.dimension, k.value, -COUNT(*)
+        FROM old_rows r, posts_count_keys(r.status::text, r.category_name, r.user_id::text) k
+        GROUP BY k.dimension, k.value ORDER BY k.dimension, k.value
+        ON CONFLICT (table_name, dimension, value) DO UPDATE SET total = row_counts.total + EXCLUDED.total;
+    ELSE
+        INSERT INTO row_counts (table_name, dimension, value, total)
+        SELECT 'posts', d.dimension, d.value, SUM(d.delta)
+        FROM (
+            SELECT k.dimension, k.value, -1 AS delta FROM posts_count_keys(OLD.status::text, OLD.category_name, OLD.user_id::text) k
+            UNION ALL
+            SELECT k.dimension, k.value, 1 FROM posts_count_keys(NEW.status::text, NEW.category_name, NEW.user_id::text) k
+        ) AS d
+        GROUP BY d.dimension, d.value HAVING SUM(d.delta) <> 0 ORDER BY d.dimension, d.value
+        ON CONFLICT (table_name, dimension, value) DO UPDATE SET total = row_counts.total + EXCLUDED.total;
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION files_row_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM row_counts WHERE table_name = 'files';
+    ELSIF TG_OP = 'INSERT' THEN
+        INSERT INTO row_counts (table_name, dimension, value, total)
+        SELECT 'files', k.dimension, k.value, COUNT(*)
+        FROM new_rows r, files_count_keys(r.file_type::text) k
+        GROUP BY k.dimension, k.value ORDER BY k.dimension, k.value
+        ON CONFLICT (table_name, dimension, value) DO UPDATE SET total = row_counts.total + EXCLUDED.total;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO row_counts (table_name, dimension, value, total)
+        SELECT 'files', k.dimension, k.value, -COUNT(*)
+        FROM old_rows r, files_count_keys(r.file_type::text) k
+        GROUP BY k.dimension, k.value ORDER BY k.dimension, k.value
+        ON CONFLICT (table_name, dimension, value) DO UPDATE SET total = row_counts.total + EXCLUDED.total;
+    ELSE
+        INSERT INTO row_counts (table_name, dimension, value, total)
+        SELECT 'files', d.dimension, d.value, SUM(d.delta)
+        FROM (
+            SELECT k.dimension, k.value, -1 AS delta FROM files_count_keys(OLD.file_type::text) k
+            UNION ALL
+            SELECT k.dimension, k.value, 1 FROM files_count_keys(NEW.file_type::text) k
+        ) AS d
+        GROUP BY d.dimension, d.value HAVING SUM(d.delta) <> 0 ORDER BY d.dimension, d.value
+        ON CONFLICT (table_name, dimension, value) DO UPDATE SET total = row_counts.total + EXCLUDED.total;
+    END IF;
+    RETURN NULL;
+END $$;
+
+CREATE OR REPLACE FUNCTION bulletin_messages_row_counts() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM row_counts WHERE table_name = 'bulletin_messages';
+    ELSIF TG_OP = 'INSERT' THEN
+        INSERT INTO row_counts (table_name, dimension, value, total)
+        SELECT 'bulletin_messages', k.dimension, k.value, COUNT(*)
+        FROM new_rows r, bulletin_messages_count_keys(r.campus, r.department) k
+        GROUP BY k.dimension, k.value ORDER BY k.dimension, k.value
+        ON CONFLICT (table_name, dimension, value) DO UPDATE SET total = row_counts.total + EXCLUDED.total;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO row_counts (table_name, dimension, value, total)
+        SELECT 'bulletin_messages', k.dimension, k.value, -COUNT(*)
+        FROM old_rows r, bulletin_messages_count_keys(r.campus, r.department) k
+        GROUP BY k.dimension, k.value ORDER BY k.dimension, k.value
+        ON CONFLICT (table_name, dimension, value) DO UPDATE SET total = row_counts.total + EXCLUDED.total;
+    ELSE
+        INSERT INTO row_counts (table_name, dimension, value, total)
+        SELECT 'bulletin_messages', d.dimension, d.value, SUM(d.delta)
+        FROM (
+            SELECT k.dimension, k.value, -1 AS delta FROM bulletin_messages_count_keys(OLD.campus, OLD.department) k
+            UNION ALL
+            SELECT k.dimension, k.value, 1 FROM bulletin_messages_count_keys(NEW.campus, NEW.department) k
+        ) AS d
+        GROUP BY d.dimension, d.value HAVING SUM(d.delta) <> 0 ORDER BY d.dimension, d.value
+        ON CONFLICT (table_name, dimension, value) DO UPDATE SET total = row_counts.total + EXCLUDED.total;
+    END IF;
+    RETURN NULL;
+END $$;
+
+-- 建立觸發器與回填在同一個交易內完成，期間暫停寫入，計數不會漏算或重複
+LOCK TABLE posts, files, bulletin_messages IN SHARE ROW EXCLUSIVE MODE;
+
+DROP TRIGGER IF EXISTS posts_row_counts_insert ON posts;
+DROP TRIGGER IF EXISTS posts_row_counts_delete ON posts;
+DROP TRIGGER IF EXISTS posts_row_counts_update ON posts;
+DROP TRIGGER IF EXISTS posts_row_counts_truncate ON posts;
+CREATE TRIGGER posts_row_counts_insert AFTER INSERT ON posts
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION posts_row_counts();
+CREATE TRIGGER posts_row_counts_delete AFTER DELETE ON posts
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION posts_row_counts();
+CREATE TRIGGER posts_row_counts_update AFTER UPDATE OF status, category_name, user_id ON posts
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status OR OLD.category_name IS DISTINCT FROM NEW.category_name
+          OR OLD.user_id IS DISTINCT FROM NEW.user_id)
+    EXECUTE FUNCTION posts_row_counts();
+CREATE TRIGGER posts_row_counts_truncate AFTER TRUNCATE ON posts
+    FOR EACH STATEMENT EXECUTE FUNCTION posts_row_counts();
+
+DROP TRIGGER IF EXISTS files_row_counts_insert ON files;
+DROP TRIGGER IF EXISTS files_row_counts_delete ON files;
+DROP TRIGGER IF EXISTS files_row_counts_update ON files;
+DROP TRIGGER IF EXISTS files_row_counts_truncate ON files;
+CREATE TRIGGER files_row_counts_insert AFTER INSERT ON files
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION files_row_counts();
+CREATE TRIGGER files_row_counts_delete AFTER DELETE ON files
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION files_row_counts();
+CREATE TRIGGER files_row_counts_update AFTER UPDATE OF file_type ON files
+    FOR EACH ROW WHEN (OLD.file_type IS DISTINCT FROM NEW.file_type)
+    EXECUTE FUNCTION files_row_counts();
+CREATE TRIGGER files_row_counts_truncate AFTER TRUNCATE ON files
+    FOR EACH STATEMENT EXECUTE FUNCTION files_row_counts();
+
+DROP TRIGGER IF EXISTS bulletin_messages_row_counts_insert ON bulletin_messages;
+DROP TRIGGER IF EXISTS bulletin_messages_row_counts_delete ON bulletin_messages;
+DROP TRIGGER IF EXISTS bulletin_messages_row_counts_update ON bulletin_messages;
+DROP TRIGGER IF EXISTS bulletin_messages_row_counts_truncate ON bulletin_messages;
+CREATE TRIGGER bulletin_messages_row_counts_insert AFTER INSERT ON bulletin_messages
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bulletin_messages_row_counts();
+CREATE TRIGGER bulletin_messages_row_counts_delete AFTER DELETE ON bulletin_messages
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION bulletin_messages_row_counts();
+CREATE TRIGGER bulletin_messages_row_counts_update AFTER UPDATE OF campus, department ON bulletin_messages
+    FOR EACH ROW WHEN (OLD.campus IS DISTINCT FROM NEW.campus OR OLD.department IS DISTINCT FROM NEW.department)
+    EXECUTE FUNCTION bulletin_messages_row_counts();
+CREATE TRIGGER bulletin_messages_row_counts_truncate AFTER TRUNCATE ON bulletin_messages
+    FOR EACH STATEMENT EXECUTE FUNCTION bulletin_messages_row_counts();
+
+-- 回填既有資料
+DELETE FROM row_counts WHERE table_name IN ('posts', 'files', 'bulletin_messages');
+INSERT INTO row_counts (table_name, dimension, value, total)
+SELECT 'posts', k.dimension, k.value, COUNT(*)
+FROM posts r, posts_count_keys(r.status::text, r.category_name, r.user_id::text) k
+GROUP BY k.dimension, k.value;
+INSERT INTO row_counts (table_name, dimension, value, total)
+SELECT 'files', k.dimension, k.value, COUNT(*)
+FROM files r, files_count_keys(r.file_type::text) k
+GROUP BY k.dimension, k.value;
+INSERT INTO row_counts (table_name, dimension, value, total)
+SELECT 'bulletin_messages', k.dimension, k.value, COUNT(*)
+FROM bulletin_messages r, bulletin_messages_count_keys(r.campus, r.department) k
+GROUP BY k.dimension, k.value;
+-- 空資料表也要有整表的計數列
+INSERT INTO row_counts (table_name, dimension, value, total)
+VALUES ('posts', '', '', 0), ('files', '', '', 0), ('bulletin_messages', '', '', 0)
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,10 @@
+-- 0009: 布告欄改以半開區間 created_at >= 起 AND created_at < 迄 篩選日期 (不再 created_at::date = ...)
+-- 院區 / 部門篩選加上日期範圍與 keyset 分頁時，可直接依索引順序取出一頁，不需排序
+
+-- WHERE campus = ... [AND department = ...] [AND created_at 範圍] ORDER BY created_at DESC, id DESC
+CREATE INDEX IF NOT EXISTS idx_bulletin_messages_campus_department_created
+    ON bulletin_messages (campus, department, created_at DESC, id DESC);
+-- 只篩選部門時 (上面的索引以 campus 開頭，無法使用)
+CREATE INDEX IF NOT EXISTS idx_bulletin_messages_department_created
+    ON bulletin_messages (department, created_at DESC, id DESC);
+-- 只有日期範圍時沿用 0002 的 idx_bulletin_messages_created_at_id
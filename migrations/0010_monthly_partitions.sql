@@ -0,0 +1,122 @@
+-- 0010: user_logs 與 bulletin_messages 改為依月份分區 (declarative range partitioning)
+-- 只會持續新增的資料表分區後，過期資料以 DETACH / DROP 整個分區移除 (不需 DELETE + VACUUM)，
+-- 索引與 VACUUM 的成本只跟保留期間內的資料量有關；帶時間範圍的查詢只會掃描相關月份 (partition pruning)。
+-- 主鍵必須包含分區欄位，改為 (id, 時間欄位)；id 仍由原本的 sequence 產生，不會重複。
+-- 既有資料在本交易中複製到新資料表，資料量大時請在離峰時段執行。
+
+-- 建立某個月份的分區 (名稱 <資料表>_pYYYYMM，已存在則回傳 NULL)；維護工作 (partitions.py) 也使用此函式
+-- 預設分區 (<資料表>_default) 中屬於該月份的資料會先搬到新分區，之後才能 ATTACH
+CREATE OR REPLACE FUNCTION create_monthly_partition(p_parent TEXT, p_column TEXT, p_month DATE)
+RETURNS TEXT LANGUAGE plpgsql AS $$
+DECLARE
+    v_from DATE := date_trunc('month', p_month)::date;
+    v_to DATE := (date_trunc('month', p_month) + INTERVAL '1 month')::date;
+    v_name TEXT := p_parent || '_p' || to_char(p_month, 'YYYYMM');
+    v_default TEXT := p_parent || '_default';
+BEGIN
+    IF to_regclass(v_name) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', v_name, p_parent);
+    IF to_regclass(v_default) IS NOT NULL THEN
+        EXECUTE format('WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                       v_default, p_column, v_from, p_column, v_to, v_name);
+    END IF;
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', p_parent, v_name, v_from, v_to);
+    RETURN v_name;
+END $$;
+
+LOCK TABLE user_logs, bulletin_messages IN ACCESS EXCLUSIVE MODE;
+
+-- --- user_logs (依 action_time) ---
+ALTER TABLE user_logs RENAME TO user_logs_unpartitioned;
+ALTER INDEX user_logs_pkey RENAME TO user_logs_unpartitioned_pkey;
+ALTER SEQUENCE user_logs_id_seq OWNED BY NONE;
+CREATE TABLE user_logs (
+    id INT NOT NULL DEFAULT nextval('user_logs_id_seq'),
+    user_id INT NOT NULL,
+    action_time TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    action VARCHAR(50) NOT NULL,
+    details JSONB,
+    ip_address VARCHAR(45),
+    PRIMARY KEY (id, action_time),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+) PARTITION BY RANGE (action_time);
+ALTER SEQUENCE user_logs_id_seq OWNED BY user_logs.id;
+
+-- 既有資料涵蓋的月份到未來 3 個月，其餘落在預設分區 (避免維護工作停擺時寫入失敗)
+DO $$
+DECLARE
+    m DATE;
+BEGIN
+    FOR m IN
+        SELECT generate_series(
+            date_trunc('month', LEAST(COALESCE(MIN(action_time), NOW()), NOW())),
+            date_trunc('month', GREATEST(COALESCE(MAX(action_time), NOW()), NOW() + INTERVAL '3 months')),
+            INTERVAL '1 month')::date
+        FROM user_logs_unpartitioned
+    LOOP
+        PERFORM create_monthly_partition('user_logs', 'action_time', m);
+    END LOOP;
+END $$;
+CREATE TABLE IF NOT EXISTS user_logs_default PARTITION OF user_logs DEFAULT;
+
+INSERT INTO user_logs (id, user_id, action_time, action, details, ip_address)
+SELECT id, user_id, action_time, action, details, ip_address FROM user_logs_unpartitioned;
+DROP TABLE user_logs_unpartitioned;
+
+-- 在分區資料表上建立的索引會自動建立到每個分區 (含之後新增的)
+CREATE INDEX IF NOT EXISTS idx_user_logs_user_id ON user_logs (user_id, action_time DESC);
+
+-- --- bulletin_messages (依 created_at) ---
+ALTER TABLE bulletin_messages RENAME TO bulletin_messages_unpartitioned;
+ALTER INDEX bulletin_messages_pkey RENAME TO bulletin_messages_unpartitioned_pkey;
+ALTER SEQUENCE bulletin_messages_id_seq OWNED BY NONE;
+CREATE TABLE bulletin_messages (
+    id INT NOT NULL DEFAULT nextval('bulletin_messages_id_seq'),
+    author_name VARCHAR(100) NOT NULL DEFAULT '匿名訪客',
+    content TEXT NOT NULL,
+    department VARCHAR(100),
+    campus VARCHAR(100),
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+ALTER SEQUENCE bulletin_messages_id_seq OWNED BY bulletin_messages.id;
+
+DO $$
+DECLARE
+    m DATE;
+BEGIN
+    FOR m IN
+        SELECT generate_series(
+            date_trunc('month', LEAST(COALESCE(MIN(created_at), NOW()), NOW())),
+            date_trunc('month', GREATEST(COALESCE(MAX(created_at), NOW()), NOW() + INTERVAL '3 months')),
+            INTERVAL '1 month')::date
+        FROM bulletin_messages_unpartitioned
+    LOOP
+        PERFORM create_monthly_partition('bulletin_messages', 'created_at', m);
+    END LOOP;
+END $$;
+CREATE TABLE IF NOT EXISTS bulletin_messages_default PARTITION OF bulletin_messages DEFAULT;
+
+-- 複製時新資料表還沒有計數觸發器，row_counts 維持原本的值 (資料列相同)
+INSERT INTO bulletin_messages (id, author_name, content, department, campus, created_at)
+SELECT id, author_name, content, department, campus, created_at FROM bulletin_messages_unpartitioned;
+DROP TABLE bulletin_messages_unpartitioned;
+
+CREATE INDEX IF NOT EXISTS idx_bulletin_messages_created_at_id ON bulletin_messages (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_bulletin_messages_campus_department_created
+    ON bulletin_messages (campus, department, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_bulletin_messages_department_created
+    ON bulletin_messages (department, created_at DESC, id DESC);
+
+-- 重新建立 0008 的計數觸發器 (舊資料表刪除時一併移除了)
+CREATE TRIGGER bulletin_messages_row_counts_insert AFTER INSERT ON bulletin_messages
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bulletin_messages_row_counts();
+CREATE TRIGGER bulletin_messages_row_counts_delete AFTER DELETE ON bulletin_messages
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION bulletin_messages_row_counts();
+CREATE TRIGGER bulletin_messages_row_counts_update AFTER UPDATE OF campus, department ON bulletin_messages
+    FOR EACH ROW WHEN (OLD.campus IS DISTINCT FROM NEW.campus OR OLD.department IS DISTINCT FROM NEW.department)
+    EXECUTE FUNCTION bulletin_messages_row_counts();
+CREATE TRIGGER bulletin_messages_row_counts_truncate AFTER TRUNCATE ON bulletin_messages
+    FOR EACH STATEMENT EXECUTE FUNCTION bulletin_messages_row_counts();
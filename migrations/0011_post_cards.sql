@@ -0,0 +1,55 @@
+-- 0011: 文章列表的讀取模型 (read model)
+-- post_cards 每篇文章一列，保存列表卡片需要的資料 (分類的父類別、第一張圖片、附件數、標籤)，
+-- GET /api/posts 只需依索引讀取這張表，不必每次 JOIN posts、files、post_hashtags、hashtags。
+-- 欄位名稱與 posts 相同 (id、title、status ...)，get_posts 的篩選與排序條件可直接沿用。
+-- 由 DBHandler 的寫入路徑在同一個交易中呼叫 refresh_post_cards() 更新受影響的文章；文章刪除時以外鍵一併刪除。
+CREATE TABLE IF NOT EXISTS post_cards (
+    id INT PRIMARY KEY REFERENCES posts(id) ON DELETE CASCADE,
+    title VARCHAR(255) NOT NULL,
+    user_id INT NOT NULL,
+    category_name VARCHAR(50),
+    category_type category_enum,
+    status post_status_enum NOT NULL,
+    click_count INT NOT NULL DEFAULT 0,
+    announcement_date TIMESTAMP NOT NULL,
+    cover_image JSONB,                  -- 第一張圖片 {id, file_path, original_filename, renditions}
+    attachment_count INT NOT NULL DEFAULT 0,
+    hashtags VARCHAR(50)[] NOT NULL DEFAULT '{}',
+    search_vector TSVECTOR              -- 複製 posts.search_vector，全文搜尋也只讀這張表
+);
+
+-- 重新計算指定文章的卡片 (不存在的 id 略過)；內容沒有改變的卡片不會重寫，避免產生 dead tuple
+CREATE OR REPLACE FUNCTION refresh_post_cards(p_ids INT[]) RETURNS VOID LANGUAGE sql AS $$
+    INSERT INTO post_cards (id, title, user_id, category_name, category_type, status, click_count, announcement_date,
+                            cover_image, attachment_count, hashtags, search_vector)
+    SELECT p.id, p.title, p.user_id, p.category_name, c.category_type, p.status, p.click_count, p.announcement_date,
+           (SELECT jsonb_build_object('id', f.id, 'file_path', f.file_path,
+                                      'original_filename', f.original_filename, 'renditions', f.renditions)
+            FROM files f WHERE f.post_id = p.id AND f.file_type = 'images' ORDER BY f.id LIMIT 1),
+           (SELECT COUNT(*) FROM files f WHERE f.post_id = p.id AND f.file_type = 'attachments'),
+           ARRAY(SELECT t.tag_name FROM post_hashtags pt JOIN hashtags t ON t.id = pt.hashtag_id
+                 WHERE pt.post_id = p.id ORDER BY t.tag_name),
+           p.search_vector
+    FROM posts p LEFT JOIN categories c ON c.name = p.category_name
+    WHERE p.id = ANY(p_ids)
+    ORDER BY p.id
+    ON CONFLICT (id) DO UPDATE SET
+        title = EXCLUDED.title, user_id = EXCLUDED.user_id, category_name = EXCLUDED.category_name,
+        category_type = EXCLUDED.category_type, status = EXCLUDED.status, click_count = EXCLUDED.click_count,
+        announcement_date = EXCLUDED.announcement_date, cover_image = EXCLUDED.cover_image,
+        attachment_count = EXCLUDED.attachment_count, hashtags = EXCLUDED.hashtags, search_vector = EXCLUDED.search_vector
+    WHERE (post_cards.*) IS DISTINCT FROM (EXCLUDED.*);
+$$;
+
+-- 與 0002 / 0003 中 posts 的索引相同，依篩選條件取出一頁時不需排序
+CREATE INDEX IF NOT EXISTS idx_post_cards_announcement_date_id ON post_cards (announcement_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_post_cards_click_count_id ON post_cards (click_count DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_post_cards_category_status_date ON post_cards (category_name, status, announcement_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_post_cards_status_date ON post_cards (status, announcement_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_post_cards_user_id ON post_cards (user_id, announcement_date DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_post_cards_search_vector ON post_cards USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_post_cards_title_trgm ON post_cards USING GIN (title gin_trgm_ops);
+
+-- 回填既有文章 (期間暫停文章與檔案的寫入，避免漏掉同時進行的修改)
+LOCK TABLE posts, files, post_hashtags IN SHARE ROW EXCLUSIVE MODE;
+SELECT refresh_post_cards(ARRAY(SELECT id FROM posts));
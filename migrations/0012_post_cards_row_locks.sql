@@ -0,0 +1,30 @@
+-- 0012: refresh_post_cards 先鎖住來源文章再計算卡片
+-- 0011 的版本是單一 INSERT ... SELECT ... ON CONFLICT：在 READ COMMITTED 下 SELECT 的快照在等待卡片列鎖之前就已取得，
+-- 與點擊數寫回、修改文章同時執行時，會把等待期間已提交的新值覆蓋回舊值。
+-- 改為 plpgsql：先以 FOR UPDATE 依 id 順序鎖住 posts 資料列 (與 add_click_counts、update_post 的鎖相同)，
+-- 取得鎖之後的下一個語句會取得新的快照，計算出的卡片一定包含先前已提交的修改。
+CREATE OR REPLACE FUNCTION refresh_post_cards(p_ids INT[]) RETURNS VOID LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM 1 FROM posts WHERE id = ANY(p_ids) ORDER BY id FOR UPDATE;
+
+    INSERT INTO post_cards (id, title, user_id, category_name, category_type, status, click_count, announcement_date,
+                            cover_image, attachment_count, hashtags, search_vector)
+    SELECT p.id, p.title, p.user_id, p.category_name, c.category_type, p.status, p.click_count, p.announcement_date,
+           (SELECT jsonb_build_object('id', f.id, 'file_path', f.file_path,
+                                      'original_filename', f.original_filename, 'renditions', f.renditions)
+            FROM files f WHERE f.post_id = p.id AND f.file_type = 'images' ORDER BY f.id LIMIT 1),
+           (SELECT COUNT(*) FROM files f WHERE f.post_id = p.id AND f.file_type = 'attachments'),
+           ARRAY(SELECT t.tag_name FROM post_hashtags pt JOIN hashtags t ON t.id = pt.hashtag_id
+                 WHERE pt.post_id = p.id ORDER BY t.tag_name),
+           p.search_vector
+    FROM posts p LEFT JOIN categories c ON c.name = p.category_name
+    WHERE p.id = ANY(p_ids)
+    ORDER BY p.id
+    ON CONFLICT (id) DO UPDATE SET
+        title = EXCLUDED.title, user_id = EXCLUDED.user_id, category_name = EXCLUDED.category_name,
+        category_type = EXCLUDED.category_type, status = EXCLUDED.status, click_count = EXCLUDED.click_count,
+        announcement_date = EXCLUDED.announcement_date, cover_image = EXCLUDED.cover_image,
+        attachment_count = EXCLUDED.attachment_count, hashtags = EXCLUDED.hashtags, search_vector = EXCLUDED.search_vector
+    WHERE (post_cards.*) IS DISTINCT FROM (EXCLUDED.*);
+END;
+$$;
@@ -0,0 +1,22 @@
+-- 0013: 全文搜尋也能找單一中文字
+-- 0002 的 search_vector 只存二字詞，連續的中文字串不會產生單字 token，因此搜尋「車」永遠找不到「車輛管理」。
+-- 建立索引專用的 search_index_tokens()：在二字詞之外另外輸出每個中文字。
+-- 查詢端仍使用 search_tokens()：單一中文字查詢得到單字 token，二字以上仍以二字詞比對 (不受單字影響)。
+CREATE OR REPLACE FUNCTION search_index_tokens(src TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT concat_ws(' ', search_tokens(src),
+                     (SELECT string_agg(DISTINCT m[1], ' ') FROM regexp_matches(coalesce(src, ''), '([㐀-䶿一-鿿豈-﫿])', 'g') AS m));
+$$;
+
+-- search_vector 是 generated column，無法直接修改運算式，只能刪除後重建 (會重寫整張 posts 並重建 GIN 索引)
+ALTER TABLE posts DROP COLUMN IF EXISTS search_vector;
+ALTER TABLE posts ADD COLUMN search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', search_index_tokens(title)), 'A') ||
+    setweight(to_tsvector('simple', search_index_tokens(strip_html(content))), 'B')
+) STORED;
+CREATE INDEX IF NOT EXISTS idx_posts_search_vector ON posts USING GIN (search_vector);
+
+-- post_cards 複製的 search_vector 一併更新
+UPDATE post_cards c SET search_vector = p.search_vector
+FROM posts p
+WHERE p.id = c.id AND c.search_vector IS DISTINCT FROM p.search_vector;
@@ -0,0 +1,84 @@
+import os
+import atexit
+import threading
+from dotenv import load_dotenv
+from db_handler import DBHandler, PARTITIONED_TABLES
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+# 預先建立未來幾個月的分區
+PARTITION_MONTHS_AHEAD = int(os.getenv('PARTITION_MONTHS_AHEAD', 3))
+# 各資料表保留幾個月 (0 = 永久保留)
+USER_LOGS_RETENTION_MONTHS = int(os.getenv('USER_LOGS_RETENTION_MONTHS', 12))
+BULLETIN_RETENTION_MONTHS = int(os.getenv('BULLETIN_RETENTION_MONTHS', 0))
+# 過期分區的處理方式：detach = 移出成獨立資料表 (可另行備份後刪除)；drop = 直接刪除
+PARTITION_RETENTION_MODE = os.getenv('PARTITION_RETENTION_MODE', 'detach')
+# 背景維護的間隔秒數 (0 = 不啟動，例如改由 cron 執行 python migrate.py --partitions)
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv('PARTITION_MAINTENANCE_INTERVAL', 86400))
+
+RETENTION_MONTHS = {
+    'user_logs': USER_LOGS_RETENTION_MONTHS,
+    'bulletin_messages': BULLETIN_RETENTION_MONTHS,
+}
+
+
+class PartitionMaintainer:
+    """
+    user_logs / bulletin_messages 的月份分區維護：
+    預先建立之後幾個月的分區，並把超過保留期限的分區整個移出或刪除 (不需 DELETE + VACUUM)。
+    啟動時先執行一次，之後每隔 interval 秒執行；伺服器只在第 0 號 worker 啟動 (見 wsgi.on_startup)，
+    與 cron 的 migrate.py --partitions 同時執行時以 advisory lock 依序進行。
+    """
+
+    def __init__(self, interval=PARTITION_MAINTENANCE_INTERVAL, months_ahead=PARTITION_MONTHS_AHEAD,
+                 retention=None, mode=PARTITION_RETENTION_MODE):
+        if mode not in ('detach', 'drop'):
+            raise ValueError("PARTITION_RETENTION_MODE 必須是 detach 或 drop")
+        self.interval = interval
+        self.months_ahead = months_ahead
+        self.retention = retention if retention is not None else dict(RETENTION_MONTHS)
+        self.mode = mode
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """啟動背景維護執行緒 (重複呼叫不會建立多個)。"""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='partition-maintainer', daemon=True)
+            self._thread.start()
+
+    def run(self):
+        """執行一次維護，回傳 {資料表: {'created': [...], 'expired': [...]}}"""
+        result = {}
+        try:
+            with DBHandler() as db:
+                for table in PARTITIONED_TABLES:
+                    created = db.ensure_partitions(table, self.months_ahead) or []
+                    expired = []
+                    if self.retention.get(table, 0) > 0:
+                        expired = db.expire_partitions(table, self.retention[table], drop=self.mode == 'drop') or []
+                    result[table] = {'created': created, 'expired': expired}
+        except Exception as e:
+            print(f"維護資料表分區時發生錯誤: {e}")
+        return result
+
+    def _run(self):
+        self.run()
+        while not self._stop.wait(self.interval):
+            self.run()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+partition_maintainer = PartitionMaintainer()
+atexit.register(partition_maintainer.stop)
@@ -0,0 +1,230 @@
+import os
+import re
+import hmac
+import base64
+import hashlib
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+try:
+    import argon2
+    import argon2.low_level
+except ImportError:  # argon2-cffi 為選用套件
+    argon2 = None
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+# 新密碼使用的演算法：scrypt / pbkdf2_sha256 / argon2id
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'scrypt')
+PASSWORD_SCRYPT_N = int(os.getenv('PASSWORD_SCRYPT_N', 2 ** 14))
+PASSWORD_SCRYPT_R = int(os.getenv('PASSWORD_SCRYPT_R', 8))
+PASSWORD_SCRYPT_P = int(os.getenv('PASSWORD_SCRYPT_P', 1))
+PASSWORD_PBKDF2_ITERATIONS = int(os.getenv('PASSWORD_PBKDF2_ITERATIONS', 600000))
+PASSWORD_ARGON2_TIME_COST = int(os.getenv('PASSWORD_ARGON2_TIME_COST', 3))
+PASSWORD_ARGON2_MEMORY_COST = int(os.getenv('PASSWORD_ARGON2_MEMORY_COST', 65536))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.getenv('PASSWORD_ARGON2_PARALLELISM', 1))
+# 同時計算雜湊的執行緒數 (限制登入可佔用的 CPU)，以及排隊上限 (含計算中的請求，超過時直接拒絕)。
+# 等待雜湊的請求會佔住 waitress 的執行緒，排隊上限必須小於 WSGI_THREADS，其他 API 才一定有執行緒可用；
+# 未設定時預設為 workers + 2 (不超過 WSGI_THREADS - 1)
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv('PASSWORD_HASH_QUEUE_LIMIT')) if os.getenv('PASSWORD_HASH_QUEUE_LIMIT') else None
+WSGI_THREADS = int(os.getenv('WSGI_THREADS', 8))
+
+_LEGACY_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode().rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+class HasherBusy(Exception):
+    """雜湊排隊數超過上限"""
+
+
+class ScryptHasher:
+    """$scrypt$n=16384,r=8,p=1$<salt>$<hash>"""
+    name = 'scrypt'
+
+    def __init__(self, n=PASSWORD_SCRYPT_N, r=PASSWORD_SCRYPT_R, p=PASSWORD_SCRYPT_P):
+        self.params = {'n': n, 'r': r, 'p': p}
+
+    def _derive(self, password, salt, n, r, p):
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p + 1024 * 1024, dklen=32)
+
+    def hash(self, password):
+        salt = secrets.token_bytes(16)
+        digest = self._derive(password, salt, **self.params)
+        params = ','.join(f'{k}={v}' for k, v in self.params.items())
+        return f"${self.name}${params}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def _parse(self, encoded):
+        _, _, params, salt, digest = encoded.split('$')
+        params = {k: int(v) for k, v in (item.split('=') for item in params.split(','))}
+        return params, _b64decode(salt), _b64decode(digest)
+
+    def verify(self, password, encoded):
+        params, salt, digest = self._parse(encoded)
+        return hmac.compare_digest(self._derive(password, salt, **params), digest)
+
+    def needs_rehash(self, encoded):
+        return self._parse(encoded)[0] != self.params
+
+
+class PBKDF2Hasher:
+    """$pbkdf2-sha256$i=600000$<salt>$<hash>"""
+    name = 'pbkdf2-sha256'
+
+    def __init__(self, iterations=PASSWORD_PBKDF2_ITERATIONS):
+        self.iterations = iterations
+
+    def hash(self, password):
+        salt = secrets.token_bytes(16)
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, self.iterations)
+        return f"${self.name}$i={self.iterations}${_b64encode(salt)}${_b64encode(digest)}"
+
+    def _parse(self, encoded):
+        _, _, params, salt, digest = encoded.split('$')
+        return int(params.split('=')[1]), _b64decode(salt), _b64decode(digest)
+
+    def verify(self, password, encoded):
+        iterations, salt, digest = self._parse(encoded)
+        return hmac.compare_digest(hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations), digest)
+
+    def needs_rehash(self, encoded):
+        return self._parse(encoded)[0] != self.iterations
+
+
+class Argon2Hasher:
+    """argon2-cffi 的標準格式 $argon2id$v=19$m=65536,t=3,p=1$<salt>$<hash>"""
+    name = 'argon2id'
+
+    def __init__(self, time_cost=PASSWORD_ARGON2_TIME_COST, memory_cost=PASSWORD_ARGON2_MEMORY_COST,
+                 parallelism=PASSWORD_ARGON2_PARALLELISM):
+        if argon2 is None:
+            raise RuntimeError("PASSWORD_HASHER=argon2id 需要安裝 argon2-cffi")
+        self._hasher = argon2.PasswordHasher(time_cost=time_cost, memory_cost=memory_cost,
+                                             parallelism=parallelism, type=argon2.low_level.Type.ID)
+
+    def hash(self, password):
+        return self._hasher.hash(password)
+
+    def verify(self, password, encoded):
+        try:
+            return self._hasher.verify(encoded, password)
+        except argon2.exceptions.VerifyMismatchError:
+            return False
+
+    def needs_rehash(self, encoded):
+        return self._hasher.check_needs_rehash(encoded)
+
+
+HASHERS = {
+    'scrypt': ScryptHasher,
+    'pbkdf2_sha256': PBKDF2Hasher,
+    'argon2id': Argon2Hasher,
+}
+
+
+class PasswordHasher:
+    """
+    密碼雜湊：新密碼以設定的演算法與成本參數雜湊 (含隨機 salt)；
+    驗證時依雜湊字串前綴選擇演算法，也接受舊版無 salt 的 SHA-256，登入成功後由呼叫端以 needs_rehash 判斷是否升級。
+    雜湊在有上限的執行緒池中計算 (hashlib / argon2 計算時會釋放 GIL)，
+    登入暴增時排隊數 (小於 server_threads) 超過上限直接拋出 HasherBusy，不會佔滿 waitress 的所有執行緒。
+    """
+
+    def __init__(self, algorithm=PASSWORD_HASHER, workers=PASSWORD_HASH_WORKERS, queue_limit=PASSWORD_HASH_QUEUE_LIMIT,
+                 server_threads=WSGI_THREADS, **params):
+        if algorithm not in HASHERS:
+            raise ValueError(f"PASSWORD_HASHER 不支援: {algorithm}")
+        if queue_limit is None:
+            queue_limit = max(1, min(workers + 2, server_threads - 1))
+        elif workers > 0 and queue_limit >= server_threads:
+            raise ValueError(f"PASSWORD_HASH_QUEUE_LIMIT ({queue_limit}) 必須小於 WSGI_THREADS ({server_threads})")
+        self.algorithm = algorithm
+        self.hasher = HASHERS[algorithm](**params)
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hasher') if workers > 0 else None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._dummy_hash = None
+        self._stats = {'hashed': 0, 'verified': 0, 'rejected': 0}
+
+    def _hasher_for(self, encoded):
+        if encoded.startswith('$scrypt$'):
+            return self.hasher if isinstance(self.hasher, ScryptHasher) else ScryptHasher()
+        if encoded.startswith('$pbkdf2-sha256$'):
+            return self.hasher if isinstance(self.hasher, PBKDF2Hasher) else PBKDF2Hasher()
+        if encoded.startswith('$argon2'):
+            return self.hasher if isinstance(self.hasher, Argon2Hasher) else Argon2Hasher()
+        return None
+
+    def _run(self, fn, *args):
+        if self._executor is None:
+            return fn(*args)
+        with self._lock:
+            if self._pending >= self.queue_limit:
+                self._stats['rejected'] += 1
+                raise HasherBusy("登入請求過多，請稍後再試")
+            self._pending += 1
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def hash(self, password):
+        self._stats['hashed'] += 1
+        return self._run(self.hasher.hash, password)
+
+    def _verify(self, password, encoded):
+        if encoded is None:
+            # 帳號不存在時仍計算一次雜湊，讓回應時間與密碼錯誤相同，無法藉此猜測帳號是否存在
+            if self._dummy_hash is None:
+                self._dummy_hash = self.hasher.hash(secrets.token_hex(16))
+            self.hasher.verify(password, self._dummy_hash)
+            return False
+        if _LEGACY_SHA256.match(encoded):
+            return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), encoded)
+        hasher = self._hasher_for(encoded)
+        if hasher is None:
+            return False
+        try:
+            return hasher.verify(password, encoded)
+        except (ValueError, TypeError):
+            return False
+
+    def verify(self, password, encoded):
+        """驗證密碼 (固定時間比較)；encoded 為 None 表示帳號不存在，仍會花費相同的時間"""
+        self._stats['verified'] += 1
+        return self._run(self._verify, password, encoded)
+
+    def needs_rehash(self, encoded):
+        """舊版 SHA-256、不同演算法或成本參數與目前設定不同時回傳 True"""
+        hasher = self._hasher_for(encoded)
+        if hasher is None or hasher.name != self.hasher.name:
+            return True
+        try:
+            return self.hasher.needs_rehash(encoded)
+        except (ValueError, TypeError):
+            return True
+
+    def stop(self):
+        """等待進行中的雜湊完成後關閉執行緒池 (關機時呼叫)"""
+        if self._executor:
+            self._executor.shutdown(wait=True)
+
+    def stats(self):
+        result = dict(self._stats)
+        result['pending'] = self._pending
+        return result
+
+
+password_hasher = PasswordHasher()
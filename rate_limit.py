@@ -0,0 +1,226 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, jsonify, make_response
+from dotenv import load_dotenv
+
+try:
+    import redis
+except ImportError:  # redis 為選用套件，只有設定 RATE_LIMIT_REDIS_URL 時才需要
+    redis = None
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+# 每個 IP：最多連續 burst 次登入嘗試，之後每秒補充 rate 次
+LOGIN_IP_BURST = float(os.getenv('LOGIN_IP_BURST', 20))
+LOGIN_IP_RATE = float(os.getenv('LOGIN_IP_RATE', 0.2))
+# 每個帳號：只有登入失敗才消耗，最多連續失敗 burst 次，之後每秒補充 rate 次；登入成功時重設
+LOGIN_ACCOUNT_BURST = float(os.getenv('LOGIN_ACCOUNT_BURST', 5))
+LOGIN_ACCOUNT_RATE = float(os.getenv('LOGIN_ACCOUNT_RATE', 1 / 60))
+# 記憶體中最多保留幾個 bucket / 計數器 (超過時淘汰最久未使用的)
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))
+# 多個 worker 程序共用的 bucket (例如 redis://localhost:6379/0)；未設定時每個程序各自計算
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL')
+# 前面有幾層反向代理 (nginx)；> 0 時從 X-Forwarded-For 取得用戶端 IP
+RATE_LIMIT_PROXY_COUNT = int(os.getenv('RATE_LIMIT_PROXY_COUNT', 0))
+
+
+class MemoryBackend:
+    """程序內的 token bucket，{key: (tokens, 更新時間)}"""
+
+    def __init__(self, maxsize=RATE_LIMIT_MAX_KEYS):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        """
+        補充 token 後扣除 cost 個；cost=0 只檢查是否還有 token (不建立 bucket)。
+        回傳 (是否允許, 需要等待的秒數)。
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            need = max(cost, 1)
+            allowed = tokens >= need
+            if allowed:
+                tokens -= cost
+            if cost > 0 or key in self._buckets:
+                self._buckets[key] = (tokens, now)
+                self._buckets.move_to_end(key)
+                while len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (need - tokens) / rate
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+class RedisBackend:
+    """
+    多程序共用的 token bucket，以 Lua script 在 redis 中原子地補充與扣除。
+    redis 無法連線時改用程序內的 bucket (仍有限制，只是不跨程序)。
+    """
+
+    _SCRIPT = """
+    local rate, burst, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+    local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(data[1]) or burst
+    local ts = tonumber(data[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local need = math.max(cost, 1)
+    local allowed = 0
+    if tokens >= need then
+        allowed = 1
+        tokens = tokens - cost
+    end
+    if cost > 0 or data[1] then
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+        redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000))
+    end
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url, prefix='ratelimit:', fallback=None):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_REDIS_URL 需要安裝 redis 套件")
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self._take = self._client.register_script(self._SCRIPT)
+        self.prefix = prefix
+        self.fallback = fallback or MemoryBackend()
+
+    def take(self, key, rate, burst, cost=1):
+        try:
+            allowed, tokens = self._take(keys=[self.prefix + key], args=[rate, burst, cost, time.time()])
+        except redis.RedisError as e:
+            print(f"限流 redis 連線錯誤，改用程序內計數: {e}")
+            return self.fallback.take(key, rate, burst, cost)
+        tokens = float(tokens)
+        return bool(allowed), 0.0 if allowed else (max(cost, 1) - tokens) / rate
+
+    def reset(self, key):
+        try:
+            self._client.delete(self.prefix + key)
+        except redis.RedisError as e:
+            print(f"限流 redis 連線錯誤: {e}")
+        self.fallback.reset(key)
+
+
+def client_ip():
+    """用戶端 IP；RATE_LIMIT_PROXY_COUNT > 0 時取 X-Forwarded-For 中由最後一層代理加入的位址"""
+    if RATE_LIMIT_PROXY_COUNT > 0:
+        route = request.access_route
+        if len(route) >= RATE_LIMIT_PROXY_COUNT:
+            return route[-RATE_LIMIT_PROXY_COUNT]
+    return request.remote_addr
+
+
+class LoginLimiter:
+    """
+    登入限流：
+      - 每個 IP 一個 bucket，每次嘗試都消耗 (擋下單一來源的大量嘗試)
+      - 每個帳號一個 bucket，只有失敗才消耗、成功時重設 (擋下分散 IP 針對同一帳號的猜測，也不會鎖住正常登入的使用者)
+    檢查在呼叫 view 之前完成，被拒絕的請求不會查詢資料庫也不會計算密碼雜湊。
+    """
+
+    def __init__(self, backend=None, ip_rate=LOGIN_IP_RATE, ip_burst=LOGIN_IP_BURST,
+                 account_rate=LOGIN_ACCOUNT_RATE, account_burst=LOGIN_ACCOUNT_BURST, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.backend = backend or MemoryBackend(max_keys)
+        self.ip_rate, self.ip_burst = ip_rate, ip_burst
+        self.account_rate, self.account_burst = account_rate, account_burst
+        self.max_keys = max_keys
+        self._counters = OrderedDict()
+        self._lock = threading.Lock()
+        self._totals = {'allowed': 0, 'rejected_ip': 0, 'rejected_account': 0, 'failures': 0, 'successes': 0}
+
+    def _count(self, key, total, field):
+        """累加該 key 的 field 計數，以及總計 total (None 表示不計入總計)"""
+        with self._lock:
+            if total:
+                self._totals[total] += 1
+            counters = self._counters.get(key)
+            if counters is None:
+                counters = self._counters[key] = {'allowed': 0, 'rejected': 0, 'failures': 0}
+                while len(self._counters) > self.max_keys:
+                    self._counters.popitem(last=False)
+            else:
+                self._counters.move_to_end(key)
+            counters[field] += 1
+
+    def check(self, ip, account):
+        """回傳 (是否允許, 等待秒數, 被擋下的範圍 'ip' / 'account' / None)"""
+        ip_key = f"ip:{ip}"
+        allowed, retry_after = self.backend.take(ip_key, self.ip_rate, self.ip_burst)
+        if not allowed:
+            self._count(ip_key, 'rejected_ip', 'rejected')
+            return False, retry_after, 'ip'
+        if account:
+            account_key = f"account:{account}"
+            allowed, retry_after = self.backend.take(account_key, self.account_rate, self.account_burst, cost=0)
+            if not allowed:
+                self._count(account_key, 'rejected_account', 'rejected')
+                return False, retry_after, 'account'
+        self._count(ip_key, 'allowed', 'allowed')
+        return True, 0.0, None
+
+    def record_failure(self, ip, account):
+        self._count(f"ip:{ip}", 'failures', 'failures')
+        if account:
+            account_key = f"account:{account}"
+            self.backend.take(account_key, self.account_rate, self.account_burst)
+            self._count(account_key, None, 'failures')
+
+    def record_success(self, ip, account):
+        with self._lock:
+            self._totals['successes'] += 1
+        if account:
+            self.backend.reset(f"account:{account}")
+
+    def limit(self, account_field='account'):
+        """
+        套用在登入路由上的 decorator：view 回傳 401 視為失敗、200 視為成功，
+        被限流時回傳 429 與 Retry-After。
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                ip = client_ip()
+                data = request.get_json(silent=True) or {}
+                account = str(data.get(account_field) or '').strip().lower() or None
+                allowed, retry_after, scope = self.check(ip, account)
+                if not allowed:
+                    message = '此帳號登入失敗次數過多，請稍後再試' if scope == 'account' else '登入嘗試過於頻繁，請稍後再試'
+                    response = jsonify({'status': 429, 'message': message, 'success': False})
+                    return response, 429, {'Retry-After': str(max(1, int(retry_after + 0.999)))}
+
+                response = make_response(f(*args, **kwargs))
+                if response.status_code == 401:
+                    self.record_failure(ip, account)
+                elif response.status_code == 200:
+                    self.record_success(ip, account)
+                return response
+            return decorated_function
+        return decorator
+
+    def stats(self, top=20):
+        """總計與被拒絕/失敗次數最多的前 top 個 key"""
+        with self._lock:
+            totals = dict(self._totals)
+            keys = sorted(self._counters.items(), key=lambda item: item[1]['rejected'] + item[1]['failures'], reverse=True)
+            top_keys = [{'key': key, **counters} for key, counters in keys[:top] if counters['rejected'] or counters['failures']]
+        totals['tracked_keys'] = len(self._counters)
+        return {'totals': totals, 'top_keys': top_keys}
+
+
+def _create_backend():
+    if RATE_LIMIT_REDIS_URL:
+        return RedisBackend(RATE_LIMIT_REDIS_URL)
+    return MemoryBackend()
+
+
+login_limiter = LoginLimiter(_create_backend())
@@ -0,0 +1,32 @@
+import argparse
+import sys
+from upload_store import reconcile, UPLOAD_ORPHAN_GRACE
+
+# 上傳檔案對帳 (建議以 cron 每天執行)
+#   python reconcile_uploads.py                 只列出孤兒檔案 / 孤兒資料列 / 逾期的可續傳上傳
+#   python reconcile_uploads.py --apply         刪除孤兒檔案與逾期的可續傳上傳
+#   python reconcile_uploads.py --delete-rows   另外刪除指向不存在檔案的 files 資料列
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比對 uploads 資料夾與 files 資料表")
+    parser.add_argument('--apply', action='store_true', help="刪除沒有被引用的實體檔案與逾期的可續傳上傳")
+    parser.add_argument('--delete-rows', action='store_true', help="刪除指向不存在檔案的 files 資料列")
+    parser.add_argument('--grace', type=int, default=UPLOAD_ORPHAN_GRACE, help="只處理超過幾秒未修改的檔案")
+    args = parser.parse_args()
+
+    result = reconcile(apply=args.apply, delete_rows=args.delete_rows, grace=args.grace)
+    for path in result['orphan_blobs']:
+        print(f"孤兒檔案: {path}")
+    for row in result['orphan_rows']:
+        print(f"孤兒資料列: id={row['id']} file_path={row['file_path']}")
+    for path in result['stale_uploads']:
+        print(f"逾期的可續傳上傳: {path}")
+    action = "已刪除" if args.apply else "未刪除 (加上 --apply 執行)"
+    print(f"孤兒檔案 {len(result['orphan_blobs'])} 個、逾期上傳 {len(result['stale_uploads'])} 個 ({action})；"
+          f"孤兒資料列 {len(result['orphan_rows'])} 筆{' (已刪除)' if args.delete_rows else ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import os
+import atexit
+import secrets
+import threading
+from dotenv import load_dotenv
+from db_handler import DBHandler
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+# 每位使用者最多同時保留幾個有效的 refresh token (裝置數)，超過時撤銷最舊的
+REFRESH_TOKENS_PER_USER = int(os.getenv('REFRESH_TOKENS_PER_USER', 10))
+# 已撤銷 (輪替掉) 的 token 保留多久 (秒) 用來偵測重複使用
+REFRESH_REVOKED_RETENTION = int(os.getenv('REFRESH_REVOKED_RETENTION', 86400))
+# 背景清除過期 token 的間隔秒數與每批筆數 (間隔 0 = 不啟動，例如改由 cron 執行)
+REFRESH_REAP_INTERVAL = float(os.getenv('REFRESH_REAP_INTERVAL', 3600))
+REFRESH_REAP_BATCH = int(os.getenv('REFRESH_REAP_BATCH', 1000))
+
+
+def generate_refresh_token():
+    """產生 refresh token 明文 (只回傳給用戶端，資料庫保存其雜湊)"""
+    return secrets.token_urlsafe(32)
+
+
+class RefreshTokenReaper:
+    """
+    定期分批刪除過期與已撤銷超過保留期限的 refresh token，讓資料表維持在有效 token 的規模。
+    每批獨立提交，多個 worker 程序同時執行時以 SKIP LOCKED 互不阻塞。
+    """
+
+    def __init__(self, interval=REFRESH_REAP_INTERVAL, batch_size=REFRESH_REAP_BATCH,
+                 revoked_retention=REFRESH_REVOKED_RETENTION):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.revoked_retention = revoked_retention
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.deleted = 0
+
+    def start(self):
+        """啟動背景清除執行緒 (重複呼叫不會建立多個)。"""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='refresh-token-reaper', daemon=True)
+            self._thread.start()
+
+    def reap(self):
+        """清除所有符合條件的 token，回傳刪除筆數"""
+        total = 0
+        try:
+            with DBHandler() as db:
+                while not self._stop.is_set():
+                    deleted = db.reap_refresh_tokens(self.batch_size, self.revoked_retention)
+                    if not deleted:
+                        break
+                    total += deleted
+                    if deleted < self.batch_size:
+                        break
+        except Exception as e:
+            print(f"清除過期 Refresh Token 時發生錯誤: {e}")
+        self.deleted += total
+        return total
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.reap()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+refresh_token_reaper = RefreshTokenReaper()
+atexit.register(refresh_token_reaper.stop)
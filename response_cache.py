@@ -0,0 +1,81 @@
+import os
+import hashlib
+import threading
+from functools import wraps
+from flask import request, make_response, Response
+from dotenv import load_dotenv
+from cache import LRUCache
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+# 回應快取在本程序內的存活秒數 (多個 worker 程序時，其他程序的寫入最多延遲這麼久才會反映)
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 30))
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 1024))
+# 給瀏覽器/前端代理的 Cache-Control max-age 秒數 (過期後以 If-None-Match 重新驗證)
+RESPONSE_CACHE_MAX_AGE = int(os.getenv('RESPONSE_CACHE_MAX_AGE', 0))
+
+
+class ResponseCache:
+    """
+    公開 GET API 的回應快取。
+    以 (命名空間, 版本, 路徑, 排序後的 query 參數) 為 key 保存已序列化的 JSON 與強 ETag，
+    命中時不查資料庫也不重新 jsonify；請求帶 If-None-Match 且相符時直接回 304。
+    寫入路徑呼叫 invalidate(命名空間) 讓該命名空間的版本號 +1，舊的快取自然失效。
+    """
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, max_age=RESPONSE_CACHE_MAX_AGE):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.max_age = max_age
+
+    def _key(self, namespace):
+        args = tuple(sorted((k, tuple(v)) for k, v in request.args.lists()))
+        return (namespace, self._versions.get(namespace, 0), request.path, args)
+
+    def invalidate(self, *namespaces):
+        """讓指定命名空間的所有快取失效"""
+        with self._lock:
+            for namespace in namespaces:
+                self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def cached(self, namespace, max_age=None, on_serve=None):
+        """
+        裝飾器：只快取 GET 且狀態 200 的 JSON 回應，其他方法直接交給原本的函式。
+        on_serve(**view_args) 會在回應 200/304 時呼叫 (例如命中快取時仍要累計點擊數)。
+        """
+        max_age = self.max_age if max_age is None else max_age
+
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                if request.method != 'GET':
+                    return f(*args, **kwargs)
+
+                key = self._key(namespace)
+                entry = self._cache.get(key)
+                if entry is None:
+                    resp = make_response(f(*args, **kwargs))
+                    if resp.status_code != 200 or not resp.is_json:
+                        return resp
+                    body = resp.get_data()
+                    entry = (body, hashlib.sha256(body).hexdigest()[:32])
+                    self._cache.set(key, entry)
+
+                body, etag = entry
+                resp = Response(body, status=200, mimetype='application/json')
+                resp.set_etag(etag)
+                resp.headers['Cache-Control'] = f'public, max-age={max_age}, must-revalidate'
+                resp = resp.make_conditional(request)
+                if on_serve:
+                    on_serve(**kwargs)
+                return resp
+            return decorated_function
+        return decorator
+
+    def stats(self):
+        return self._cache.stats()
+
+
+response_cache = ResponseCache()
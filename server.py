@@ -0,0 +1,181 @@
+import os
+import time
+import signal
+import socket
+import logging
+import threading
+import _thread
+from waitress.server import create_server
+from dotenv import load_dotenv
+from db_pool import reset_pools_after_fork
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+logger = logging.getLogger('waitress')
+
+# WSGI 伺服器設定 (皆可由環境變數調整)
+SERVER_CONFIG = {
+    'host': os.getenv('WSGI_HOST', '127.0.0.1'),
+    'port': int(os.getenv('WSGI_PORT', 5004)),
+    'threads': int(os.getenv('WSGI_THREADS', 8)),                       # 每個程序同時處理的請求數
+    'connection_limit': int(os.getenv('WSGI_CONNECTION_LIMIT', 100)),   # 每個程序同時允許的 TCP 連線數
+    'backlog': int(os.getenv('WSGI_BACKLOG', 1024)),                    # 等待 accept 的連線佇列長度
+    'channel_timeout': int(os.getenv('WSGI_CHANNEL_TIMEOUT', 120)),     # 閒置連線逾時秒數
+}
+# 程序數：1 = 單一程序；> 1 = pre-fork，多個子程序共用同一個監聽 socket (僅支援 POSIX)
+WSGI_PROCESSES = int(os.getenv('WSGI_PROCESSES', 1))
+# 收到 SIGTERM/SIGINT 後，最多等待進行中的請求完成多少秒
+WSGI_SHUTDOWN_TIMEOUT = float(os.getenv('WSGI_SHUTDOWN_TIMEOUT', 30))
+
+
+def create_listen_socket(host, port, backlog):
+    """建立監聽 socket；pre-fork 模式下由父程序建立後交給所有子程序共用。"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+
+def _socket_map(server):
+    # 單一 socket 時 create_server 回傳 TcpWSGIServer (_map)，多個 socket 時為 MultiSocketServer (map)
+    return getattr(server, 'map', None) or server._map
+
+
+def _is_drained(server):
+    """沒有執行中/排隊中的請求，且所有連線的回應都已送出"""
+    dispatcher = server.task_dispatcher
+    if dispatcher.active_count > 0 or dispatcher.queue:
+        return False
+    for channel in list(_socket_map(server).values()):
+        if getattr(channel, 'requests', None) or getattr(channel, 'total_outbufs_len', 0) > 0:
+            return False
+    return True
+
+
+def _drain(server, timeout, drained):
+    """停止接受新連線，等進行中的請求完成 (或逾時) 後中斷主迴圈。"""
+    for obj in list(_socket_map(server).values()):
+        if hasattr(obj, 'accept_connections'):
+            obj.accepting = False
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and not _is_drained(server):
+        time.sleep(0.1)
+    if not _is_drained(server):
+        logger.warning(f"等待請求完成逾時 ({timeout}s)，強制關閉")
+    # 在主執行緒觸發訊號處理函式並拋出 KeyboardInterrupt，
+    # waitress 的 run() 收到後會關閉 worker 執行緒與所有連線
+    drained.set()
+    _thread.interrupt_main()
+
+
+def run_server(app, sockets, config=None, shutdown_timeout=WSGI_SHUTDOWN_TIMEOUT):
+    """在目前程序中以既有的 socket 執行 waitress，收到 SIGTERM/SIGINT 時優雅關閉。"""
+    config = config or SERVER_CONFIG
+    server = create_server(
+        app,
+        sockets=sockets,
+        threads=config['threads'],
+        connection_limit=config['connection_limit'],
+        backlog=config['backlog'],
+        channel_timeout=config['channel_timeout'],
+    )
+    draining = threading.Event()
+    drained = threading.Event()
+
+    def on_signal(signum, frame):
+        if drained.is_set():
+            raise KeyboardInterrupt
+        if draining.is_set():
+            return
+        draining.set()
+        logger.info(f"[{os.getpid()}] 收到停止訊號，等待進行中的請求完成...")
+        threading.Thread(target=_drain, args=(server, shutdown_timeout, drained), daemon=True).start()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    server.run()
+    logger.info(f"[{os.getpid()}] 伺服器已停止")
+
+
+def serve(app, config=None, processes=WSGI_PROCESSES, on_startup=None, on_shutdown=None):
+    """
+    啟動伺服器。processes > 1 時以 pre-fork 模式執行：
+    父程序建立監聽 socket 後 fork 出子程序，由核心在子程序間分配連線；
+    父程序只負責轉送停止訊號，並在子程序意外結束時重新啟動，本身不連線資料庫、不執行背景工作。
+    on_startup: 每個處理請求的程序開始服務前呼叫 on_startup(worker_index) (例如啟動背景執行緒)；
+                worker_index 為 0 ~ processes - 1，重新啟動的 worker 沿用原本的編號。
+    on_shutdown: 每個處理請求的程序結束前呼叫 (例如寫回點擊數、關閉連線池)。
+    """
+    config = config or SERVER_CONFIG
+    sock = create_listen_socket(config['host'], config['port'], config['backlog'])
+    logger.info(f"Serving on http://{config['host']}:{config['port']} "
+                f"(processes={processes}, threads={config['threads']})")
+
+    if processes <= 1 or not hasattr(os, 'fork'):
+        if processes > 1:
+            logger.warning("此平台不支援 fork，改以單一程序執行")
+        try:
+            if on_startup:
+                on_startup(0)
+            run_server(app, [sock], config)
+        finally:
+            if on_shutdown:
+                on_shutdown()
+            sock.close()
+        return
+
+    children = {}   # pid -> worker_index
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            # 子程序：恢復預設訊號處理後開始服務，結束時不回到父程序的程式流程
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # 不沿用父程序的連線 (也不關閉它們)，由子程序自行連線
+            reset_pools_after_fork()
+            code = 0
+            try:
+                if on_startup:
+                    on_startup(index)
+                run_server(app, [sock], config)
+            except Exception:
+                logger.exception("worker 發生未預期的錯誤")
+                code = 1
+            finally:
+                if on_shutdown:
+                    on_shutdown()
+                logging.shutdown()
+            os._exit(code)
+        children[pid] = index
+
+    def on_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for index in range(processes):
+        spawn(index)
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if not stopping and index is not None:
+            logger.warning(f"worker {pid} 結束 (status={status})，1 秒後重新啟動")
+            time.sleep(1)
+            spawn(index)
+    sock.close()
+    logger.info("所有 worker 已停止")
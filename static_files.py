@@ -0,0 +1,114 @@
+import os
+import mimetypes
+from flask import request, send_file, Response
+from dotenv import load_dotenv
+from cache import LRUCache
+from db_handler import DBHandler
+from upload_store import full_path, relative_path
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+# 檔案資訊 (路徑、檔名、雜湊) 快取筆數與存活秒數；其他程序刪除檔案時最多延遲這麼久才會反映
+FILE_META_CACHE_SIZE = int(os.getenv('FILE_META_CACHE_SIZE', 10000))
+FILE_META_CACHE_TTL = float(os.getenv('FILE_META_CACHE_TTL', 300))
+# 不存在的 file_id 也短暫快取，避免被反覆請求時每次都查資料庫
+FILE_META_NEGATIVE_TTL = float(os.getenv('FILE_META_NEGATIVE_TTL', 30))
+# 上傳的檔案內容不會改變 (同一個 file_id 永遠是同一份內容)，預設快取一年
+FILE_CACHE_MAX_AGE = int(os.getenv('FILE_CACHE_MAX_AGE', 365 * 24 * 3600))
+# direct: 由 Python 送出檔案；x-accel: 交給 nginx (X-Accel-Redirect)；x-sendfile: 交給 Apache/lighttpd (X-Sendfile)
+FILE_SERVE_MODE = os.getenv('FILE_SERVE_MODE', 'direct').lower()
+# x-accel 模式下 nginx 對應 UPLOAD_FOLDER 的 internal location
+FILE_ACCEL_PREFIX = os.getenv('FILE_ACCEL_PREFIX', '/protected-uploads/')
+
+_NOT_FOUND = False
+
+
+class StaticFiles:
+    """
+    /uplo/<file_id> 的檔案服務。
+    檔案資訊以 file_id 為 key 放在 LRU 快取中，命中時完全不查資料庫；
+    回應帶有 ETag (內容 SHA-256)、Last-Modified 與 immutable 的 Cache-Control，
+    並支援 Range (大型附件續傳/影音拖曳) 與 If-None-Match / If-Modified-Since (304)。
+    """
+
+    def __init__(self, maxsize=FILE_META_CACHE_SIZE, ttl=FILE_META_CACHE_TTL, mode=FILE_SERVE_MODE):
+        if mode not in ('direct', 'x-accel', 'x-sendfile'):
+            raise ValueError(f"FILE_SERVE_MODE 不支援: {mode}")
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.mode = mode
+
+    def get_meta(self, file_id):
+        meta = self._cache.get(file_id)
+        if meta is None:
+            with DBHandler() as db:
+                file = db.get_file(file_id)
+            if not file:
+                self._cache.set(file_id, _NOT_FOUND, ttl=FILE_META_NEGATIVE_TTL)
+                return None
+            meta = {
+                'path': full_path(file['file_path']),
+                'relative_path': relative_path(file['file_path']),
+                'original_filename': file['original_filename'],
+                # 內容定址的實體檔案沒有副檔名，Content-Type 依原始檔名判斷
+                'mimetype': mimetypes.guess_type(file['original_filename'] or '')[0] or 'application/octet-stream',
+                'etag': file.get('sha256'),
+                'renditions': file.get('renditions') or {},
+            }
+            self._cache.set(file_id, meta)
+        return meta or None
+
+    def invalidate(self, file_id):
+        self._cache.pop(file_id)
+
+    def _cache_headers(self, resp, meta):
+        resp.headers['Cache-Control'] = f'public, max-age={FILE_CACHE_MAX_AGE}, immutable'
+        if meta['etag']:
+            resp.set_etag(meta['etag'])
+        return resp
+
+    def send(self, file_id, rendition=None):
+        """回傳檔案 (或指定衍生圖，例如 thumb / medium_webp) 的回應；找不到時回傳 None"""
+        meta = self.get_meta(file_id)
+        if meta is None:
+            return None
+        if rendition:
+            item = meta['renditions'].get(rendition)
+            if not item:
+                return None
+            meta = {
+                'path': full_path(item['path']),
+                'relative_path': relative_path(item['path']),
+                'mimetype': mimetypes.guess_type(item['path'])[0] or 'application/octet-stream',
+                'etag': f"{meta['etag']}-{rendition}" if meta['etag'] else None,
+            }
+
+        if self.mode == 'x-accel':
+            # 只回傳標頭，由 nginx 讀檔並處理 Range，Python worker 不接觸檔案內容
+            if meta['etag'] and meta['etag'] in request.if_none_match:
+                return self._cache_headers(Response(status=304), meta)
+            resp = Response(mimetype=meta['mimetype'])
+            resp.headers['X-Accel-Redirect'] = FILE_ACCEL_PREFIX.rstrip('/') + '/' + meta['relative_path']
+            return self._cache_headers(resp, meta)
+
+        try:
+            # conditional=True：處理 Range (206)、If-None-Match / If-Modified-Since (304)，
+            # 並透過 wsgi.file_wrapper 送出檔案 (x-sendfile 模式由 app.config['USE_X_SENDFILE'] 改為只送標頭)
+            resp = send_file(
+                meta['path'],
+                mimetype=meta['mimetype'],
+                conditional=True,
+                etag=meta['etag'] or True,
+                max_age=FILE_CACHE_MAX_AGE,
+            )
+        except (FileNotFoundError, NotADirectoryError):
+            self.invalidate(file_id)
+            return None
+        resp.headers['Cache-Control'] = f'public, max-age={FILE_CACHE_MAX_AGE}, immutable'
+        return resp
+
+    def stats(self):
+        return self._cache.stats()
+
+
+static_files = StaticFiles()
@@ -0,0 +1,525 @@
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import tempfile
+import threading
+import contextlib
+from flask import Request
+from werkzeug.utils import secure_filename
+from dotenv import load_dotenv
+from db_handler import DBHandler
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，只能在程序內互斥 (也不支援 pre-fork)
+    fcntl = None
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', './uploads/')
+FILE_TYPES = ('files', 'images', 'attachments')
+# 從請求讀取/寫入硬碟的區塊大小
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 1024 * 1024))
+# 分段上傳 (可續傳) 時單一檔案的大小上限
+UPLOAD_MAX_SIZE = int(os.getenv('UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024))
+
+# 檔案保留多久 (秒) 之後，對帳工作才會把未被引用的檔案、暫存檔與未完成的上傳視為孤兒
+UPLOAD_ORPHAN_GRACE = int(os.getenv('UPLOAD_ORPHAN_GRACE', 24 * 3600))
+
+PARTIAL_DIR = '.partial'
+BLOB_DIR = 'blobs'
+TEMP_PREFIX = '.upload-'
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+def resolve_file_type(file_type):
+    """檢查 file_type，只允許既有的三個子資料夾，避免路徑穿越"""
+    file_type = file_type or 'files'
+    if file_type not in FILE_TYPES:
+        raise ValueError(f"file_type 必須是 {', '.join(FILE_TYPES)} 之一")
+    return file_type
+
+
+def ensure_folders():
+    for file_type in FILE_TYPES:
+        os.makedirs(os.path.join(UPLOAD_FOLDER, file_type, PARTIAL_DIR), exist_ok=True)
+    os.makedirs(os.path.join(UPLOAD_FOLDER, BLOB_DIR), exist_ok=True)
+
+
+def blob_path(sha256):
+    """內容定址的儲存路徑 (相對於 UPLOAD_FOLDER)，相同內容只存一份"""
+    return f"{BLOB_DIR}/{sha256[:2]}/{sha256}"
+
+
+def relative_path(file_path):
+    """files.file_path 轉成相對於 UPLOAD_FOLDER 的路徑 (舊資料可能存成 ./uploads/... )"""
+    path = os.path.normpath(file_path).replace("\\", "/")
+    root = os.path.normpath(UPLOAD_FOLDER).replace("\\", "/") + '/'
+    return path[len(root):] if path.startswith(root) else path
+
+
+def full_path(file_path):
+    return os.path.join(UPLOAD_FOLDER, relative_path(file_path))
+
+
+class HashingFile:
+    """
+    寫入時同步計算大小與 SHA-256 的暫存檔。
+    暫存檔建立在 uploads/blobs/ 內，完成後以 os.replace 改名即可，不需要再複製一次。
+    """
+
+    def __init__(self, folder):
+        self._file = tempfile.NamedTemporaryFile(dir=folder, prefix=TEMP_PREFIX, delete=False)
+        self.name = self._file.name
+        self.size = 0
+        self.committed = False
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self._hash.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name):
+        # read / seek / tell / flush / close 等交給底層檔案
+        return getattr(self._file, name)
+
+    def detach(self):
+        """關閉暫存檔並交給呼叫端處理 (之後請求結束時不會被刪除)，回傳暫存檔路徑"""
+        self._file.close()
+        self.committed = True
+        return self.name
+
+    def discard(self):
+        if self.committed:
+            return
+        self._file.close()
+        try:
+            os.remove(self.name)
+        except FileNotFoundError:
+            pass
+
+
+class StreamingUploadRequest(Request):
+    """
+    讓 multipart 解析器把每個檔案區塊直接寫進 uploads/blobs/ 下的 HashingFile，
+    取代 Werkzeug 預設的 SpooledTemporaryFile + file.save() 複製，記憶體用量與檔案大小無關。
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        # 暫存檔放在 blobs/ 下，與最終位置同一個檔案系統，改名不需複製
+        return HashingFile(os.path.join(UPLOAD_FOLDER, BLOB_DIR))
+
+    def close(self):
+        # 請求結束時刪除沒有被 store_uploaded_file 採用的暫存檔 (驗證失敗、發生錯誤等)
+        if 'files' in self.__dict__:
+            discard_uploaded_files(self.files.values())
+        super().close()
+
+
+def store_uploaded_file(storage, file_type):
+    """
+    取得已串流寫入暫存檔的 FileStorage 的大小與 SHA-256，回傳待 save_uploads 寫入的紀錄。
+    """
+    record = {
+        'original_filename': secure_filename(storage.filename or '') or 'file',
+        'file_type': file_type,
+    }
+    stream = storage.stream
+    if isinstance(stream, HashingFile):
+        record.update(temp_path=stream.detach(), file_size=stream.size, sha256=stream.hexdigest())
+        return record
+
+    # 非串流路徑 (例如測試或其他 request class)：分段複製並計算雜湊
+    out = HashingFile(os.path.join(UPLOAD_FOLDER, BLOB_DIR))
+    try:
+        for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_SIZE), b''):
+            out.write(chunk)
+    except Exception:
+        out.discard()
+        raise
+    record.update(temp_path=out.detach(), file_size=out.size, sha256=out.hexdigest())
+    return record
+
+
+def discard_uploaded_files(storages):
+    """刪除尚未交給 save_uploads 的暫存檔"""
+    for storage in storages:
+        if isinstance(storage.stream, HashingFile):
+            storage.stream.discard()
+
+
+def discard_records(records):
+    """寫入失敗時刪除還沒放到正式位置的暫存檔 (已放好的內容檔交給對帳工作處理)"""
+    for record in records:
+        temp_path = record.pop('temp_path', None)
+        if temp_path:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+
+
+def _lookup_blobs(db, shas):
+    # 依 sha256 排序後取得 advisory lock，避免與同內容的上傳/刪除互相競爭，也避免死結
+    if not db.lock_blobs(sorted(shas)):
+        raise RuntimeError("取得檔案鎖失敗")
+    existing = db.find_blobs(list(shas))
+    if existing is None:
+        raise RuntimeError("查詢既有檔案失敗")
+    return existing
+
+
+def save_uploads(records):
+    """
+    以內容 (SHA-256) 去重後寫入 files：
+    已存在相同內容時直接引用既有檔案並刪除暫存檔，否則把暫存檔改名到 blobs/<sha 前兩碼>/<sha>。
+    所有紀錄在同一個交易中以單一 INSERT 寫入，回傳 file_id 列表。
+    """
+    if not records:
+        return []
+    with DBHandler() as db:
+        try:
+            existing = _lookup_blobs(db, {r['sha256'] for r in records})
+            for record in records:
+                sha256 = record['sha256']
+                found = existing.get(sha256)
+                temp_path = record.pop('temp_path')
+                if found and os.path.exists(full_path(found['file_path'])):
+                    os.remove(temp_path)
+                    record['file_path'] = found['file_path']
+                    record['renditions'] = found.get('renditions')
+                    record['deduplicated'] = True
+                else:
+                    # 第一次出現的內容；或資料列還在但檔案遺失 (以這次的內容補回)
+                    path = found['file_path'] if found else blob_path(sha256)
+                    os.makedirs(os.path.dirname(full_path(path)), exist_ok=True)
+                    os.replace(temp_path, full_path(path))
+                    record['file_path'] = path
+                    record['deduplicated'] = False
+                    existing[sha256] = {'file_path': path, 'file_size': record['file_size'], 'renditions': None}
+        except Exception:
+            db.conn.rollback()
+            raise
+        file_ids = db.upload_files(records)
+    if file_ids is None:
+        raise RuntimeError("寫入檔案紀錄失敗")
+    return file_ids
+
+
+def link_existing_blob(sha256, file_type, original_filename):
+    """
+    若已有相同內容的檔案，直接新增一筆引用它的 files 紀錄並回傳 (file_id, record)；
+    沒有則回傳 None (用戶端需要實際上傳)。
+    """
+    if not re.fullmatch(r'[0-9a-f]{64}', sha256 or ''):
+        raise ValueError("sha256 格式錯誤")
+    with DBHandler() as db:
+        try:
+            found = _lookup_blobs(db, {sha256}).get(sha256)
+            if not found or not os.path.exists(full_path(found['file_path'])):
+                db.conn.rollback()
+                return None
+        except Exception:
+            db.conn.rollback()
+            raise
+        record = {
+            'file_path': found['file_path'],
+            'original_filename': secure_filename(original_filename or '') or 'file',
+            'file_type': file_type,
+            'file_size': found['file_size'],
+            'sha256': sha256,
+            # 沿用既有檔案已產生的衍生圖；尚未產生時由呼叫端送進 rendition_queue
+            'renditions': found.get('renditions'),
+            'deduplicated': True,
+        }
+        file_ids = db.upload_files([record])
+    if not file_ids:
+        raise RuntimeError("寫入檔案紀錄失敗")
+    return file_ids[0], record
+
+
+def delete_file(file_id):
+    """刪除一筆檔案紀錄；只有最後一個引用被刪除時才刪除實體檔案"""
+    def release_blob(file_path):
+        try:
+            os.remove(full_path(file_path))
+        except FileNotFoundError:
+            pass
+    with DBHandler() as db:
+        return db.delete_file(file_id, release_blob=release_blob)
+
+
+# --- 對帳 ---
+def _disk_files():
+    """列出 UPLOAD_FOLDER 下所有檔案 {相對路徑: mtime}，不含可續傳上傳的 .partial 資料夾"""
+    result = {}
+    for top in FILE_TYPES + (BLOB_DIR,):
+        for dirpath, dirnames, filenames in os.walk(os.path.join(UPLOAD_FOLDER, top)):
+            if PARTIAL_DIR in dirnames:
+                dirnames.remove(PARTIAL_DIR)
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    result[relative_path(path)] = os.path.getmtime(path)
+                except FileNotFoundError:
+                    pass
+    return result
+
+
+def _release_orphan(db, path, cutoff):
+    """
+    刪除一個孤兒檔案。上面的掃描與刪除之間，同內容的上傳可能已把新檔案放到同一路徑並寫入資料列，
+    因此在該內容的 advisory lock 下重新確認沒有引用、檔案也不是剛寫入的才刪除。
+    """
+    name = os.path.basename(path)
+    sha256 = name if path.startswith(f"{BLOB_DIR}/") and re.fullmatch(r'[0-9a-f]{64}', name) else None
+
+    def release_blob():
+        try:
+            if os.path.getmtime(full_path(path)) >= cutoff:
+                return False
+            os.remove(full_path(path))
+        except FileNotFoundError:
+            return False
+        return True
+
+    # 資料列中的路徑可能是相對路徑或含 UPLOAD_FOLDER 的舊格式
+    candidates = {path, full_path(path), os.path.normpath(full_path(path)).replace("\\", "/")}
+    return db.release_orphan_file(sha256 or path, candidates, release_blob, sha256=sha256)
+
+
+def reconcile(apply=False, delete_rows=False, grace=UPLOAD_ORPHAN_GRACE):
+    """
+    比對硬碟與 files 資料表：
+      orphan_blobs:    硬碟上沒有任何資料列引用的檔案 (含殘留的上傳暫存檔)
+      orphan_rows:     資料列指向的檔案不存在
+      stale_uploads:   超過 grace 秒沒有進度的可續傳上傳
+    apply=True 時刪除 orphan_blobs 與 stale_uploads；delete_rows=True 時另外刪除 orphan_rows。
+    只處理超過 grace 秒的檔案，避免誤刪正在上傳、尚未寫入資料庫的內容。
+    """
+    cutoff = time.time() - grace
+    disk = _disk_files()
+    referenced = set()
+    orphan_rows = []
+    with DBHandler() as db:
+        for file_id, file_path in db.iter_file_paths():
+            path = relative_path(file_path)
+            referenced.add(path)
+            if path not in disk:
+                orphan_rows.append({'id': file_id, 'file_path': file_path})
+
+    orphan_blobs = sorted(path for path, mtime in disk.items() if path not in referenced and mtime < cutoff)
+    stale_uploads = []
+    for file_type in FILE_TYPES:
+        folder = os.path.join(UPLOAD_FOLDER, file_type, PARTIAL_DIR)
+        for name in os.listdir(folder) if os.path.isdir(folder) else []:
+            path = os.path.join(folder, name)
+            if os.path.getmtime(path) < cutoff:
+                stale_uploads.append(relative_path(path))
+
+    if apply:
+        if orphan_blobs:
+            with DBHandler() as db:
+                for path in orphan_blobs:
+                    _release_orphan(db, path, cutoff)
+        for path in stale_uploads:
+            try:
+                os.remove(full_path(path))
+            except FileNotFoundError:
+                pass
+    if delete_rows and orphan_rows:
+        with DBHandler() as db:
+            db.delete_files([row['id'] for row in orphan_rows])
+    return {'orphan_blobs': orphan_blobs, 'orphan_rows': orphan_rows, 'stale_uploads': stale_uploads}
+
+
+# --- 分段 / 可續傳上傳 ---
+class ResumableUploads:
+    """
+    可續傳上傳：
+      1. create() 建立上傳工作，回傳 upload_id
+      2. 用 Content-Range: bytes <start>-<end>/<total> 依序送出各段，write_chunk() 直接附加到 .part 檔
+      3. 中斷後以 status() 取得已收到的位元組數，從該位置繼續
+      4. 收齊後 complete() 改名到正式位置並回傳 files 資料列所需欄位
+    進度只保存在硬碟上 (.part + .json)，因此任何一個 worker 程序都能接續；
+    同程序內保留 hash 狀態，避免完成時重新讀取整個檔案。
+    同一個上傳工作同時只允許一個請求寫入或完成 (以 .json 檔的 flock 跨程序互斥)。
+    """
+
+    def __init__(self):
+        self._hashes = {}
+        self._busy = set()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _session_lock(self, upload_id, meta_path):
+        """取得上傳工作的鎖；已有其他請求持有時拋出 ValueError (不等待，避免佔住 waitress 的執行緒)"""
+        with self._lock:
+            if upload_id in self._busy:
+                raise ValueError("此上傳工作正由其他請求寫入中")
+            self._busy.add(upload_id)
+        try:
+            try:
+                f = open(meta_path, 'rb')
+            except FileNotFoundError:
+                raise LookupError("找不到上傳工作") from None
+            with f:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        raise ValueError("此上傳工作正由其他請求寫入中") from None
+                yield
+        finally:
+            with self._lock:
+                self._busy.discard(upload_id)
+
+    def _paths(self, file_type, upload_id):
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id or ''):
+            raise ValueError("無效的 upload_id")
+        base = os.path.join(UPLOAD_FOLDER, file_type, PARTIAL_DIR, upload_id)
+        return base + '.part', base + '.json'
+
+    def _load(self, file_type, upload_id):
+        part_path, meta_path = self._paths(file_type, upload_id)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None, part_path, meta_path
+        meta['offset'] = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        return meta, part_path, meta_path
+
+    def create(self, file_type, original_filename, total_size, user_id=None):
+        file_type = resolve_file_type(file_type)
+        if total_size is None or total_size < 0:
+            raise ValueError("必須提供檔案大小 size")
+        if total_size > UPLOAD_MAX_SIZE:
+            raise ValueError(f"檔案超過大小上限 {UPLOAD_MAX_SIZE} bytes")
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = self._paths(file_type, upload_id)
+        meta = {
+            'upload_id': upload_id,
+            'file_type': file_type,
+            'original_filename': secure_filename(original_filename or '') or 'file',
+            'size': total_size,
+            'user_id': user_id,
+        }
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        with self._lock:
+            self._hashes[upload_id] = (0, hashlib.sha256())
+        meta['offset'] = 0
+        return meta
+
+    def status(self, file_type, upload_id):
+        meta, _, _ = self._load(resolve_file_type(file_type), upload_id)
+        return meta
+
+    def write_chunk(self, file_type, upload_id, content_range, stream):
+        """
+        寫入一段資料。content_range 的起點必須等於目前已收到的位元組數，
+        否則拋出 ValueError (呼叫端應以 status() 的 offset 重新送出)。
+        回傳更新後的 meta。
+        """
+        file_type = resolve_file_type(file_type)
+        _, meta_path = self._paths(file_type, upload_id)
+        # offset 檢查與附加寫入必須在同一個鎖內，否則兩個並行的 PUT 會都通過檢查並重複附加
+        with self._session_lock(upload_id, meta_path):
+            return self._write_chunk(file_type, upload_id, content_range, stream)
+
+    def _write_chunk(self, file_type, upload_id, content_range, stream):
+        meta, part_path, _ = self._load(file_type, upload_id)
+        if meta is None:
+            raise LookupError("找不到上傳工作")
+        match = _CONTENT_RANGE.match(content_range or '')
+        if not match:
+            raise ValueError("Content-Range 格式應為 bytes <start>-<end>/<total>")
+        start, end, total = (int(x) for x in match.groups())
+        if total != meta['size'] or end < start or end >= total:
+            raise ValueError("Content-Range 與上傳工作的檔案大小不符")
+        if start != meta['offset']:
+            raise ValueError(f"offset 不符，目前已收到 {meta['offset']} bytes")
+
+        with self._lock:
+            offset, digest = self._hashes.pop(upload_id, (None, None))
+        if offset != start:
+            digest = None  # 其他程序寫過或重新啟動過，完成時再重新計算
+
+        expected = end - start + 1
+        received = 0
+        with open(part_path, 'ab') as out:
+            while received < expected:
+                chunk = stream.read(min(UPLOAD_CHUNK_SIZE, expected - received))
+                if not chunk:
+                    break
+                out.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+                received += len(chunk)
+            if received != expected:
+                # 連線中斷：截斷回這一段開始前的位置，讓用戶端從 offset 重送
+                out.truncate(start)
+                raise ValueError(f"資料長度不符，目前已收到 {start} bytes")
+
+        meta['offset'] = start + received
+        if digest is not None:
+            with self._lock:
+                self._hashes[upload_id] = (meta['offset'], digest)
+        return meta
+
+    def complete(self, file_type, upload_id):
+        """收齊後回傳待 save_uploads 寫入的紀錄 (.part 檔即為暫存檔)"""
+        file_type = resolve_file_type(file_type)
+        _, meta_path = self._paths(file_type, upload_id)
+        with self._session_lock(upload_id, meta_path):
+            return self._complete(file_type, upload_id)
+
+    def _complete(self, file_type, upload_id):
+        meta, part_path, meta_path = self._load(file_type, upload_id)
+        if meta is None:
+            raise LookupError("找不到上傳工作")
+        if meta['offset'] != meta['size']:
+            raise ValueError(f"檔案尚未上傳完成 ({meta['offset']}/{meta['size']} bytes)")
+
+        with self._lock:
+            offset, digest = self._hashes.pop(upload_id, (None, None))
+        if offset != meta['size']:
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+
+        os.remove(meta_path)
+        return {
+            'original_filename': meta['original_filename'],
+            'file_type': file_type,
+            'temp_path': part_path,
+            'file_size': meta['size'],
+            'sha256': digest.hexdigest(),
+        }
+
+    def abort(self, file_type, upload_id):
+        file_type = resolve_file_type(file_type)
+        part_path, meta_path = self._paths(file_type, upload_id)
+        with self._lock:
+            self._hashes.pop(upload_id, None)
+        found = os.path.exists(meta_path)
+        for path in (part_path, meta_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return found
+
+
+resumable_uploads = ResumableUploads()
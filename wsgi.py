@@ -1,12 +1,19 @@
-from waitress import serve
 from app import app
+from server import serve, SERVER_CONFIG
+from click_counter import click_counter
+from category_cache import category_cache, CATEGORY_LISTEN
+from log_writer import log_writer
+from image_renditions import rendition_queue
+from refresh_tokens import refresh_token_reaper
+from passwords import password_hasher
+from partitions import partition_maintainer
+from db_pool import close_all_pools
 import logging
 import time
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger('waitress')
-logger.info("Starting server on http://127.0.0.1:5004")
 
 # 自訂 WSGI middleware，用來紀錄請求時間與資訊
 class RequestLoggerMiddleware:
@@ -30,12 +37,29 @@ class RequestLoggerMiddleware:
 # 包裝 middleware
 logged_app = RequestLoggerMiddleware(app)
 
+
+def on_startup(worker_index):
+    """每個 worker 程序開始服務前：啟動背景執行緒 (不在 import 時啟動，pre-fork 的父程序與縮圖子程序都不會執行)"""
+    if CATEGORY_LISTEN:
+        category_cache.start_listener()
+    refresh_token_reaper.start()
+    if worker_index == 0:
+        # 分區 DDL 只需一個程序執行，避免每個 worker 啟動時都搶 ATTACH/DETACH 的鎖
+        partition_maintainer.start()
+
+
+def on_shutdown():
+    """每個 worker 程序結束前：寫回尚未寫入的點擊數與日誌，並關閉連線池"""
+    click_counter.stop()
+    log_writer.stop()
+    rendition_queue.stop()
+    refresh_token_reaper.stop()
+    partition_maintainer.stop()
+    password_hasher.stop()
+    close_all_pools()
+
+
 if __name__ == "__main__":
-    serve(
-        logged_app,
-        host="127.0.0.1",
-        port=5004,
-        threads=2,              # 同時處理 2 個請求
-        connection_limit=100,   # 同時允許 100 個 TCP 連線
-        backlog=120             # 等待處理的連線佇列長度
-    )
+    # 執行緒數、連線上限、backlog、程序數等設定見 server.py (WSGI_* 環境變數)
+    logger.info(f"Starting server on http://{SERVER_CONFIG['host']}:{SERVER_CONFIG['port']}")
+    serve(logged_app, on_startup=on_startup, on_shutdown=on_shutdown)